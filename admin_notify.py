@@ -0,0 +1,74 @@
+"""Уведомления администратора о новых анкетах
+
+Отправка анкеты в той же транзакции добавляет задание в outbox (получатель
+OUTBOX_ADMIN) со временем выполнения в конце текущего интервала
+ADMIN_DIGEST_INTERVAL. Все анкеты, отправленные за интервал, диспетчер
+outbox забирает одной пачкой, и администратор получает одно сообщение со
+списком кандидатов и ссылками на их профили. Кандидат подтверждения не ждет:
+уведомление отправляется в фоне.
+"""
+import html
+import logging
+from typing import Any, Dict, List
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+from config import ADMIN_CHAT_ID, ADMIN_DIGEST_MAX_FORMS
+from database import OUTBOX_ADMIN, get_forms_by_ids
+from outbox import OutboxDispatcher, OutboxEntry, RetryLater
+
+logger = logging.getLogger(__name__)
+
+
+def format_candidate(form: Dict[str, Any]) -> str:
+    """Строка сводки о кандидате: ФИО со ссылкой на профиль, гражданство, город, телефон"""
+    form_data = form["form_data"]
+    pd = form_data.get("personal_data", {})
+    name = " ".join(filter(None, (pd.get("surname"), pd.get("name"), pd.get("patronymic"))))
+    details = [
+        form_data.get("citizenship_type", ""),
+        form_data.get("readiness", {}).get("city", ""),
+        form_data.get("contacts", {}).get("phone", ""),
+    ]
+    user_id = form["user_id"]
+    link = f'<a href="tg://user?id={user_id}">{html.escape(name or f"ID {user_id}")}</a>'
+    details = ", ".join(html.escape(str(value)) for value in details if value)
+    return f"{link} — {details}" if details else link
+
+
+def format_digest(forms: List[Dict[str, Any]]) -> str:
+    """Текст сводки для администратора"""
+    lines = [f"🆕 Новые анкеты: {len(forms)}", ""]
+    lines += [f"{number}. {format_candidate(form)}" for number, form in enumerate(forms, start=1)]
+    return "\n".join(lines)
+
+
+def register_admin_notifications(dispatcher: OutboxDispatcher, bot: Bot):
+    """Подключает уведомления администратора к диспетчеру outbox"""
+    if not ADMIN_CHAT_ID:
+        logger.warning("ADMIN_ID не установлен, уведомления о новых анкетах отключены")
+        return
+
+    async def send_digest(entries: List[OutboxEntry]):
+        """Отправляет одну сводку по пачке заданий outbox"""
+        # Повторная отправка одной анкеты в интервале попадает в сводку один раз
+        forms = await get_forms_by_ids(sorted({entry.ref for entry in entries}))
+        if not forms:
+            return
+        try:
+            await bot.send_message(ADMIN_CHAT_ID, format_digest(forms), parse_mode="HTML",
+                                   disable_web_page_preview=True)
+        except TelegramRetryAfter as e:
+            raise RetryLater(f"Telegram просит подождать {e.retry_after} с", e.retry_after) from e
+        except (TelegramNetworkError, TelegramServerError) as e:
+            raise RetryLater(f"Telegram недоступен ({e})") from e
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Повтор не поможет (например, администратор не запускал бота) — сводку пропускаем
+            logger.error(f"Не удалось отправить сводку о {len(forms)} анкетах в чат {ADMIN_CHAT_ID}: {e}")
+            return
+        logger.info(f"Администратору отправлена сводка: {len(forms)} анкет(ы)")
+
+    dispatcher.register(OUTBOX_ADMIN, send_digest, ADMIN_DIGEST_MAX_FORMS)
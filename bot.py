@@ -1,15 +1,26 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN
+from aiogram import Dispatcher
+from config import BOT_MODE, BOT_WORKERS, WORKER_BASE_PORT, WORKER_ID, WORKERS_OUTBOX_POLL_INTERVAL
 from handlers import register_handlers
-from database import init_database
+from database import init_database, close_database
+from form_buffer import form_buffer
+from form_cache import form_cache
+from outbox import outbox
+from sheets_export import register_sheets_export
+from admin_notify import register_admin_notifications
+from fsm_storage import SQLiteStorage, UserEventIsolation
+from bot_session import create_bot
+from broadcast import broadcaster
+from send_scheduler import send_scheduler
+from webhook import run_webhook
+from workers import WORKER_HOST, run_router
 
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - ' + (f'w{WORKER_ID} - ' if WORKER_ID is not None else '') +
+           '%(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(),  # Вывод в консоль
         logging.FileHandler('bot.log', encoding='utf-8')  # Вывод в файл
@@ -19,20 +30,61 @@ logger = logging.getLogger(__name__)
 
 
 async def main():
+    # Несколько процессов: этот процесс только распределяет обновления
+    if BOT_WORKERS > 1 and WORKER_ID is None:
+        await run_router()
+        return
+
     # Инициализация базы данных
     init_database()
     logger.info("База данных инициализирована")
     
     # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    bot = create_bot()
+    storage = SQLiteStorage()
+    # Обновления одного пользователя обрабатываются по очереди
+    dp = Dispatcher(storage=storage, events_isolation=UserEventIsolation())
     
     # Регистрация обработчиков
     register_handlers(dp)
     
     # Запуск бота
+    form_buffer.start()
+    storage.start()
+    # Выгрузку в Google Sheets и сводки администратору выполняет один процесс (см. workers.py)
+    if WORKER_ID is None or WORKER_ID == 0:
+        register_sheets_export(outbox)
+        register_admin_notifications(outbox, bot)
+    if WORKER_ID is not None:
+        outbox.poll_interval = min(outbox.poll_interval, WORKERS_OUTBOX_POLL_INTERVAL)
+    outbox.start()
+    broadcaster.start(bot)
     logger.info("Бот запущен")
-    await dp.start_polling(bot)
+    try:
+        if WORKER_ID is not None:
+            await run_webhook(dp, bot, WORKER_HOST, WORKER_BASE_PORT + WORKER_ID, register=False)
+        elif BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # getUpdates не работает, пока установлен вебхук
+            await bot.delete_webhook()
+            # Сессию бота закрываем сами — после остановки рассылок и outbox
+            await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        await broadcaster.stop()
+        await storage.close()
+        logger.info(f"Сессии FSM: {storage.stats()}")
+        await form_buffer.stop()
+        logger.info(f"Буфер анкет сброшен (записей: {form_buffer.flushed_forms}, транзакций: {form_buffer.flushes})")
+        logger.info(f"Кэш анкет: {form_cache.stats()}")
+        await outbox.stop()
+        logger.info(f"Outbox остановлен (доставлено: {outbox.delivered}, пачек: {outbox.batches}, "
+                    f"ошибок: {outbox.failed}, исчерпали попытки: {outbox.abandoned})")
+        logger.info(f"Исходящие сообщения: {send_scheduler.stats()}")
+        # Сообщения больше не отправляются: закрываем сессию бота последней
+        await bot.session.close()
+        close_database()
+        logger.info("Соединения с базой данных закрыты")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""HTTP-сессия Bot API
+
+Запросы к API (ответы пользователям) и скачивание файлов идут через разные
+пулы соединений: крупные документы, которые пользователи присылают в анкете,
+не занимают соединения, нужные для ответов. Размеры пулов, keep-alive, кэш
+DNS и таймауты задаются в config.py; одновременных скачиваний не больше
+BOT_DOWNLOAD_POOL_SIZE, остальные ждут очереди (время ожидания не входит в
+таймаут скачивания).
+
+Сообщения отправляются через планировщик send_scheduler (лимиты Telegram
+на частоту сообщений).
+"""
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from config import (
+    BOT_TOKEN, BOT_API_POOL_SIZE, BOT_API_POOL_PER_HOST, BOT_API_KEEPALIVE, BOT_API_DNS_TTL, BOT_API_TIMEOUT,
+    BOT_DOWNLOAD_POOL_SIZE, BOT_DOWNLOAD_TIMEOUT
+)
+from send_scheduler import send_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class BotSession(AiohttpSession):
+    """Сессия aiogram с настроенным пулом для API и отдельным пулом для скачивания файлов"""
+
+    def __init__(self, pool_size: int = BOT_API_POOL_SIZE, pool_per_host: int = BOT_API_POOL_PER_HOST,
+                 keepalive: float = BOT_API_KEEPALIVE, dns_ttl: int = BOT_API_DNS_TTL,
+                 timeout: float = BOT_API_TIMEOUT, download_pool_size: int = BOT_DOWNLOAD_POOL_SIZE,
+                 download_timeout: float = BOT_DOWNLOAD_TIMEOUT, **kwargs: Any):
+        super().__init__(limit=pool_size, timeout=timeout, **kwargs)
+        self._connector_init.update(
+            limit_per_host=pool_per_host,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+        )
+        # Сессии еще нет: сброс соединений при первом запросе (он вызывает close())
+        # не нужен и закрыл бы уже начатые скачивания
+        self._should_reset_connector = False
+        self.download_pool_size = download_pool_size
+        self.download_timeout = download_timeout
+        self._download_session: Optional[ClientSession] = None
+        self._download_slots = asyncio.Semaphore(download_pool_size)
+
+    def _connector(self, limit: int) -> TCPConnector:
+        return TCPConnector(**dict(self._connector_init, limit=limit, limit_per_host=limit))
+
+    async def create_download_session(self) -> ClientSession:
+        if self._download_session is None or self._download_session.closed:
+            self._download_session = ClientSession(connector=self._connector(self.download_pool_size))
+        return self._download_session
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        """Скачивает файл через отдельный пул (используется Bot.download_file)"""
+        session = await self.create_download_session()
+        async with self._download_slots:
+            async with session.get(url, headers=headers or {}, raise_for_status=raise_for_status,
+                                   timeout=ClientTimeout(total=max(timeout, self.download_timeout))) as response:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
+
+    async def close(self):
+        if self._download_session is not None and not self._download_session.closed:
+            await self._download_session.close()
+        await super().close()
+
+
+def create_bot() -> Bot:
+    """Бот с настроенной HTTP-сессией и планировщиком исходящих сообщений"""
+    session = BotSession()
+    session.middleware(send_scheduler)
+    return Bot(token=BOT_TOKEN, session=session)
@@ -0,0 +1,249 @@
+"""Рассылки администратора кандидатам
+
+Рассылка создается командой /broadcast (handlers/admin.py) и после
+подтверждения выполняется в фоне. Получатели выбираются из forms по
+индексированным условиям (RECIPIENT_FILTERS) и читаются страницами по ID
+анкеты. После каждой страницы в таблицу broadcasts записываются счетчики и
+ID последней анкеты, поэтому после падения или перезапуска рассылка
+продолжается с этого места (повторно может уйти не больше одной страницы).
+
+Сообщения отправляются через планировщик send_scheduler с приоритетом
+массовой рассылки: ответы пользователям, заполняющим анкету, уходят раньше.
+"""
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from config import BROADCAST_PAGE_SIZE, BROADCAST_LEASE, BROADCAST_POLL_INTERVAL
+from database import (
+    BROADCAST_PENDING, BROADCAST_RUNNING, BROADCAST_DONE, BROADCAST_CANCELLED, claim_broadcast, get_broadcast, get_broadcast_recipients, checkpoint_broadcast,
+    finish_broadcast, release_broadcast
+)
+from form_fields import normalize_city, normalize_phone
+from send_scheduler import bulk_sending
+
+logger = logging.getLogger(__name__)
+
+# Результаты отправки одному получателю
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+STATUSES = {"submitted": "отправившие анкету", "draft": "не отправившие анкету"}
+BROADCAST_STATUSES = {
+    BROADCAST_PENDING: "ждет подтверждения",
+    BROADCAST_RUNNING: "идет",
+    BROADCAST_DONE: "завершена",
+    BROADCAST_CANCELLED: "отменена",
+}
+# Значения citizenship_type в анкете (handlers/form_steps.parse_citizenship_type)
+CITIZENSHIPS = {"ru": "Россия", "foreign": "Иностранец"}
+
+
+def _parse_date(name: str, value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name}: дата в формате ГГГГ-ММ-ДД") from None
+
+
+def parse_filters(args: str) -> Dict[str, Any]:
+    """Разбирает фильтры вида status=submitted citizenship=ru city=Москва ready=2026-11 progress=50.
+
+    Бросает ValueError с текстом для администратора.
+    """
+    filters = {}
+    for token in args.split():
+        name, _, value = token.partition("=")
+        if not value:
+            raise ValueError(f"Фильтр {token!r} должен иметь вид имя=значение")
+        if name == "status":
+            if value not in STATUSES:
+                raise ValueError(f"status: {' или '.join(STATUSES)}")
+            filters["status"] = value
+        elif name == "citizenship":
+            if value not in CITIZENSHIPS:
+                raise ValueError(f"citizenship: {' или '.join(CITIZENSHIPS)}")
+            filters["citizenship"] = CITIZENSHIPS[value]
+        elif name == "city":
+            # Пробелы в названии города — через подчеркивание: city=Нижний_Новгород
+            filters["city"] = normalize_city(value.replace("_", " "))
+        elif name == "phone":
+            filters["phone"] = normalize_phone(value)
+        elif name == "progress":
+            if not value.isdigit() or int(value) > 100:
+                raise ValueError("progress: процент заполнения от 0 до 100")
+            filters["min_completion"] = int(value)
+        elif name == "ready":
+            # Месяц начала вахты: ready=2026-11
+            first_day = _parse_date(name, value + "-01")
+            filters["ready_from"] = first_day.isoformat()
+            filters["ready_to"] = (first_day + timedelta(days=32)).replace(day=1).isoformat()
+        elif name in ("ready_from", "ready_to", "from", "to"):
+            day = _parse_date(name, value)
+            # Конечные даты включительно: граница — начало следующего дня
+            if name.endswith("to"):
+                day += timedelta(days=1)
+            filters["date_" + name if name in ("from", "to") else name] = day.isoformat()
+        else:
+            raise ValueError(f"Неизвестный фильтр {name!r}")
+    return filters
+
+
+def _last_day(value: str) -> str:
+    return (date.fromisoformat(value) - timedelta(days=1)).isoformat()
+
+
+def describe_filters(filters: Dict[str, Any]) -> str:
+    """Фильтры рассылки для сообщений администратору"""
+    parts = []
+    if "status" in filters:
+        parts.append(STATUSES[filters["status"]])
+    if "citizenship" in filters:
+        parts.append(f"гражданство: {filters['citizenship']}")
+    if "city" in filters:
+        parts.append(f"город: {filters['city']}")
+    if "phone" in filters:
+        parts.append(f"телефон: {filters['phone']}")
+    if "min_completion" in filters:
+        parts.append(f"заполнено от {filters['min_completion']}%")
+    if "ready_from" in filters:
+        parts.append(f"готовы начать с {filters['ready_from']}")
+    if "ready_to" in filters:
+        parts.append(f"готовы начать по {_last_day(filters['ready_to'])}")
+    if "date_from" in filters:
+        parts.append(f"изменены с {filters['date_from']}")
+    if "date_to" in filters:
+        parts.append(f"изменены по {_last_day(filters['date_to'])}")
+    return ", ".join(parts) or "все анкеты"
+
+
+def format_progress(broadcast: Dict[str, Any]) -> str:
+    """Состояние рассылки одной строкой"""
+    return (f"Рассылка №{broadcast['id']} ({BROADCAST_STATUSES[broadcast['status']]}): получателей {broadcast['total']}, "
+            f"доставлено {broadcast['delivered']}, заблокировали бота {broadcast['blocked']}, "
+            f"ошибок {broadcast['failed']}")
+
+
+class Broadcaster:
+    """Фоновая задача, выполняющая подтвержденные рассылки"""
+
+    def __init__(self, page_size: int, lease: float, poll_interval: float):
+        self.page_size = page_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+        self._broadcast_id: Optional[int] = None
+        self.sent = 0
+
+    def wake(self):
+        """Сообщает о запущенной рассылке"""
+        self._wakeup.set()
+
+    def start(self, bot: Bot):
+        """Запускает выполнение рассылок (в том числе прерванных перезапуском)"""
+        if self._task is None:
+            self._bot = bot
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._run(), name="broadcast")
+
+    async def stop(self):
+        """Останавливает рассылки, дождавшись отправки текущей страницы"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._current is not None:
+            await asyncio.wait([self._current])
+            self._current = None
+        if self._broadcast_id is not None:
+            # Прерванную рассылку после перезапуска можно продолжить, не дожидаясь конца аренды
+            await release_broadcast(self._broadcast_id)
+            self._broadcast_id = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while (broadcast := await claim_broadcast(self.lease)) is not None:
+                    self._broadcast_id = broadcast["id"]
+                    await self._execute(broadcast)
+                    self._broadcast_id = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Рассылка останется в аренде и продолжится после ее истечения
+                logger.error(f"Рассылка: ошибка выполнения: {e}", exc_info=True)
+                self._broadcast_id = None
+
+    async def _execute(self, broadcast: Dict[str, Any]):
+        broadcast_id = broadcast["id"]
+        last_form_id = broadcast["last_form_id"]
+        logger.info(f"Рассылка №{broadcast_id}: {'продолжение' if last_form_id else 'начало'}, "
+                    f"получателей {broadcast['total']}")
+        while True:
+            recipients = await get_broadcast_recipients(broadcast["filters"], last_form_id,
+                                                        broadcast["max_form_id"], self.page_size)
+            if not recipients:
+                break
+            # Отмена задачи не прерывает страницу: отправленное должно попасть в точку продолжения
+            self._current = asyncio.create_task(self._send_page(broadcast, recipients))
+            status = await asyncio.shield(self._current)
+            self._current = None
+            last_form_id = recipients[-1][0]
+            if status != BROADCAST_RUNNING:
+                logger.info(f"Рассылка №{broadcast_id} остановлена (статус {status})")
+                return
+        if await finish_broadcast(broadcast_id):
+            await self._report(broadcast_id)
+
+    async def _send_page(self, broadcast: Dict[str, Any], recipients: list) -> Optional[str]:
+        """Отправляет страницу и сохраняет точку продолжения. Возвращает статус рассылки"""
+        with bulk_sending():
+            results = await asyncio.gather(*(self._send(user_id, broadcast["text"]) for _, user_id in recipients))
+        counts = {DELIVERED: 0, BLOCKED: 0, FAILED: 0}
+        for result in results:
+            counts[result] += 1
+        self.sent += counts[DELIVERED]
+        return await checkpoint_broadcast(broadcast["id"], recipients[-1][0], counts[DELIVERED], counts[BLOCKED],
+                                          counts[FAILED], self.lease)
+
+    async def _send(self, user_id: int, text: str) -> str:
+        try:
+            await self._bot.send_message(user_id, text, parse_mode="HTML")
+            return DELIVERED
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота или удалил аккаунт
+            return BLOCKED
+        except TelegramBadRequest as e:
+            logger.warning(f"Рассылка: пользователю {user_id} не отправлено: {e}")
+            return FAILED
+        except Exception as e:
+            logger.error(f"Рассылка: ошибка отправки пользователю {user_id}: {e}")
+            return FAILED
+
+    async def _report(self, broadcast_id: int):
+        """Отправляет итог рассылки администратору, который ее запустил"""
+        broadcast = await get_broadcast(broadcast_id)
+        logger.info(format_progress(broadcast))
+        try:
+            await self._bot.send_message(broadcast["admin_chat_id"], "✅ " + format_progress(broadcast))
+        except Exception as e:
+            logger.error(f"Рассылка №{broadcast_id}: не удалось отправить отчет: {e}")
+
+
+broadcaster = Broadcaster(BROADCAST_PAGE_SIZE, BROADCAST_LEASE, BROADCAST_POLL_INTERVAL)
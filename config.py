@@ -6,6 +6,63 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 ADMIN_ID = os.getenv("ADMIN_ID", "")
 
+# Получение обновлений: polling (long polling) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Вебхук: публичный адрес (https://bot.example.com) и путь, адрес локального
+# сервера за reverse proxy и секрет заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Сколько соединений Telegram открывает к вебхуку (1-100) и сколько
+# обновлений обрабатывается одновременно
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "100"))
+
+# HTTP-сессия Bot API: соединений всего и на один хост (0 — без ограничения),
+# сколько держать простаивающее соединение, кэш DNS и таймаут запроса, сек
+BOT_API_POOL_SIZE = int(os.getenv("BOT_API_POOL_SIZE", "100"))
+BOT_API_POOL_PER_HOST = int(os.getenv("BOT_API_POOL_PER_HOST", "0"))
+BOT_API_KEEPALIVE = int(os.getenv("BOT_API_KEEPALIVE", "60"))
+BOT_API_DNS_TTL = int(os.getenv("BOT_API_DNS_TTL", "3600"))
+BOT_API_TIMEOUT = int(os.getenv("BOT_API_TIMEOUT", "60"))
+# Скачивание файлов пользователей — отдельный пул: одновременных скачиваний и таймаут, сек
+BOT_DOWNLOAD_POOL_SIZE = int(os.getenv("BOT_DOWNLOAD_POOL_SIZE", "8"))
+BOT_DOWNLOAD_TIMEOUT = int(os.getenv("BOT_DOWNLOAD_TIMEOUT", "120"))
+
+# Исходящие сообщения: всего в секунду (Telegram допускает ~30; при нескольких
+# процессах делится между ними), в один чат в секунду и подряд, сколько раз
+# повторять запрос после TelegramRetryAfter
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Рассылки администратора: получателей на странице (точка продолжения
+# сохраняется после каждой), аренда рассылки процессом и интервал проверки новых, сек
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "100"))
+BROADCAST_LEASE = int(os.getenv("BROADCAST_LEASE", "120"))
+BROADCAST_POLL_INTERVAL = int(os.getenv("BROADCAST_POLL_INTERVAL", "30"))
+
+# Уведомления о новых анкетах: чат (по умолчанию ADMIN_ID, можно ID группы),
+# интервал сводки (анкеты, отправленные за интервал, приходят одним
+# сообщением; 0 — сразу), сек, и сколько анкет перечислять в одном сообщении
+ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID", ADMIN_ID).strip()
+ADMIN_DIGEST_INTERVAL = int(os.getenv("ADMIN_DIGEST_INTERVAL", "60"))
+ADMIN_DIGEST_MAX_FORMS = int(os.getenv("ADMIN_DIGEST_MAX_FORMS", "30"))
+
+# Несколько процессов-обработчиков (только с BOT_MODE=webhook): главный процесс
+# принимает вебхук и распределяет обновления по ID чата на порты
+# WORKER_BASE_PORT..WORKER_BASE_PORT+BOT_WORKERS-1 (127.0.0.1)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))
+# Номер процесса-обработчика (задает главный процесс, вручную не указывается)
+WORKER_ID = int(os.getenv("BOT_WORKER_ID")) if os.getenv("BOT_WORKER_ID") else None
+# Как часто обработчик 0 проверяет outbox: задания других процессов его не будят, сек
+WORKERS_OUTBOX_POLL_INTERVAL = int(os.getenv("WORKERS_OUTBOX_POLL_INTERVAL", "2"))
+
 # Google Sheets настройки
 GOOGLE_SHEETS_ID = os.getenv("GOOGLE_SHEETS_ID", "")
 
@@ -14,6 +71,43 @@ DATA_DIR = "data"
 PHOTOS_DIR = os.path.join(DATA_DIR, "photos")
 DOCUMENTS_DIR = os.path.join(DATA_DIR, "documents")
 
+# SQLite настройки
+DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "anketa.db"))
+DB_READER_THREADS = int(os.getenv("DB_READER_THREADS", "4"))
+
+# Отложенная запись промежуточных ответов анкеты
+FORM_FLUSH_INTERVAL_MS = int(os.getenv("FORM_FLUSH_INTERVAL_MS", "500"))
+FORM_FLUSH_MAX_USERS = int(os.getenv("FORM_FLUSH_MAX_USERS", "100"))
+
+# Кэш анкет в памяти
+FORM_CACHE_SIZE = int(os.getenv("FORM_CACHE_SIZE", "5000"))
+FORM_CACHE_TTL = int(os.getenv("FORM_CACHE_TTL", "1800"))
+
+# Хранилище состояний FSM
+FSM_FLUSH_INTERVAL_MS = int(os.getenv("FSM_FLUSH_INTERVAL_MS", "1000"))
+FSM_MAX_SESSIONS = int(os.getenv("FSM_MAX_SESSIONS", "10000"))
+FSM_IDLE_TTL = int(os.getenv("FSM_IDLE_TTL", "3600"))
+
+# Очередь доставки (outbox): аренда взятого задания, максимальный интервал
+# опроса и пауза перед повтором после ошибки (растет от MIN до MAX), сек
+OUTBOX_LEASE = int(os.getenv("OUTBOX_LEASE", "300"))
+OUTBOX_POLL_INTERVAL = int(os.getenv("OUTBOX_POLL_INTERVAL", "30"))
+OUTBOX_RETRY_MIN_DELAY = int(os.getenv("OUTBOX_RETRY_MIN_DELAY", "2"))
+OUTBOX_RETRY_MAX_DELAY = int(os.getenv("OUTBOX_RETRY_MAX_DELAY", "600"))
+# После стольких попыток задание с постоянной ошибкой (не RetryLater) больше не повторяется
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+# Выгрузка анкет в Google Sheets: число анкет в одном запросе
+SHEETS_EXPORT_PAGE_SIZE = int(os.getenv("SHEETS_EXPORT_PAGE_SIZE", "500"))
+
+# Квоты Google Sheets API: запросов в минуту на пользователя (сервисный аккаунт)
+# и на проект — отдельно для чтения и для записи
+SHEETS_QUOTA_PER_USER = int(os.getenv("SHEETS_QUOTA_PER_USER", "60"))
+SHEETS_QUOTA_PER_PROJECT = int(os.getenv("SHEETS_QUOTA_PER_PROJECT", "300"))
+
+# Как часто перечитывать колонку ID листа (на случай ручных правок таблицы), сек
+SHEETS_ROW_INDEX_TTL = int(os.getenv("SHEETS_ROW_INDEX_TTL", "600"))
+
 # Создаем папки если их нет
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(PHOTOS_DIR, exist_ok=True)
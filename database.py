@@ -1,21 +1,380 @@
-"""Модуль для работы с SQLite базой данных"""
+"""Модуль для работы с SQLite базой данных
+
+Все обращения к БД выполняются вне event loop: записи идут через
+единственный поток-писатель, чтения — через небольшой пул потоков.
+Каждый поток держит собственное долгоживущее соединение в режиме WAL,
+поэтому на каждый запрос не тратится открытие файла и разбор схемы.
+"""
+import asyncio
 import sqlite3
 import json
 import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, Any
+from functools import partial
+from typing import Optional, Dict, Any, Callable, Iterator, Tuple
+
+from config import DB_PATH, DB_READER_THREADS, ADMIN_CHAT_ID, ADMIN_DIGEST_INTERVAL
+from form_cache import form_cache, MISS
+from form_fields import FORM_COLUMNS, form_columns, search_document
+
+logger = logging.getLogger(__name__)
+
+
+# Настройки соединения: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL в WAL-режиме не делает fsync на каждый коммит
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+)
+
+# Размер кэша подготовленных выражений на соединение
+STATEMENT_CACHE_SIZE = 128
+
+# Получатель в outbox для выгрузки отправленных анкет в Google Sheets (ref = forms.id)
+OUTBOX_SHEETS = "sheets"
+# Получатель в outbox для уведомления администратора об отправленной анкете (ref = forms.id)
+OUTBOX_ADMIN = "admin"
+
+# Состояния рассылки: ждет подтверждения, идет, завершена, отменена
+BROADCAST_PENDING = "pending"
+BROADCAST_RUNNING = "running"
+BROADCAST_DONE = "done"
+BROADCAST_CANCELLED = "cancelled"
+
+_local = threading.local()
+_connections: list = []
+_connections_lock = threading.Lock()
+_writer: Optional[ThreadPoolExecutor] = None
+_readers: Optional[ThreadPoolExecutor] = None
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    """Открывает соединение с БД и применяет настройки"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Возвращает долгоживущее соединение текущего потока"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def _write_transaction(func: Callable, *args):
+    """Выполняет функцию в транзакции на соединении потока-писателя"""
+    conn = _get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = func(conn, *args)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return result
+
+
+def _read(func: Callable, *args):
+    """Выполняет функцию на соединении потока-читателя"""
+    return func(_get_connection(), *args)
+
+
+def _get_executors() -> tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+    global _writer, _readers
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+    if _readers is None:
+        _readers = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="db-reader")
+    return _writer, _readers
+
+
+async def run_write(func: Callable, *args):
+    """Выполняет func(conn, *args) в транзакции в потоке-писателе"""
+    writer, _ = _get_executors()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(writer, partial(_write_transaction, func, *args))
+
+
+async def run_read(func: Callable, *args):
+    """Выполняет func(conn, *args) в одном из потоков-читателей"""
+    _, readers = _get_executors()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(readers, partial(_read, func, *args))
+
+
+def _migrate_unique_user_id(conn: sqlite3.Connection):
+    """Оставляет по одной (самой свежей) анкете на пользователя и делает user_id уникальным"""
+    removed = conn.execute("""
+        DELETE FROM forms WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id ORDER BY updated_at DESC, id DESC
+                ) AS rn
+                FROM forms
+            ) WHERE rn = 1
+        )
+    """).rowcount
+    if removed:
+        logger.info(f"Миграция: удалено дублирующихся анкет: {removed}")
+    conn.execute("DROP INDEX IF EXISTS idx_user_id")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_forms_user_id ON forms(user_id)")
+
+
+def _migrate_fsm_states(conn: sqlite3.Connection):
+    """Таблица для состояний FSM (см. fsm_storage.SQLiteStorage)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+
+def _migrate_fsm_spilled_form(conn: sqlite3.Connection):
+    """Анкета сессии FSM хранится в forms, в fsm_states остается только признак"""
+    conn.execute("ALTER TABLE fsm_states ADD COLUMN spilled_form INTEGER NOT NULL DEFAULT 0")
+
+
+def _migrate_form_version(conn: sqlite3.Connection):
+    """Номер версии анкеты для оптимистичной блокировки (см. _save_form)"""
+    conn.execute("ALTER TABLE forms ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def _migrate_submitted_at(conn: sqlite3.Connection):
+    """Время отправки анкеты: в Google Sheets выгружаются только отправленные анкеты"""
+    conn.execute("ALTER TABLE forms ADD COLUMN submitted_at TEXT")
+    # Уже выгруженные анкеты точно были отправлены пользователем. Отправленные,
+    # но не выгруженные из-за ошибки, по старым данным не отличить от черновиков:
+    # их можно поставить в очередь скриптом scripts/export_forms.py --requeue-drafts
+    conn.execute("UPDATE forms SET submitted_at = updated_at WHERE sent_to_sheets = 1")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_forms_unsent ON forms(submitted_at)
+        WHERE sent_to_sheets = 0 AND submitted_at IS NOT NULL
+    """)
+
+
+def _migrate_outbox(conn: sqlite3.Connection):
+    """Очередь доставки (outbox): задания пишутся в одной транзакции с анкетой"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sink TEXT NOT NULL,
+            ref INTEGER NOT NULL,
+            payload TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(sink, next_attempt_at)")
+    # Отправленные, но еще не выгруженные анкеты переносим в очередь
+    conn.execute("""
+        INSERT INTO outbox (sink, ref, next_attempt_at, created_at)
+        SELECT ?, id, 0, ? FROM forms
+        WHERE sent_to_sheets = 0 AND submitted_at IS NOT NULL
+    """, (OUTBOX_SHEETS, datetime.now().isoformat()))
+
+
+def _migrate_sheet_hash(conn: sqlite3.Connection):
+    """Хэш строки, выгруженной в Google Sheets (google_sheets.row_hash) — для сверки листа с БД"""
+    conn.execute("ALTER TABLE forms ADD COLUMN sheet_hash TEXT")
+
+
+def _migrate_broadcasts(conn: sqlite3.Connection):
+    """Рассылки администратора с точкой продолжения и индексы для выбора получателей"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            filters TEXT NOT NULL,
+            admin_chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            max_form_id INTEGER NOT NULL,
+            last_form_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_running ON broadcasts(lease_until) "
+                 "WHERE status = 'running'")
+    # Выражения должны совпадать с RECIPIENT_FILTERS, иначе индексы не используются
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forms_submitted_at ON forms(submitted_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forms_updated_at ON forms(updated_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forms_citizenship "
+                 "ON forms(json_extract(form_data, '$.citizenship_type'))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_forms_city ON forms(json_extract(form_data, '$.readiness.city'))")
+
+
+def _migrate_query_columns(conn: sqlite3.Connection):
+    """Индексированные столбцы с полями анкеты для запросов (form_fields.FORM_COLUMNS)"""
+    for column, column_type in zip(FORM_COLUMNS, ("TEXT", "TEXT", "TEXT", "TEXT", "TEXT", "INTEGER")):
+        conn.execute(f"ALTER TABLE forms ADD COLUMN {column} {column_type}")
+    # Заполняем столбцы для уже сохраненных анкет частями, чтобы не держать в памяти всю таблицу
+    last_id, filled = 0, 0
+    while True:
+        rows = conn.execute("SELECT id, form_data FROM forms WHERE id > ? ORDER BY id LIMIT 1000",
+                            (last_id,)).fetchall()
+        if not rows:
+            break
+        conn.executemany(f"""
+            UPDATE forms SET {", ".join(f"{column} = ?" for column in FORM_COLUMNS)} WHERE id = ?
+        """, [form_columns(json.loads(form_data)) + (form_id,) for form_id, form_data in rows])
+        last_id, filled = rows[-1][0], filled + len(rows)
+    if filled:
+        logger.info(f"Миграция: заполнены поля для запросов у {filled} анкет")
+    # Индексы по выражениям json_extract (рассылки) заменяются индексами по столбцам
+    conn.execute("DROP INDEX IF EXISTS idx_forms_citizenship")
+    conn.execute("DROP INDEX IF EXISTS idx_forms_city")
+    conn.execute("CREATE INDEX idx_forms_city ON forms(city, citizenship_type, vakhta_start_date)")
+    conn.execute("CREATE INDEX idx_forms_citizenship ON forms(citizenship_type, vakhta_start_date)")
+    conn.execute("CREATE INDEX idx_forms_vakhta_start ON forms(vakhta_start_date)")
+    conn.execute("CREATE INDEX idx_forms_phone ON forms(phone)")
+    conn.execute("CREATE INDEX idx_forms_completion ON forms(completion)")
+
+
+def _migrate_search(conn: sqlite3.Connection):
+    """Полнотекстовый поиск по анкетам (FTS5, rowid = forms.id, текст — form_fields.search_document)"""
+    # Индексы префиксов из 2 и 3 букв ускоряют поиск по началу слова
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS forms_fts USING fts5(
+            text, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    _fill_search_index(conn)
+
+
+def _fill_search_index(conn: sqlite3.Connection):
+    """Заполняет индекс поиска по всем анкетам частями"""
+    last_id = 0
+    while True:
+        rows = conn.execute("SELECT id, form_data FROM forms WHERE id > ? ORDER BY id LIMIT 1000",
+                            (last_id,)).fetchall()
+        if not rows:
+            break
+        conn.executemany("INSERT INTO forms_fts (rowid, text) VALUES (?, ?)",
+                         [(form_id, search_document(json.loads(form_data))) for form_id, form_data in rows])
+        last_id = rows[-1][0]
+    conn.execute("INSERT INTO forms_fts (forms_fts) VALUES ('optimize')")
+
 
+def _migrate_submitted_form(conn: sqlite3.Connection):
+    """Анкета в том виде, в котором ее отправили: она выгружается в Google Sheets и сверяется с листом"""
+    conn.execute("ALTER TABLE forms ADD COLUMN submitted_form TEXT")
+    # Для анкет, отправленных раньше, отправленная версия не сохранилась — берем текущую
+    conn.execute("UPDATE forms SET submitted_form = form_data WHERE submitted_at IS NOT NULL")
 
-DB_PATH = "data/anketa.db"
+
+def _migrate_outbox_failed(conn: sqlite3.Connection):
+    """Время, когда задание outbox исчерпало попытки (такие задания больше не берутся в работу)"""
+    conn.execute("ALTER TABLE outbox ADD COLUMN failed_at TEXT")
+    conn.execute("DROP INDEX IF EXISTS idx_outbox_due")
+    conn.execute("CREATE INDEX idx_outbox_due ON outbox(sink, next_attempt_at) WHERE failed_at IS NULL")
+
+
+def _migrate_search_phones(conn: sqlite3.Connection):
+    """Переиндексация поиска: в телефонах схлопывались повторяющиеся цифры (79001234567 -> 7901234567)"""
+    conn.execute("DELETE FROM forms_fts")
+    _fill_search_index(conn)
+
+
+def _migrate_start_dates(conn: sqlite3.Connection):
+    """Пересчет даты начала вахты: «в мае» не распознавалось, а «Майкоп» считалось маем"""
+    last_id, updated = 0, 0
+    start_index = FORM_COLUMNS.index("vakhta_start_date")
+    while True:
+        rows = conn.execute("""
+            SELECT id, form_data, vakhta_start_date FROM forms WHERE id > ? ORDER BY id LIMIT 1000
+        """, (last_id,)).fetchall()
+        if not rows:
+            break
+        starts = [(form_columns(json.loads(form_data))[start_index], form_id, start)
+                  for form_id, form_data, start in rows]
+        starts = [(start, form_id) for start, form_id, old_start in starts if start != old_start]
+        conn.executemany("UPDATE forms SET vakhta_start_date = ? WHERE id = ?", starts)
+        last_id, updated = rows[-1][0], updated + len(starts)
+    if updated:
+        logger.info(f"Миграция: пересчитана дата начала вахты у {updated} анкет")
+
+
+# Миграции схемы; номер применённой миграции хранится в PRAGMA user_version
+MIGRATIONS = (
+    _migrate_unique_user_id,
+    _migrate_fsm_states,
+    _migrate_fsm_spilled_form,
+    _migrate_form_version,
+    _migrate_submitted_at,
+    _migrate_outbox,
+    _migrate_sheet_hash,
+    _migrate_broadcasts,
+    _migrate_query_columns,
+    _migrate_search,
+    _migrate_submitted_form,
+    _migrate_outbox_failed,
+    _migrate_start_dates,
+    _migrate_search_phones,
+)
+
+
+def _apply_migrations(conn: sqlite3.Connection):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        # Несколько процессов бота могут запускаться одновременно: миграцию,
+        # уже примененную другим процессом, пропускаем
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+            conn.execute("ROLLBACK")
+            continue
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        logger.info(f"Применена миграция БД №{number}: {migration.__name__}")
 
 
 def init_database():
-    """Инициализирует базу данных и создает таблицы"""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
+    """Инициализирует базу данных, создает таблицы и применяет миграции"""
+    global _initialized
+    if _initialized:
+        return
+
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+
+    conn = _connect()
     cursor = conn.cursor()
-    
+
     # Создаем таблицу для анкет
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS forms (
@@ -28,125 +387,612 @@ def init_database():
             updated_at TEXT NOT NULL
         )
     """)
-    
-    # Создаем индекс для быстрого поиска по user_id
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_user_id ON forms(user_id)
-    """)
-    
-    conn.commit()
+
+    _apply_migrations(conn)
+
     conn.close()
+    _get_executors()
+    _initialized = True
+    logger.info(f"SQLite: {DB_PATH} (WAL, читателей: {DB_READER_THREADS})")
 
 
-def save_form_to_db(user_id: int, form_data: dict) -> int:
-    """Сохраняет или обновляет анкету в базе данных. Возвращает ID записи"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Проверяем, есть ли уже анкета для этого пользователя
-    cursor.execute("SELECT id FROM forms WHERE user_id = ? ORDER BY updated_at DESC LIMIT 1", (user_id,))
-    existing = cursor.fetchone()
-    
-    form_data_json = json.dumps(form_data, ensure_ascii=False)
+def close_database():
+    """Дожидается завершения запросов и закрывает все соединения"""
+    global _writer, _readers, _initialized
+    for executor in (_writer, _readers):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _writer = None
+    _readers = None
+
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка при закрытии соединения с БД: {e}")
+        _connections.clear()
+    _initialized = False
+
+
+class StaleFormError(Exception):
+    """Анкету изменили после того, как она была прочитана (версия устарела)"""
+
+    def __init__(self, user_id: int):
+        super().__init__(f"Анкета пользователя {user_id} изменена параллельно")
+        self.user_id = user_id
+
+
+# Ключ form_data с версией анкеты, на основе которой сделаны изменения.
+# В JSON анкеты не попадает: версия хранится в отдельном столбце forms.version
+VERSION_KEY = "_version"
+
+
+def _dump_form(form_data: dict) -> str:
+    return json.dumps({name: value for name, value in form_data.items() if name != VERSION_KEY},
+                      ensure_ascii=False)
+
+
+def _save_form(conn: sqlite3.Connection, user_id: int, form_data_json: str, filled_at: str,
+               base: int, version: int, columns: tuple) -> Optional[int]:
+    """Вставляет или обновляет анкету, если в БД все еще версия base (0 — анкеты нет).
+
+    columns — значения столбцов FORM_COLUMNS (form_fields.form_columns).
+    Возвращает ID записи или None, если анкету уже изменили.
+    """
     now = datetime.now().isoformat()
-    
-    if existing:
-        # Обновляем существующую запись
-        form_id = existing[0]
-        cursor.execute("""
-            UPDATE forms 
-            SET form_data = ?, updated_at = ?
-            WHERE id = ?
-        """, (form_data_json, now, form_id))
-    else:
-        # Создаем новую запись
-        filled_at = form_data.get("filled_at", now)
-        cursor.execute("""
-            INSERT INTO forms (user_id, form_data, filled_at, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, form_data_json, filled_at, now, now))
-        form_id = cursor.lastrowid
-    
-    conn.commit()
-    conn.close()
+    # Одна анкета на пользователя: вставка или обновление одним запросом
+    result = conn.execute(f"""
+        INSERT INTO forms (user_id, form_data, filled_at, created_at, updated_at, version, {", ".join(FORM_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, ?, {", ".join("?" * len(FORM_COLUMNS))})
+        ON CONFLICT(user_id) DO UPDATE
+        SET form_data = excluded.form_data, updated_at = excluded.updated_at, version = excluded.version,
+            {", ".join(f"{column} = excluded.{column}" for column in FORM_COLUMNS)}
+        WHERE forms.version = ?
+        RETURNING id
+    """, (user_id, form_data_json, filled_at or now, now, now, version) + columns + (base,)).fetchone()
+    return result[0] if result else None
+
+
+def _index_form(conn: sqlite3.Connection, form_id: int, document: str):
+    """Обновляет текст анкеты в индексе поиска (в транзакции сохранения)"""
+    conn.execute("DELETE FROM forms_fts WHERE rowid = ?", (form_id,))
+    conn.execute("INSERT INTO forms_fts (rowid, text) VALUES (?, ?)", (form_id, document))
+
+
+def next_version(form_data: dict) -> int:
+    """Увеличивает версию анкеты перед записью. Возвращает версию, от которой она изменена"""
+    base = form_data.get(VERSION_KEY, 0)
+    form_data[VERSION_KEY] = base + 1
+    return base
+
+
+async def save_form_to_db(user_id: int, form_data: dict, submit: bool = False) -> int:
+    """Сохраняет или обновляет анкету в базе данных. Возвращает ID записи.
+
+    С submit=True анкета в той же транзакции отмечается отправленной и
+    ставится в очередь на выгрузку (outbox).
+    Если анкету успели изменить после чтения, выбрасывает StaleFormError.
+    """
+    base = next_version(form_data)
+    # Сериализуем в event loop, пока form_data не изменился в другом обработчике
+    row = (user_id, _dump_form(form_data), form_data.get("filled_at"), base, form_data[VERSION_KEY],
+           form_columns(form_data), search_document(form_data), submit)
+    try:
+        form_id = (await run_write(_save_forms, [row]))[user_id]
+    except Exception:
+        form_data[VERSION_KEY] = base
+        form_cache.invalidate(user_id)
+        raise
+    if form_id is None:
+        # Повторная запись той же анкеты тоже должна быть отклонена
+        form_data[VERSION_KEY] = base
+        form_cache.invalidate(user_id)
+        raise StaleFormError(user_id)
+    form_cache.put(user_id, form_data)
     return form_id
 
 
-def load_form_from_db(user_id: int) -> Optional[Dict[str, Any]]:
-    """Загружает анкету пользователя из базы данных"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT form_data FROM forms 
-        WHERE user_id = ? 
-        ORDER BY updated_at DESC 
-        LIMIT 1
-    """, (user_id,))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
-        return json.loads(result[0])
-    return None
+def _save_forms(conn: sqlite3.Connection, rows: list) -> Dict[int, Optional[int]]:
+    form_ids = {}
+    for user_id, form_data_json, filled_at, base, version, columns, document, submit in rows:
+        form_id = _save_form(conn, user_id, form_data_json, filled_at, base, version, columns)
+        if form_id is not None:
+            _index_form(conn, form_id, document)
+        if form_id is not None and submit:
+            _submit_form(conn, form_id)
+        form_ids[user_id] = form_id
+    return form_ids
 
 
-def get_unsent_forms() -> list:
-    """Возвращает список анкет, которые еще не отправлены в Google Sheets"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, user_id, form_data FROM forms 
-        WHERE sent_to_sheets = 0
-        ORDER BY updated_at ASC
-    """)
-    
-    results = cursor.fetchall()
-    conn.close()
-    
-    forms = []
-    for row in results:
-        forms.append({
-            "id": row[0],
-            "user_id": row[1],
-            "form_data": json.loads(row[2])
-        })
-    return forms
-
-
-def mark_as_sent(form_id: int):
-    """Отмечает анкету как отправленную в Google Sheets"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE forms 
-        SET sent_to_sheets = 1 
+def _digest_due() -> float:
+    """Время отправки сводки для администратора: конец текущего интервала ADMIN_DIGEST_INTERVAL.
+
+    Все анкеты, отправленные в одном интервале, становятся доступны
+    диспетчеру outbox одновременно и уходят одним сообщением.
+    """
+    now = time.time()
+    if ADMIN_DIGEST_INTERVAL <= 0:
+        return now
+    return (now // ADMIN_DIGEST_INTERVAL + 1) * ADMIN_DIGEST_INTERVAL
+
+
+def _submit_form(conn: sqlite3.Connection, form_id: int):
+    """Отмечает анкету отправленной и ставит ее в очередь на выгрузку.
+
+    Отправленная версия анкеты сохраняется в submitted_form: выгружается
+    и сверяется с листом она, а не черновик, измененный после отправки.
+    """
+    conn.execute("""
+        UPDATE forms
+        SET submitted_at = ?, submitted_form = form_data, sent_to_sheets = 0
         WHERE id = ?
-    """, (form_id,))
-    
-    conn.commit()
-    conn.close()
+    """, (datetime.now().isoformat(), form_id))
+    _add_to_outbox(conn, OUTBOX_SHEETS, form_id)
+    if ADMIN_CHAT_ID:
+        _add_to_outbox(conn, OUTBOX_ADMIN, form_id, due=_digest_due())
 
 
-def get_form_by_id(form_id: int) -> Optional[Dict[str, Any]]:
-    """Получает анкету по ID"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT user_id, form_data FROM forms WHERE id = ?
-    """, (form_id,))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
+async def save_forms_batch(forms: Dict[int, Tuple[dict, int, bool]]) -> Dict[int, Optional[int]]:
+    """Сохраняет несколько анкет одной транзакцией.
+
+    Принимает {user_id: (анкета, версия в БД, от которой она изменена, отправить ли)}.
+    Возвращает {user_id: ID записи или None, если запись устарела}.
+    """
+    rows = [(user_id, _dump_form(form_data), form_data.get("filled_at"), base, form_data[VERSION_KEY],
+             form_columns(form_data), search_document(form_data), submit)
+            for user_id, (form_data, base, submit) in forms.items()]
+    try:
+        form_ids = await run_write(_save_forms, rows)
+    except Exception:
+        for user_id in forms:
+            form_cache.invalidate(user_id)
+        raise
+    for user_id, (form_data, _, _) in forms.items():
+        if form_ids[user_id] is None:
+            logger.warning(f"Устаревшая запись анкеты пользователя {user_id} отклонена")
+            form_cache.invalidate(user_id)
+        else:
+            form_cache.put(user_id, form_data)
+    return form_ids
+
+
+def _load_form(conn: sqlite3.Connection, user_id: int) -> Optional[tuple]:
+    return conn.execute("""
+        SELECT form_data, version FROM forms WHERE user_id = ?
+    """, (user_id,)).fetchone()
+
+
+async def load_form_from_db(user_id: int) -> Optional[Dict[str, Any]]:
+    """Загружает анкету пользователя (сначала из кэша, затем из базы данных)"""
+    cached = form_cache.get(user_id)
+    if cached is not MISS:
+        return cached
+
+    result = await run_read(_load_form, user_id)
+    form_data = None
     if result:
-        return {
-            "user_id": result[0],
-            "form_data": json.loads(result[1])
-        }
-    return None
+        form_data = json.loads(result[0])
+        form_data[VERSION_KEY] = result[1]
+    # Пока шло чтение, анкету могли сохранить — тогда в кэше уже свежая версия
+    form_cache.add(user_id, form_data)
+    return form_data
+
+
+def _mark_many_as_sent(conn: sqlite3.Connection, forms: list):
+    conn.executemany("""
+        UPDATE forms
+        SET sent_to_sheets = 1, sheet_hash = ?
+        WHERE id = ? AND submitted_at = ?
+    """, [(sheet_hash, form_id, submitted_at) for form_id, submitted_at, sheet_hash in forms])
+
+
+async def mark_many_as_sent(forms: list):
+    """Отмечает выгруженными несколько анкет одной транзакцией.
+
+    Принимает список (ID анкеты, submitted_at выгруженной версии, хэш записанной строки).
+    """
+    await run_write(_mark_many_as_sent, forms)
+
+
+def _requeue_drafts(conn: sqlite3.Connection, min_completion: int, before: Optional[str]) -> int:
+    rows = conn.execute("""
+        UPDATE forms
+        SET submitted_at = updated_at, submitted_form = form_data
+        WHERE submitted_at IS NULL AND sent_to_sheets = 0 AND completion >= ? AND (? IS NULL OR updated_at < ?)
+        RETURNING id
+    """, (min_completion, before, before)).fetchall()
+    for (form_id,) in rows:
+        _add_to_outbox(conn, OUTBOX_SHEETS, form_id)
+    return len(rows)
+
+
+async def requeue_drafts(min_completion: int = 100, before: Optional[str] = None) -> int:
+    """Отмечает отправленными черновики, заполненные не меньше чем на min_completion %, и ставит их в очередь выгрузки.
+
+    Нужна для анкет, отправленных до появления forms.submitted_at, выгрузка
+    которых тогда не удалась: миграция _migrate_submitted_at не может отличить
+    их от черновиков. before (ГГГГ-ММ-ДД) — только анкеты, измененные раньше
+    этой даты (например, дня обновления бота). Возвращает число анкет.
+    """
+    return await run_write(_requeue_drafts, min_completion, before)
+
+
+def _sheet_states(conn: sqlite3.Connection) -> list:
+    return conn.execute("""
+        SELECT id, user_id, sent_to_sheets, sheet_hash FROM forms
+        WHERE submitted_at IS NOT NULL
+    """).fetchall()
+
+
+async def get_sheet_states() -> list:
+    """Состояние выгрузки отправленных анкет: (ID, user_id, выгружена ли, хэш строки).
+
+    Содержимое анкет не читается — для сверки с листом хватает хэшей.
+    """
+    return await run_read(_sheet_states)
+
+
+def _set_sheet_hashes(conn: sqlite3.Connection, hashes: list):
+    conn.executemany("UPDATE forms SET sheet_hash = ? WHERE id = ?", hashes)
+
+
+async def set_sheet_hashes(hashes: list):
+    """Запоминает хэши строк в листе. Принимает список (хэш, ID анкеты)"""
+    await run_write(_set_sheet_hashes, hashes)
+
+
+def _forms_by_ids(conn: sqlite3.Connection, form_ids: list) -> list:
+    placeholders = ", ".join("?" * len(form_ids))
+    return conn.execute(f"""
+        SELECT id, user_id, form_data, submitted_at FROM forms WHERE id IN ({placeholders})
+    """, form_ids).fetchall()
+
+
+async def get_forms_by_ids(form_ids: list) -> list:
+    """Получает анкеты по списку ID"""
+    if not form_ids:
+        return []
+    results = await run_read(_forms_by_ids, list(form_ids))
+    return [{"id": row[0], "user_id": row[1], "form_data": json.loads(row[2]), "submitted_at": row[3]}
+            for row in results]
+
+
+def _submitted_forms(conn: sqlite3.Connection, form_ids: list) -> list:
+    placeholders = ", ".join("?" * len(form_ids))
+    return conn.execute(f"""
+        SELECT id, user_id, submitted_form, submitted_at FROM forms
+        WHERE id IN ({placeholders}) AND submitted_form IS NOT NULL
+    """, form_ids).fetchall()
+
+
+async def get_submitted_forms(form_ids: list) -> list:
+    """Отправленные версии анкет по списку ID (как get_forms_by_ids, но без изменений после отправки)"""
+    if not form_ids:
+        return []
+    results = await run_read(_submitted_forms, list(form_ids))
+    return [{"id": row[0], "user_id": row[1], "form_data": json.loads(row[2]), "submitted_at": row[3]}
+            for row in results]
+
+
+def iter_forms(submitted_only: bool = False, batch_size: int = 1000) -> Iterator[tuple]:
+    """Построчно читает анкеты (user_id, form_data в JSON, submitted_at) в порядке ID.
+
+    Синхронный генератор для выгрузок всей базы: выполняется в отдельном
+    потоке или скрипте на собственном соединении и держит в памяти не больше
+    batch_size строк. Чтение идет в одной транзакции, поэтому выгрузка
+    согласована и не мешает записи (WAL).
+    """
+    conn = _connect()
+    try:
+        cursor = conn.execute(f"""
+            SELECT user_id, form_data, submitted_at FROM forms
+            {"WHERE submitted_at IS NOT NULL" if submitted_only else ""}
+            ORDER BY id
+        """)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+# ========== OUTBOX ==========
+
+def _add_to_outbox(conn: sqlite3.Connection, sink: str, ref: int, payload: Optional[str] = None,
+                   due: Optional[float] = None):
+    """Добавляет задание в outbox в текущей транзакции (due — не раньше этого времени, unix)"""
+    conn.execute("""
+        INSERT INTO outbox (sink, ref, payload, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (sink, ref, payload, due if due is not None else time.time(), datetime.now().isoformat()))
+
+
+async def add_to_outbox(sink: str, ref: int, payload: Optional[str] = None):
+    """Добавляет задание в outbox отдельной транзакцией"""
+    await run_write(_add_to_outbox, sink, ref, payload)
+
+
+def _claim_outbox(conn: sqlite3.Connection, sink: str, limit: int, lease: float) -> list:
+    now = time.time()
+    # Взятые задания откладываются на время аренды: если процесс упадет,
+    # не дойдя до complete/fail, они снова станут доступны
+    return conn.execute("""
+        UPDATE outbox
+        SET next_attempt_at = ?, attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE sink = ? AND next_attempt_at <= ? AND failed_at IS NULL
+            ORDER BY next_attempt_at
+            LIMIT ?
+        )
+        RETURNING id, ref, payload, attempts
+    """, (now + lease, sink, now, limit)).fetchall()
+
+
+async def claim_outbox(sink: str, limit: int, lease: float) -> list:
+    """Забирает до limit подошедших по времени заданий получателя.
+
+    Возвращает список (id, ref, payload, attempts).
+    """
+    return await run_write(_claim_outbox, sink, limit, lease)
+
+
+def _complete_outbox(conn: sqlite3.Connection, ids: list):
+    conn.executemany("DELETE FROM outbox WHERE id = ?", [(outbox_id,) for outbox_id in ids])
+
+
+async def complete_outbox(ids: list):
+    """Удаляет выполненные задания"""
+    await run_write(_complete_outbox, ids)
+
+
+def _fail_outbox(conn: sqlite3.Connection, failures: list):
+    conn.executemany("""
+        UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?
+    """, failures)
+
+
+async def fail_outbox(failures: list):
+    """Откладывает неудавшиеся задания. Принимает список (время повтора, ошибка, id)"""
+    await run_write(_fail_outbox, failures)
+
+
+def _abandon_outbox(conn: sqlite3.Connection, failures: list):
+    now = datetime.now().isoformat()
+    conn.executemany("""
+        UPDATE outbox SET failed_at = ?, last_error = ? WHERE id = ?
+    """, [(now, error, outbox_id) for error, outbox_id in failures])
+
+
+async def abandon_outbox(failures: list):
+    """Отмечает задания, исчерпавшие попытки: они остаются в outbox, но больше не повторяются.
+
+    Принимает список (ошибка, id).
+    """
+    await run_write(_abandon_outbox, failures)
+
+
+def _next_outbox_attempts(conn: sqlite3.Connection) -> Dict[str, float]:
+    return dict(conn.execute("""
+        SELECT sink, MIN(next_attempt_at) FROM outbox WHERE failed_at IS NULL GROUP BY sink
+    """).fetchall())
+
+
+async def next_outbox_attempts() -> Dict[str, float]:
+    """Время (unix) ближайшего задания каждого получателя"""
+    return await run_read(_next_outbox_attempts)
+
+
+# ========== РАССЫЛКИ ==========
+
+# Условия отбора анкет (рассылки, /count): фильтр -> (SQL, значение фильтра -> параметры).
+# Значения city и phone нормализуются так же, как при сохранении (form_fields)
+RECIPIENT_FILTERS = {
+    "status": lambda value: ("submitted_at IS NOT NULL" if value == "submitted" else "submitted_at IS NULL", ()),
+    "citizenship": lambda value: ("citizenship_type = ?", (value,)),
+    "city": lambda value: ("city = ?", (value,)),
+    "phone": lambda value: ("phone = ?", (value,)),
+    "min_completion": lambda value: ("completion >= ?", (value,)),
+    "ready_from": lambda value: ("vakhta_start_date >= ?", (value,)),
+    "ready_to": lambda value: ("vakhta_start_date < ?", (value,)),
+    "date_from": lambda value: ("updated_at >= ?", (value,)),
+    "date_to": lambda value: ("updated_at < ?", (value,)),
+}
+
+BROADCAST_COLUMNS = ("id, text, filters, admin_chat_id, status, max_form_id, last_form_id, total, "
+                     "delivered, blocked, failed, created_at, finished_at")
+
+
+def _filter_conditions(filters: Dict[str, Any]) -> Tuple[list, tuple]:
+    conditions, params = [], ()
+    for name, value in filters.items():
+        condition, values = RECIPIENT_FILTERS[name](value)
+        conditions.append(condition)
+        params += values
+    return conditions, params
+
+
+def _recipient_conditions(filters: Dict[str, Any]) -> Tuple[str, tuple]:
+    """Условие WHERE для фильтров; первые два параметра — границы ID анкет (после, до включительно)"""
+    conditions, params = _filter_conditions(filters)
+    return " AND ".join(["id > ?", "id <= ?"] + conditions), params
+
+
+def _broadcast_dict(row: tuple) -> Dict[str, Any]:
+    broadcast = dict(zip([name.strip() for name in BROADCAST_COLUMNS.split(",")], row))
+    broadcast["filters"] = json.loads(broadcast["filters"])
+    return broadcast
+
+
+def _create_broadcast(conn: sqlite3.Connection, text: str, filters: Dict[str, Any], admin_chat_id: int) -> tuple:
+    # Получатели — анкеты, существующие на момент создания рассылки
+    max_form_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM forms").fetchone()[0]
+    where, params = _recipient_conditions(filters)
+    total = conn.execute(f"SELECT COUNT(*) FROM forms WHERE {where}", (0, max_form_id) + params).fetchone()[0]
+    now = datetime.now().isoformat()
+    broadcast_id = conn.execute("""
+        INSERT INTO broadcasts (text, filters, admin_chat_id, status, max_form_id, total, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (text, json.dumps(filters, ensure_ascii=False), admin_chat_id, BROADCAST_PENDING, max_form_id,
+          total, now, now)).lastrowid
+    return broadcast_id, total
+
+
+async def create_broadcast(text: str, filters: Dict[str, Any], admin_chat_id: int) -> Tuple[int, int]:
+    """Создает рассылку в ожидании подтверждения. Возвращает (ID, число получателей)"""
+    return await run_write(_create_broadcast, text, filters, admin_chat_id)
+
+
+def _set_broadcast_status(conn: sqlite3.Connection, broadcast_id: int, status: str, allowed: tuple) -> bool:
+    now = datetime.now().isoformat()
+    finished_at = now if status in (BROADCAST_DONE, BROADCAST_CANCELLED) else None
+    return conn.execute(f"""
+        UPDATE broadcasts SET status = ?, updated_at = ?, finished_at = ?
+        WHERE id = ? AND status IN ({",".join("?" * len(allowed))})
+    """, (status, now, finished_at, broadcast_id) + allowed).rowcount > 0
+
+
+async def start_broadcast(broadcast_id: int) -> bool:
+    """Запускает подтвержденную рассылку. False — рассылка уже запущена или отменена"""
+    return await run_write(_set_broadcast_status, broadcast_id, BROADCAST_RUNNING, (BROADCAST_PENDING,))
+
+
+async def cancel_broadcast(broadcast_id: int) -> bool:
+    """Отменяет рассылку. False — рассылка уже завершена или отменена"""
+    return await run_write(_set_broadcast_status, broadcast_id, BROADCAST_CANCELLED,
+                           (BROADCAST_PENDING, BROADCAST_RUNNING))
+
+
+def _claim_broadcast(conn: sqlite3.Connection, lease: float) -> Optional[tuple]:
+    now = time.time()
+    # Как и задания outbox, рассылка берется в аренду: если процесс упадет,
+    # по истечении аренды ее продолжит другой процесс с последней точки
+    return conn.execute(f"""
+        UPDATE broadcasts SET lease_until = ?
+        WHERE id = (
+            SELECT id FROM broadcasts
+            WHERE status = '{BROADCAST_RUNNING}' AND lease_until <= ?
+            ORDER BY id LIMIT 1
+        )
+        RETURNING {BROADCAST_COLUMNS}
+    """, (now + lease, now)).fetchone()
+
+
+async def claim_broadcast(lease: float) -> Optional[Dict[str, Any]]:
+    """Забирает идущую рассылку, которую сейчас никто не выполняет"""
+    row = await run_write(_claim_broadcast, lease)
+    return _broadcast_dict(row) if row else None
+
+
+def _broadcast_recipients(conn: sqlite3.Connection, filters: Dict[str, Any], after_id: int, max_id: int,
+                          limit: int) -> list:
+    where, params = _recipient_conditions(filters)
+    return conn.execute(f"""
+        SELECT id, user_id FROM forms WHERE {where} ORDER BY id LIMIT ?
+    """, (after_id, max_id) + params + (limit,)).fetchall()
+
+
+async def get_broadcast_recipients(filters: Dict[str, Any], after_id: int, max_id: int, limit: int) -> list:
+    """Следующая страница получателей рассылки: [(ID анкеты, user_id)] с ID после after_id"""
+    return await run_read(_broadcast_recipients, filters, after_id, max_id, limit)
+
+
+def _checkpoint_broadcast(conn: sqlite3.Connection, broadcast_id: int, last_form_id: int, delivered: int,
+                          blocked: int, failed: int, lease: float) -> Optional[str]:
+    row = conn.execute("""
+        UPDATE broadcasts
+        SET last_form_id = ?, delivered = delivered + ?, blocked = blocked + ?, failed = failed + ?,
+            lease_until = ?, updated_at = ?
+        WHERE id = ?
+        RETURNING status
+    """, (last_form_id, delivered, blocked, failed, time.time() + lease, datetime.now().isoformat(),
+          broadcast_id)).fetchone()
+    return row[0] if row else None
+
+
+async def checkpoint_broadcast(broadcast_id: int, last_form_id: int, delivered: int, blocked: int, failed: int,
+                               lease: float) -> Optional[str]:
+    """Сохраняет продвижение рассылки и продлевает аренду. Возвращает текущий статус"""
+    return await run_write(_checkpoint_broadcast, broadcast_id, last_form_id, delivered, blocked, failed, lease)
+
+
+def _release_broadcast(conn: sqlite3.Connection, broadcast_id: int):
+    conn.execute("UPDATE broadcasts SET lease_until = 0 WHERE id = ?", (broadcast_id,))
+
+
+async def release_broadcast(broadcast_id: int):
+    """Снимает аренду рассылки (процесс останавливается, не закончив ее)"""
+    await run_write(_release_broadcast, broadcast_id)
+
+
+async def finish_broadcast(broadcast_id: int) -> bool:
+    """Отмечает рассылку завершенной"""
+    return await run_write(_set_broadcast_status, broadcast_id, BROADCAST_DONE, (BROADCAST_RUNNING,))
+
+
+def _broadcasts(conn: sqlite3.Connection, limit: int) -> list:
+    return conn.execute(f"SELECT {BROADCAST_COLUMNS} FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+
+async def get_broadcasts(limit: int = 5) -> list:
+    """Последние рассылки (новые первыми)"""
+    return [_broadcast_dict(row) for row in await run_read(_broadcasts, limit)]
+
+
+def _broadcast(conn: sqlite3.Connection, broadcast_id: int) -> Optional[tuple]:
+    return conn.execute(f"SELECT {BROADCAST_COLUMNS} FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+
+
+async def get_broadcast(broadcast_id: int) -> Optional[Dict[str, Any]]:
+    """Рассылка по ID"""
+    row = await run_read(_broadcast, broadcast_id)
+    return _broadcast_dict(row) if row else None
+
+
+def _count_forms(conn: sqlite3.Connection, filters: Dict[str, Any]) -> int:
+    # Без границ по ID: иначе планировщик SQLite может выбрать обход по первичному ключу вместо индекса
+    conditions, params = _filter_conditions(filters)
+    where = " AND ".join(conditions) or "1"
+    return conn.execute(f"SELECT COUNT(*) FROM forms WHERE {where}", params).fetchone()[0]
+
+
+async def count_forms(filters: Dict[str, Any]) -> int:
+    """Число анкет, подходящих под фильтры (RECIPIENT_FILTERS)"""
+    return await run_read(_count_forms, filters)
+
+
+# ========== ПОИСК ==========
+
+# Сколько найденных анкет сортировать по релевантности (bm25 считается для
+# каждого совпадения); при большем числе совпадений — новые анкеты первыми
+SEARCH_RANK_LIMIT = 500
+
+
+def _search_forms(conn: sqlite3.Connection, query: str, limit: int, offset: int) -> Tuple[int, list]:
+    total = conn.execute("""
+        SELECT COUNT(*) FROM (SELECT 1 FROM forms_fts WHERE forms_fts MATCH ? LIMIT ?)
+    """, (query, SEARCH_RANK_LIMIT + 1)).fetchone()[0]
+    if total <= offset:
+        return total, []
+    order = "forms_fts.rank" if total <= SEARCH_RANK_LIMIT else "forms_fts.rowid DESC"
+    rows = conn.execute(f"""
+        SELECT forms.id, forms.user_id, forms.form_data, forms.submitted_at, forms.completion
+        FROM forms_fts JOIN forms ON forms.id = forms_fts.rowid
+        WHERE forms_fts MATCH ?
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    """, (query, limit, offset)).fetchall()
+    return total, rows
+
+
+async def search_forms(query: str, limit: int, offset: int = 0) -> Tuple[int, list]:
+    """Полнотекстовый поиск анкет по запросу FTS5 (form_fields.search_query).
 
+    Возвращает (число найденных, но не больше SEARCH_RANK_LIMIT + 1; страница результатов).
+    """
+    total, rows = await run_read(_search_forms, query, limit, offset)
+    return total, [{"id": row[0], "user_id": row[1], "form_data": json.loads(row[2]), "submitted_at": row[3],
+                    "completion": row[4]} for row in rows]
@@ -0,0 +1,183 @@
+"""Буфер отложенной записи анкет
+
+Промежуточные автосохранения не пишутся в БД сразу: буфер хранит
+последнюю версию анкеты каждого пользователя и сбрасывает все
+накопившиеся анкеты одной транзакцией по таймеру или при достижении
+лимита пользователей.
+
+Каждая запись проверяет версию анкеты (см. database._save_form): для
+нескольких изменений, объединенных в одну запись, запоминается версия,
+от которой было сделано первое из них.
+"""
+import asyncio
+import logging
+from typing import Optional, Dict
+
+from config import FORM_FLUSH_INTERVAL_MS, FORM_FLUSH_MAX_USERS
+from database import save_forms_batch, next_version, StaleFormError, VERSION_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("form_data", "base", "submit", "waiters")
+
+    def __init__(self, form_data: dict, base: int):
+        self.form_data = form_data
+        self.base = base
+        # Отметить анкету отправленной в той же транзакции (см. write_now)
+        self.submit = False
+        # Futures тех, кто ждет записи этой анкеты (см. write_now)
+        self.waiters: list = []
+
+
+def _notify(entry: _Entry, form_id: Optional[int] = None, error: Optional[Exception] = None):
+    """Сообщает ожидающим write_now() результат записи"""
+    for waiter in entry.waiters:
+        if waiter.done():
+            continue
+        if error is not None:
+            waiter.set_exception(error)
+        else:
+            waiter.set_result(form_id)
+    entry.waiters = []
+
+
+class FormWriteBuffer:
+    """Хранит несохраненные анкеты и периодически сбрасывает их в БД"""
+
+    def __init__(self, flush_interval_ms: int, max_users: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_users = max_users
+        self._pending: Dict[int, _Entry] = {}
+        # Анкеты, которые сейчас записываются (видны в get() до конца записи)
+        self._flushing: Dict[int, _Entry] = {}
+        # Пользователи, чья запись отклонена как устаревшая
+        self._conflicts: set = set()
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_forms = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запускает фоновый сброс буфера"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="form-buffer")
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает все оставшиеся анкеты"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def put(self, user_id: int, form_data: dict):
+        """Помечает анкету пользователя как измененную"""
+        base = next_version(form_data)
+        entry = self._pending.get(user_id)
+        if entry is None:
+            self._pending[user_id] = _Entry(form_data, base)
+        else:
+            # В БД еще версия, от которой сделано первое из накопленных изменений
+            entry.form_data = form_data
+        if len(self._pending) >= self.max_users:
+            self._wakeup.set()
+
+    async def write_now(self, user_id: int, form_data: dict, submit: bool = False) -> int:
+        """Записывает анкету сразу (вместе с остальным буфером). Возвращает ID записи.
+
+        С submit=True анкета в той же транзакции отмечается отправленной
+        и ставится в очередь на выгрузку.
+        Если анкету успели изменить в другом месте, выбрасывает StaleFormError.
+        """
+        self.put(user_id, form_data)
+        entry = self._pending[user_id]
+        entry.submit = entry.submit or submit
+        waiter = asyncio.get_running_loop().create_future()
+        entry.waiters.append(waiter)
+        await self.flush()
+        return await waiter
+
+    def get(self, user_id: int) -> Optional[dict]:
+        """Возвращает еще не записанную анкету пользователя, если она есть"""
+        entry = self._pending.get(user_id) or self._flushing.get(user_id)
+        return entry.form_data if entry else None
+
+    def pop_conflict(self, user_id: int) -> bool:
+        """Проверяет, была ли отклонена запись анкеты пользователя (и сбрасывает признак)"""
+        if user_id in self._conflicts:
+            self._conflicts.discard(user_id)
+            return True
+        return False
+
+    async def flush(self) -> Dict[int, int]:
+        """Записывает все накопленные анкеты одной транзакцией"""
+        async with self._lock:
+            if not self._pending:
+                return {}
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+            try:
+                form_ids = await save_forms_batch(
+                    {user_id: (entry.form_data, entry.base, entry.submit) for user_id, entry in batch.items()})
+            except Exception as e:
+                logger.error(f"Ошибка при записи буфера анкет ({len(batch)} шт.): {e}", exc_info=True)
+                for user_id, entry in batch.items():
+                    self._requeue(user_id, entry, e)
+                return {}
+            finally:
+                self._flushing = {}
+            self.flushes += 1
+            self.flushed_forms += len(batch)
+
+            saved = {}
+            for user_id, entry in batch.items():
+                form_id = form_ids[user_id]
+                if form_id is None:
+                    self._conflicts.add(user_id)
+                    error = StaleFormError(user_id)
+                    _notify(entry, error=error)
+                    # Более поздние изменения сделаны от той же устаревшей версии
+                    newer = self._pending.pop(user_id, None)
+                    if newer is not None:
+                        _notify(newer, error=error)
+                        newer.form_data[VERSION_KEY] = newer.base
+                    # Повторная запись той же анкеты тоже должна быть отклонена
+                    entry.form_data[VERSION_KEY] = entry.base
+                    continue
+                saved[user_id] = form_id
+                _notify(entry, form_id=form_id)
+            return saved
+
+    def _requeue(self, user_id: int, entry: _Entry, error: Exception):
+        """Возвращает в буфер анкету, которую не удалось записать"""
+        _notify(entry, error=error)
+        newer = self._pending.get(user_id)
+        if newer is None:
+            self._pending[user_id] = entry
+        else:
+            # Более новые данные остаются, но версия в БД — от несохраненной записи
+            newer.base = entry.base
+            newer.submit = newer.submit or entry.submit
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Отмена задачи не должна прерывать уже начатую запись
+            await asyncio.shield(self.flush())
+
+
+form_buffer = FormWriteBuffer(FORM_FLUSH_INTERVAL_MS, FORM_FLUSH_MAX_USERS)
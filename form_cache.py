@@ -0,0 +1,79 @@
+"""Кэш разобранных анкет пользователей (LRU + TTL)"""
+import copy
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from config import FORM_CACHE_SIZE, FORM_CACHE_TTL
+
+# Возвращается из get(), если анкеты нет в кэше
+MISS = object()
+
+
+class FormCache:
+    """Ограниченный по размеру и времени жизни кэш анкет по user_id.
+
+    Хранит копии словарей и отдает копии, поэтому изменения анкеты в
+    обработчиках не попадают в кэш без явного сохранения. Значение None
+    означает, что у пользователя анкеты нет.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[int, tuple[float, Optional[dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id: int):
+        """Возвращает копию анкеты, None (анкеты нет) или MISS"""
+        item = self._items.get(user_id)
+        if item is None:
+            self.misses += 1
+            return MISS
+        expires_at, form_data = item
+        if expires_at < time.monotonic():
+            del self._items[user_id]
+            self.expirations += 1
+            self.misses += 1
+            return MISS
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return copy.deepcopy(form_data)
+
+    def put(self, user_id: int, form_data: Optional[dict]):
+        """Запоминает актуальную анкету пользователя"""
+        self._items[user_id] = (time.monotonic() + self.ttl, copy.deepcopy(form_data))
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def add(self, user_id: int, form_data: Optional[dict]):
+        """Как put(), но не перезаписывает уже закэшированную (более свежую) анкету"""
+        if user_id not in self._items:
+            self.put(user_id, form_data)
+
+    def invalidate(self, user_id: int):
+        self._items.pop(user_id, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики для подбора размера кэша"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+form_cache = FormCache(FORM_CACHE_SIZE, FORM_CACHE_TTL)
@@ -0,0 +1,169 @@
+"""Поля анкеты для запросов администратора
+
+Анкета хранится в forms.form_data одним JSON. Поля, по которым отбираются
+кандидаты, при каждом сохранении анкеты дополнительно записываются в
+отдельные индексированные столбцы forms (см. FORM_COLUMNS) в нормализованном
+виде, поэтому запросы вроде «иностранцы из Москвы, готовые выйти в ноябре»
+выполняются по индексам без разбора JSON каждой анкеты.
+
+Текст для полнотекстового поиска (search_document) записывается в таблицу
+FTS5 forms_fts в упрощенной латинской транслитерации, и запрос
+транслитерируется так же, поэтому «Иванов», «ivanov» и «Ivanoff» находят
+друг друга.
+"""
+import re
+from datetime import date, datetime
+from typing import Any, Optional
+
+from game_utils import calculate_progress
+
+# Столбцы forms, вычисляемые из form_data (порядок совпадает с form_columns)
+FORM_COLUMNS = ("full_name", "phone", "citizenship_type", "city", "vakhta_start_date", "completion")
+
+MONTHS = (
+    ("январ", 1), ("феврал", 2), ("март", 3), ("апрел", 4), ("ма[йяе]", 5), ("июн", 6),
+    ("июл", 7), ("август", 8), ("сентябр", 9), ("октябр", 10), ("ноябр", 11), ("декабр", 12),
+)
+_MONTH_RE = re.compile(r"(?:(\d{1,2})\s+)?\b(" + "|".join(stem for stem, _ in MONTHS) + r")[а-я]{0,2}\b(?:\s+(\d{4}))?")
+# Транслитерация для поиска: одна буква — одна-две латинские, звуки, которые
+# пишут по-разному (х — h/kh, ц — c/ts, й — i/y/j), сводятся к одному написанию
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i", "й": "i",
+    "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "c", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "y", "ь": "", "э": "e",
+    "ю": "yu", "я": "ya", "ў": "u", "і": "i", "ї": "i", "є": "e", "ґ": "g", "қ": "k", "ғ": "g", "ҳ": "h",
+    "ң": "n", "ү": "u", "ұ": "u", "ө": "o", "ә": "a",
+})
+LATIN_VARIANTS = (
+    ("shch", "sh"), ("sch", "sh"), ("kh", "h"), ("tz", "c"), ("ts", "c"), ("w", "v"), ("x", "ks"), ("q", "k"),
+    ("yu", "iu"), ("ju", "iu"), ("ya", "ia"), ("ja", "ia"), ("ye", "e"), ("iy", "i"), ("yi", "i"), ("j", "i"),
+    ("ay", "ai"), ("ey", "ei"), ("oy", "oi"), ("uy", "ui"), ("ff", "v"),
+)
+_REPEATED_RE = re.compile(r"([^\W\d_])\1+")
+
+# Телефон, записанный группами цифр: +7 (900) 123-45-67
+_PHONE_RE = re.compile(r"\d[\d\s()-]{8,}\d")
+
+_DATE_RE = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{2}(?:\d{2})?)|(\d{4})-(\d{1,2})-(\d{1,2})")
+
+
+def normalize_text(value: Any) -> str:
+    """Строка для сравнения: нижний регистр, ё -> е, одиночные пробелы"""
+    return " ".join(str(value).casefold().replace("ё", "е").split())
+
+
+def normalize_city(value: Any) -> str:
+    """Город без «г.» в начале: «г. Москва» и «москва » совпадают"""
+    return re.sub(r"^(г\.|г |город )\s*", "", normalize_text(value))
+
+
+def normalize_phone(value: Any) -> str:
+    """Телефон цифрами в формате 7XXXXXXXXXX (российские номера с 8 или без кода страны)"""
+    digits = re.sub(r"\D", "", str(value))
+    if len(digits) == 11 and digits.startswith("8"):
+        return "7" + digits[1:]
+    if len(digits) == 10 and digits.startswith("9"):
+        return "7" + digits
+    return digits
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_start_date(value: Any, reference: Optional[date] = None) -> Optional[date]:
+    """Дата начала вахты из ответа в свободной форме: «15.11.2026», «2026-11-15», «с 15 ноября», «в ноябре».
+
+    Если год не указан, берется ближайший такой месяц, начиная с месяца
+    reference (даты заполнения анкеты). Возвращает None, если даты в ответе нет.
+    """
+    text = normalize_text(value)
+    if not text:
+        return None
+    reference = reference or date.today()
+    match = _DATE_RE.search(text)
+    if match:
+        if match.group(1):
+            day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+            year += 2000 if year < 100 else 0
+        else:
+            year, month, day = int(match.group(4)), int(match.group(5)), int(match.group(6))
+        return _safe_date(year, month, day)
+    match = _MONTH_RE.search(text)
+    if match:
+        month = next(number for stem, number in MONTHS if re.match(stem, match.group(2)))
+        year = int(match.group(3)) if match.group(3) else reference.year + (month < reference.month)
+        return _safe_date(year, month, int(match.group(1) or 1))
+    return None
+
+
+def form_columns(form_data: dict, reference: Optional[date] = None) -> tuple:
+    """Значения FORM_COLUMNS для анкеты (пустые поля — None)"""
+    pd = form_data.get("personal_data") or {}
+    readiness = form_data.get("readiness") or {}
+    full_name = " ".join(filter(None, (pd.get("surname"), pd.get("name"), pd.get("patronymic"))))
+    phone = normalize_phone((form_data.get("contacts") or {}).get("phone") or "")
+    city = normalize_city(readiness.get("city") or "")
+    if reference is None and form_data.get("filled_at"):
+        try:
+            reference = datetime.fromisoformat(form_data["filled_at"]).date()
+        except ValueError:
+            pass
+    start = parse_start_date(readiness.get("vakhta_start_date") or "", reference)
+    return (
+        full_name or None,
+        phone or None,
+        form_data.get("citizenship_type") or None,
+        city or None,
+        start.isoformat() if start else None,
+        calculate_progress(form_data)[0],
+    )
+
+
+def transliterate(text: str) -> str:
+    """Упрощенная латинская запись нормализованного текста (для поиска без учета алфавита)"""
+    text = text.translate(TRANSLIT)
+    for variant, canonical in LATIN_VARIANTS:
+        text = text.replace(variant, canonical)
+    # Удвоенные буквы пишут по-разному: Абдуллаев / Abdulaev (цифры телефона не трогаем)
+    return _REPEATED_RE.sub(r"\1", text)
+
+
+def search_document(form_data: dict) -> str:
+    """Текст анкеты для поиска (ФИО, город, гражданство, телефон, комментарии) в транслитерации"""
+    pd = form_data.get("personal_data") or {}
+    readiness = form_data.get("readiness") or {}
+    phone = normalize_phone((form_data.get("contacts") or {}).get("phone") or "")
+    parts = [
+        pd.get("surname"), pd.get("name"), pd.get("patronymic"), pd.get("birth_place"), pd.get("citizenship"),
+        form_data.get("citizenship_type"), readiness.get("city"),
+        # Телефон ищется и с кодом страны, и без него
+        phone, phone[1:] if len(phone) == 11 else None,
+        form_data.get("comments"),
+    ]
+    return transliterate(normalize_text(" ".join(str(part) for part in parts if part)))
+
+
+def _join_phone(match: re.Match) -> str:
+    """Склеивает группы цифр телефона в одно слово, иначе оставляет текст как есть"""
+    digits = re.sub(r"\D", "", match.group())
+    return f" {digits} " if len(digits) >= 10 else match.group()
+
+
+def search_query(text: str) -> Optional[str]:
+    """Запрос FTS5 к forms_fts: все слова запроса как префиксы, в транслитерации.
+
+    Возвращает None, если в тексте нет слов.
+    """
+    words = []
+    text = _PHONE_RE.sub(_join_phone, normalize_text(text))
+    for word in re.findall(r"\w+", text):
+        if word.isdigit() and len(word) >= 10:
+            word = normalize_phone(word)
+        word = transliterate(word)
+        if word:
+            words.append(f'"{word}"*')
+    return " ".join(words) or None
@@ -0,0 +1,141 @@
+"""Выгрузка всей базы анкет в файл CSV, XLSX или Parquet
+
+Анкеты читаются из SQLite курсором пачками (database.iter_forms) и сразу
+пишутся в файл, поэтому память не растет с числом анкет. Колонки те же,
+что в Google Sheets (get_headers / format_sheet_row).
+
+XLSX требует openpyxl, Parquet — pyarrow; без них доступен только CSV.
+Выгрузка синхронная: из бота ее нужно запускать в отдельном потоке.
+"""
+import csv
+import json
+import logging
+import os
+from typing import Iterator, Optional
+
+from database import iter_forms
+from google_sheets import format_sheet_row, get_headers
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "xlsx", "parquet")
+
+# Сколько строк читается из БД и записывается в Parquet за раз
+EXPORT_BATCH_SIZE = 5000
+
+
+def available_formats() -> list:
+    """Форматы, для которых установлены нужные библиотеки"""
+    return [fmt for fmt in FORMATS
+            if fmt == "csv" or (fmt == "xlsx" and openpyxl) or (fmt == "parquet" and pyarrow)]
+
+
+def format_from_path(path: str) -> Optional[str]:
+    """Формат по расширению файла"""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in FORMATS else None
+
+
+def iter_rows(submitted_only: bool = False) -> Iterator[list]:
+    """Строки анкет в колонках таблицы; последняя колонка — время отправки"""
+    for user_id, form_data, submitted_at in iter_forms(submitted_only, EXPORT_BATCH_SIZE):
+        row = format_sheet_row(json.loads(form_data), user_id)
+        row.append(submitted_at or "")
+        yield row
+
+
+def _headers() -> list:
+    return get_headers() + ["Отправлена"]
+
+
+def _write_csv(path: str, rows: Iterator[list]) -> int:
+    count = 0
+    # utf-8-sig: Excel открывает файл с кириллицей без выбора кодировки
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(_headers())
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _write_xlsx(path: str, rows: Iterator[list]) -> int:
+    # В режиме write_only строки сразу уходят во временный файл, а не копятся в памяти
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Анкеты")
+    sheet.append(_headers())
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+
+def _write_parquet(path: str, rows: Iterator[list]) -> int:
+    headers = _headers()
+    schema = pyarrow.schema([(name, pyarrow.string()) for name in headers])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                writer.write_batch(_record_batch(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_record_batch(batch, schema))
+            count += len(batch)
+    return count
+
+
+def _record_batch(rows: list, schema) -> "pyarrow.RecordBatch":
+    columns = [[str(value) for value in column] for column in zip(*rows)]
+    return pyarrow.RecordBatch.from_arrays([pyarrow.array(column, pyarrow.string()) for column in columns],
+                                           schema=schema)
+
+
+WRITERS = {
+    "csv": _write_csv,
+    "xlsx": _write_xlsx,
+    "parquet": _write_parquet,
+}
+
+
+def export_forms_to_file(path: str, fmt: Optional[str] = None, submitted_only: bool = False) -> int:
+    """Выгружает анкеты в файл. Возвращает число выгруженных анкет.
+
+    Формат определяется по расширению, если не указан явно. Если для формата
+    не установлена библиотека, выбрасывает RuntimeError.
+    """
+    fmt = fmt or format_from_path(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt} (доступны: {', '.join(FORMATS)})")
+    if fmt not in available_formats():
+        package = "openpyxl" if fmt == "xlsx" else "pyarrow"
+        raise RuntimeError(f"Для выгрузки в {fmt} установите {package}: pip install {package}")
+
+    # Пишем во временный файл, чтобы при ошибке не оставить обрезанную выгрузку
+    tmp_path = f"{path}.tmp"
+    try:
+        count = WRITERS[fmt](tmp_path, iter_rows(submitted_only))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"Выгружено анкет: {count} в {path} ({fmt})")
+    return count
@@ -0,0 +1,330 @@
+"""Хранилище FSM в SQLite
+
+Состояния и данные FSM живут в памяти (как в MemoryStorage), а изменения
+пачками записываются в таблицу fsm_states. Анкету (form_data) сохраняют
+обработчики анкеты (utils.save_form_data) в конце каждого раздела, поэтому
+в fsm_states она записывается, только пока в ней есть несохраненные ответы
+(раздел не закончен) — так они переживают падение и перезапуск. Число сессий в памяти ограничено: давно
+неактивные и самые старые сессии выгружаются и подгружаются обратно при
+следующем обновлении от пользователя, поэтому потребление памяти не растет
+со временем. При выгрузке несохраненные ответы анкеты записываются в forms
+через буфер отложенной записи.
+
+UserEventIsolation обрабатывает обновления одного пользователя строго по
+очереди: обработчики анкеты читают данные FSM, меняют их и записывают
+обратно, и два быстрых ответа (двойное нажатие кнопки, пачка фото) иначе
+перетирали бы изменения друг друга.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
+
+from config import FSM_FLUSH_INTERVAL_MS, FSM_MAX_SESSIONS, FSM_IDLE_TTL
+from database import VERSION_KEY, run_read, run_write
+from form_buffer import form_buffer
+from utils import load_form_data
+
+logger = logging.getLogger(__name__)
+
+
+def _dump_key(key: StorageKey) -> str:
+    return json.dumps([key.bot_id, key.chat_id, key.user_id, key.thread_id,
+                       key.business_connection_id, key.destiny])
+
+
+class _Record:
+    __slots__ = ("state", "data", "size", "unsaved")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.data = data if data is not None else {}
+        # Примерный размер данных в байтах (по длине JSON при последней записи)
+        self.size = 0
+        # В анкете есть ответы, которых нет в forms (по последней записи в fsm_states)
+        self.unsaved = False
+
+
+def _load_state(conn: sqlite3.Connection, key: str):
+    return conn.execute(
+        "SELECT state, data, spilled_form FROM fsm_states WHERE key = ?", (key,)
+    ).fetchone()
+
+
+def _answers(form_data: dict) -> dict:
+    return {name: value for name, value in form_data.items() if name != VERSION_KEY}
+
+
+def _form_saved(conn: sqlite3.Connection, user_id: int, form_data: dict) -> bool:
+    row = conn.execute("SELECT form_data FROM forms WHERE user_id = ?", (user_id,)).fetchone()
+    return row is not None and json.loads(row[0]) == _answers(form_data)
+
+
+def _write_states(conn: sqlite3.Connection, upserts: list, deletes: list) -> set:
+    """Записывает сессии. Возвращает ключи тех, чья анкета с несохраненными ответами.
+
+    upserts — (ключ, user_id, состояние, данные без анкеты, данные с анкетой или None).
+    Анкета, которая уже есть в forms, не записывается (spilled_form = 1),
+    иначе данные записываются вместе с ней.
+    """
+    now = datetime.now().isoformat()
+    rows, unsaved = [], set()
+    for key, user_id, state, data, full_data in upserts:
+        spilled = 0
+        if full_data is not None:
+            if _form_saved(conn, user_id, json.loads(full_data)["form_data"]):
+                spilled = 1
+            else:
+                data = full_data
+                unsaved.add(key)
+        rows.append((key, user_id, state, data, spilled, now))
+    conn.executemany("""
+        INSERT INTO fsm_states (key, user_id, state, data, spilled_form, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE
+        SET state = excluded.state, data = excluded.data,
+            spilled_form = excluded.spilled_form, updated_at = excluded.updated_at
+    """, rows)
+    conn.executemany("DELETE FROM fsm_states WHERE key = ?", [(key,) for key in deletes])
+    return unsaved
+
+
+async def _form_changed(user_id: int, form_data: dict) -> bool:
+    """Отличается ли анкета сессии от сохраненной (в буфере записи или в forms)"""
+    saved = await load_form_data(user_id)
+    return _answers(saved) != _answers(form_data)
+
+
+async def _restore_form(user_id: int, form_data: dict) -> Tuple[dict, bool]:
+    """Анкета из fsm_states с несохраненными ответами. Возвращает (анкета, есть ли несохраненные ответы)"""
+    saved = await load_form_data(user_id)
+    if _answers(saved) == _answers(form_data):
+        return saved, False
+    # Версию увеличивает запись в буфер; если буфер не успел записать анкету
+    # до падения, в forms осталась прежняя версия — иначе анкета считалась бы устаревшей
+    if form_data.get(VERSION_KEY, 0) > saved.get(VERSION_KEY, 0):
+        form_data[VERSION_KEY] = saved.get(VERSION_KEY, 0)
+    return form_data, True
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище с ограниченным горячим слоем в памяти и пакетной записью в SQLite"""
+
+    def __init__(self, flush_interval_ms: int = FSM_FLUSH_INTERVAL_MS,
+                 max_sessions: int = FSM_MAX_SESSIONS, idle_ttl: int = FSM_IDLE_TTL):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # Порядок ключей — от давно неиспользуемых к недавним
+        self._records: "OrderedDict[StorageKey, _Record]" = OrderedDict()
+        self._last_access: Dict[StorageKey, float] = {}
+        self._dirty: set = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.evictions = 0
+
+    def start(self):
+        """Запускает фоновую запись и выгрузку сессий"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="fsm-storage")
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        record = self._records.get(key)
+        if record is None:
+            record = await self._load_record(key)
+        self._records.move_to_end(key)
+        self._last_access[key] = time.monotonic()
+        return record
+
+    async def _load_record(self, key: StorageKey) -> _Record:
+        """Подгружает выгруженную сессию (или создает пустую)"""
+        row = await run_read(_load_state, _dump_key(key))
+        data, form_data, unsaved = {}, None, False
+        if row:
+            data = json.loads(row[1])
+            if row[2]:
+                form_data = await load_form_data(key.user_id)
+            elif data.get("form_data"):
+                form_data, unsaved = await _restore_form(key.user_id, data["form_data"])
+
+        # Пока шло чтение, сессию могли создать в другом обработчике
+        record = self._records.get(key)
+        if record is not None:
+            return record
+
+        record = _Record()
+        if row:
+            record.state = row[0]
+            record.data = data
+            record.size = len(row[1])
+            record.unsaved = unsaved
+            if form_data is not None:
+                record.data["form_data"] = form_data
+            self.loads += 1
+        self._records[key] = record
+        return record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._dirty.add(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get_record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._dirty.add(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get_record(key)
+        return record.data.copy()
+
+    async def flush(self):
+        """Записывает измененные сессии одной транзакцией"""
+        async with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            upserts, deletes = [], []
+            for key in dirty:
+                record = self._records.get(key)
+                if record is None:
+                    continue
+                if record.state is None and not record.data:
+                    deletes.append(_dump_key(key))
+                    continue
+                # Сохраненную анкету храним только в forms, с несохраненными ответами — и в fsm_states
+                form_data = record.data.get("form_data")
+                rest = {name: value for name, value in record.data.items() if name != "form_data"}
+                payload = json.dumps(rest, ensure_ascii=False)
+                full_payload = json.dumps(record.data, ensure_ascii=False) if form_data else None
+                record.size = len(full_payload or payload)
+                upserts.append((_dump_key(key), key.user_id, record.state, payload, full_payload))
+            try:
+                unsaved = await run_write(_write_states, upserts, deletes)
+            except Exception as e:
+                logger.error(f"Ошибка при записи состояний FSM ({len(dirty)} шт.): {e}", exc_info=True)
+                self._dirty |= dirty
+                return
+            for key in dirty:
+                record = self._records.get(key)
+                if record is not None:
+                    record.unsaved = _dump_key(key) in unsaved
+
+    async def evict(self) -> int:
+        """Выгружает неактивные сессии и сессии сверх лимита. Возвращает их число.
+
+        Ответы анкеты, еще не сохраненные обработчиками (раздел не закончен),
+        записываются в forms. Анкета, которая не менялась после сохранения,
+        не перезаписывается.
+        """
+        deadline = time.monotonic() - self.idle_ttl
+        over_limit = len(self._records) - self.max_sessions
+        candidates = []
+        for key in self._records:
+            if over_limit <= 0 and self._last_access.get(key, 0) > deadline:
+                break
+            if key in self._dirty:
+                # Еще не записана — выгрузим после следующего сброса
+                continue
+            candidates.append(key)
+            over_limit -= 1
+
+        evicted = 0
+        for key in candidates:
+            record = self._records.get(key)
+            if record is None:
+                continue
+            accessed = self._last_access.get(key)
+            form_data = record.data.get("form_data")
+            changed = record.unsaved and bool(form_data) and await _form_changed(key.user_id, form_data)
+            # Пока сравнивали анкету, пользователь мог продолжить работу с сессией
+            if self._records.get(key) is not record or self._last_access.get(key) != accessed \
+                    or key in self._dirty:
+                continue
+            if changed:
+                form_buffer.put(key.user_id, form_data)
+            del self._records[key]
+            self._last_access.pop(key, None)
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"FSM: выгружено сессий: {evicted}, в памяти: {len(self._records)}")
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Число сессий в памяти и их примерный размер"""
+        return {
+            "sessions": len(self._records),
+            "approx_bytes": sum(record.size for record in self._records.values()),
+            "dirty": len(self._dirty),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # Отмена задачи не должна прерывать уже начатую запись
+            await asyncio.shield(self.flush())
+            await self.evict()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        # Несохраненные ответы анкеты записываются при остановке буфера (после close)
+        for key, record in list(self._records.items()):
+            form_data = record.data.get("form_data")
+            if record.unsaved and form_data and await _form_changed(key.user_id, form_data):
+                form_buffer.put(key.user_id, form_data)
+
+
+class UserEventIsolation(BaseEventIsolation):
+    """Блокировка на ключ FSM (чат + пользователь); освобожденные блокировки удаляются.
+
+    В отличие от SimpleEventIsolation из aiogram не накапливает блокировки
+    всех когда-либо писавших пользователей. Обновления разных пользователей
+    по-прежнему обрабатываются параллельно.
+    """
+
+    def __init__(self):
+        self._locks: Dict[StorageKey, asyncio.Lock] = {}
+        # Сколько обновлений по ключу сейчас обрабатывается или ждет очереди
+        self._holders: Dict[StorageKey, int] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key]
+                del self._locks[key]
+
+    async def close(self) -> None:
+        self._locks.clear()
+        self._holders.clear()
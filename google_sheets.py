@@ -2,9 +2,20 @@
 import gspread
 import gspread.exceptions
 from google.oauth2.service_account import Credentials
+import hashlib
 import os
+import re
 import logging
+import threading
+import time
 from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from gspread.utils import rowcol_to_a1
+
+from config import SHEETS_QUOTA_PER_USER, SHEETS_QUOTA_PER_PROJECT, SHEETS_ROW_INDEX_TTL
+from rate_limit import TokenBucket
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -45,94 +56,327 @@ def get_service_account_email():
         return None
 
 
-def save_form_to_sheets(spreadsheet_id: str, form_data: dict, user_id: int):
-    """Сохраняет данные анкеты в Google Sheets таблицу"""
+# Лист, в который записываются анкеты
+WORKSHEET_TITLE = "Анкеты"
+
+# Число колонок в таблице (14 полей согласно ТЗ)
+COLUMNS_COUNT = 14
+
+# Коды ответа, после которых кэшированные таблица и лист считаются недействительными
+# (таблицу/лист удалили или у сервисного аккаунта отозвали доступ)
+STALE_HANDLE_STATUSES = (403, 404)
+
+# Чтение всего листа: строк в одном диапазоне и диапазонов в одном запросе batch_get
+READ_RANGE_ROWS = 5000
+READ_RANGES_PER_CALL = 4
+
+
+def _api_status(error: gspread.exceptions.APIError) -> Optional[int]:
+    return getattr(error.response, "status_code", None)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Ошибка, которая пройдет сама: превышение квоты (429), сбой на стороне Google (5xx) или сети"""
+    if isinstance(error, gspread.exceptions.APIError):
+        status = _api_status(error)
+        return status == 429 or (status is not None and status >= 500)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Сколько секунд просит подождать Google (заголовок Retry-After), если просит"""
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
     try:
-        logger.info(f"Попытка сохранить анкету пользователя {user_id} в Google Sheets")
-        
-        if not spreadsheet_id:
-            error_msg = "Ошибка: GOOGLE_SHEETS_ID не указан в .env файле"
-            logger.error(error_msg)
-            print(error_msg)
-            return False
-        
-        logger.info(f"Используется spreadsheet_id: {spreadsheet_id[:20]}...")
-        
-        try:
-            client = get_sheets_client()
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+READ = "read"
+WRITE = "write"
+
+
+class SheetsQuota:
+    """Квоты Sheets API: чтение и запись считаются отдельно, каждая — на пользователя и на проект"""
+
+    def __init__(self, per_user: int, per_project: int):
+        self._buckets = {
+            kind: (TokenBucket(per_user / 60, per_user), TokenBucket(per_project / 60, per_project))
+            for kind in (READ, WRITE)
+        }
+
+    def acquire(self, kind: str):
+        """Ждет, пока запрос укладывается во все квоты"""
+        for bucket in self._buckets[kind]:
+            bucket.acquire()
+
+    def waited(self) -> float:
+        """Сколько секунд запросы суммарно ждали квоты"""
+        return sum(bucket.waited for buckets in self._buckets.values() for bucket in buckets)
+
+
+# Общие для всех запросов процесса квоты
+sheets_quota = SheetsQuota(SHEETS_QUOTA_PER_USER, SHEETS_QUOTA_PER_PROJECT)
+
+
+class SheetsSession:
+    """Долгоживущее подключение к таблице анкет.
+
+    Клиент (вместе с учетными данными) создается один раз: токен обновляется
+    самим клиентом только по истечении срока. Таблица, лист и наличие
+    заголовков запоминаются, поэтому запись анкеты — один запрос к API.
+    Закэшированные объекты перезапрашиваются только после ответа 404/403.
+    Каждый запрос к API проходит через общие квоты sheets_quota.
+    """
+
+    def __init__(self, spreadsheet_id: str, row_index_ttl: float = SHEETS_ROW_INDEX_TTL):
+        self.spreadsheet_id = spreadsheet_id
+        self.row_index_ttl = row_index_ttl
+        self._lock = threading.Lock()
+        self._client: Optional[gspread.Client] = None
+        self._worksheet: Optional[gspread.Worksheet] = None
+        self._headers_checked = False
+        # Номер строки листа по ID пользователя (колонка A) и время его загрузки
+        self._row_index: Optional[Dict[str, int]] = None
+        self._row_index_loaded = 0.0
+
+    def _get_client(self) -> gspread.Client:
+        if self._client is None:
+            self._client = _client_factory()
             logger.info("Клиент Google Sheets успешно создан")
-        except Exception as e:
-            error_msg = f"Ошибка при создании клиента Google Sheets: {e}"
-            logger.error(error_msg, exc_info=True)
-            print(error_msg)
-            return False
-        
-        # Пробуем открыть таблицу по ID
-        try:
-            spreadsheet = client.open_by_key(spreadsheet_id)
-            logger.info(f"Таблица успешно открыта: {spreadsheet.title}")
-        except gspread.exceptions.SpreadsheetNotFound:
-            service_email = get_service_account_email()
-            error_msg = f"Ошибка: Таблица с ID '{spreadsheet_id}' не найдена."
-            logger.error(error_msg)
-            print(error_msg)
-            print("\nПроверьте:")
-            print("1. Правильность ID таблицы в .env файле (GOOGLE_SHEETS_ID)")
-            print("   ID можно взять из URL таблицы: https://docs.google.com/spreadsheets/d/ID_ТАБЛИЦЫ/edit")
-            if service_email:
-                print(f"2. Поделитесь таблицей с сервисным аккаунтом: {service_email}")
-                print("   (Права: Редактор или Редактор с комментариями)")
-            else:
-                print("2. Поделитесь таблицей с email сервисного аккаунта из credentials.json")
-            return False
-        except Exception as e:
-            error_msg = f"Ошибка при открытии таблицы: {e}"
-            logger.error(error_msg, exc_info=True)
-            print(error_msg)
-            return False
-        
-        # Получаем первый лист (или лист "Анкеты" если есть)
+        return self._client
+
+    def _open_worksheet(self) -> gspread.Worksheet:
+        client = self._get_client()
+        sheets_quota.acquire(READ)
+        spreadsheet = client.open_by_key(self.spreadsheet_id)
+        logger.info(f"Таблица успешно открыта: {spreadsheet.title}")
+        # Получаем лист "Анкеты" (или первый лист, переименовав его)
         try:
-            worksheet = spreadsheet.worksheet("Анкеты")
+            sheets_quota.acquire(READ)
+            return spreadsheet.worksheet(WORKSHEET_TITLE)
         except gspread.exceptions.WorksheetNotFound:
             try:
                 worksheet = spreadsheet.sheet1  # Используем первый лист по умолчанию
                 # Переименовываем первый лист
-                worksheet.update_title("Анкеты")
+                sheets_quota.acquire(WRITE)
+                worksheet.update_title(WORKSHEET_TITLE)
+                return worksheet
             except:
-                worksheet = spreadsheet.add_worksheet(title="Анкеты", rows=1000, cols=100)
-        
+                sheets_quota.acquire(WRITE)
+                return spreadsheet.add_worksheet(title=WORKSHEET_TITLE, rows=1000, cols=100)
+
+    def _check_headers(self, worksheet: gspread.Worksheet):
         # Проверяем, есть ли заголовки. Если нет - добавляем
         try:
+            sheets_quota.acquire(READ)
             headers = worksheet.row_values(1)
-            if not headers or len(headers) == 0:
-                # Добавляем заголовки
-                headers_list = get_headers()
-                worksheet.insert_row(headers_list, 1)
-        except:
-            # Если не удалось прочитать заголовки, добавляем их
-            headers_list = get_headers()
-            worksheet.insert_row(headers_list, 1)
+        except gspread.exceptions.APIError as e:
+            if _api_status(e) in STALE_HANDLE_STATUSES or is_transient_error(e):
+                raise
+            headers = []
+        if not headers:
+            sheets_quota.acquire(WRITE)
+            worksheet.insert_row(get_headers(), 1)
+
+    def worksheet(self) -> gspread.Worksheet:
+        """Возвращает лист анкет (с проверенными заголовками)"""
+        if self._worksheet is None:
+            self._worksheet = self._open_worksheet()
+            self._headers_checked = False
+        if not self._headers_checked:
+            self._check_headers(self._worksheet)
+            self._headers_checked = True
+        return self._worksheet
+
+    def reset(self):
+        """Забывает таблицу, лист и индекс строк (клиент и токен остаются)"""
+        self._worksheet = None
+        self._headers_checked = False
+        self._row_index = None
+
+    def call(self, func: Callable[[gspread.Worksheet], Any], kind: Optional[str] = WRITE) -> Any:
+        """Вызывает func(лист) — один запрос вида kind (READ/WRITE).
+
+        С kind=None func сама учитывает квоты своих запросов.
+        При 404/403 один раз перезапрашивает таблицу и лист.
+        """
+        with self._lock:
+            worksheet = self.worksheet()
+            if kind:
+                sheets_quota.acquire(kind)
+            try:
+                return func(worksheet)
+            except gspread.exceptions.APIError as e:
+                if _api_status(e) not in STALE_HANDLE_STATUSES:
+                    raise
+                logger.warning(f"Google Sheets ответил {_api_status(e)}, повторное открытие таблицы")
+                self.reset()
+                worksheet = self.worksheet()
+                if kind:
+                    sheets_quota.acquire(kind)
+                return func(worksheet)
+
+    def _get_row_index(self, worksheet: gspread.Worksheet) -> Dict[str, int]:
+        """Индекс строк по ID пользователя: одно чтение колонки A, затем обновляется при записи.
+
+        Раз в row_index_ttl секунд перечитывается, чтобы учесть строки,
+        удаленные или переставленные в таблице вручную.
+        """
+        if self._row_index is None or time.monotonic() - self._row_index_loaded > self.row_index_ttl:
+            sheets_quota.acquire(READ)
+            ids = worksheet.col_values(1)
+            # Первая строка — заголовки; при дублях берем последнюю строку пользователя
+            self._row_index = {user_id: number for number, user_id in enumerate(ids, start=1)
+                               if number > 1 and user_id}
+            self._row_index_loaded = time.monotonic()
+        return self._row_index
+
+    def _write(self, worksheet: gspread.Worksheet, updates: Dict[int, list], appends: list):
+        """Перезаписывает строки updates (номер строки -> значения) одним запросом
+        и добавляет appends в конец листа вторым"""
+        if updates:
+            sheets_quota.acquire(WRITE)
+            worksheet.batch_update([{"range": _row_range(number), "values": [row]}
+                                    for number, row in updates.items()])
+        if appends:
+            sheets_quota.acquire(WRITE)
+            response = worksheet.append_rows(appends)
+            first = _first_appended_row(response)
+            if first is None:
+                # Не удалось понять, куда легли строки — перечитаем индекс при следующей записи
+                self._row_index = None
+            elif self._row_index is not None:
+                for offset, row in enumerate(appends):
+                    self._row_index[row[0]] = first + offset
+
+    def _upsert(self, worksheet: gspread.Worksheet, rows: list):
+        index = self._get_row_index(worksheet)
+        updates, appends = {}, []
+        for row in rows:
+            number = index.get(row[0])
+            if number is None:
+                appends.append(row)
+            else:
+                updates[number] = row
+        self._write(worksheet, updates, appends)
+
+    def _read_rows(self, worksheet: gspread.Worksheet) -> Dict[int, list]:
+        rows = {}
+        start = 2
+        while True:
+            starts = range(start, start + READ_RANGE_ROWS * READ_RANGES_PER_CALL, READ_RANGE_ROWS)
+            sheets_quota.acquire(READ)
+            value_ranges = worksheet.batch_get([_rows_range(first, first + READ_RANGE_ROWS - 1)
+                                                for first in starts])
+            for first, values in zip(starts, value_ranges):
+                for offset, row in enumerate(values):
+                    if any(row):
+                        rows[first + offset] = row
+            # API не возвращает пустые строки в конце диапазона: неполный последний диапазон — конец данных
+            if len(value_ranges) < len(starts) or len(value_ranges[-1]) < READ_RANGE_ROWS:
+                break
+            start = starts[-1] + READ_RANGE_ROWS
+        # Заодно обновляем индекс строк по ID пользователя
+        self._row_index = {row[0]: number for number, row in sorted(rows.items()) if row[0]}
+        self._row_index_loaded = time.monotonic()
+        return rows
+
+    def upsert_rows(self, rows: list):
+        """Записывает строки анкет: строки уже выгруженных пользователей (по ID в колонке A)
+        перезаписываются на месте одним запросом, остальные добавляются в конец"""
+        self.call(lambda worksheet: self._upsert(worksheet, rows), kind=None)
+
+    def read_rows(self) -> Dict[int, list]:
+        """Все непустые строки листа, кроме заголовков: номер строки -> значения.
+
+        Лист читается большими диапазонами — один запрос на
+        READ_RANGE_ROWS * READ_RANGES_PER_CALL строк.
+        """
+        return self.call(self._read_rows, kind=None)
+
+    def write_rows(self, updates: Dict[int, list], appends: list):
+        """Перезаписывает строки с заданными номерами и добавляет новые — не больше двух запросов"""
+        self.call(lambda worksheet: self._write(worksheet, updates, appends), kind=None)
+
+
+def _rows_range(first: int, last: int) -> str:
+    return f"{rowcol_to_a1(first, 1)}:{rowcol_to_a1(last, COLUMNS_COUNT)}"
+
+
+def _row_range(number: int) -> str:
+    return _rows_range(number, number)
+
+
+def _first_appended_row(response: dict) -> Optional[int]:
+    """Номер первой добавленной строки из ответа values.append (updates.updatedRange вида 'Анкеты'!A5:N7)"""
+    updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+    match = re.search(r"![A-Z]+(\d+)", updated_range)
+    return int(match.group(1)) if match else None
+
+
+_sessions: Dict[str, SheetsSession] = {}
+_sessions_lock = threading.Lock()
+
+# Создает клиент gspread; подменяется, чтобы работать без настоящего API
+# (см. scripts/fake_sheets.py)
+_client_factory: Callable[[], gspread.Client] = get_sheets_client
+
+
+def set_client_factory(factory: Callable[[], Any]):
+    """Подменяет создание клиента gspread и сбрасывает открытые подключения"""
+    global _client_factory
+    with _sessions_lock:
+        _client_factory = factory
+        _sessions.clear()
+
+
+def get_sheets_session(spreadsheet_id: str) -> SheetsSession:
+    """Возвращает общее для процесса подключение к таблице"""
+    with _sessions_lock:
+        session = _sessions.get(spreadsheet_id)
+        if session is None:
+            session = _sessions[spreadsheet_id] = SheetsSession(spreadsheet_id)
+        return session
+
+
+def save_form_to_sheets(spreadsheet_id: str, form_data: dict, user_id: int):
+    """Сохраняет данные анкеты в Google Sheets таблицу"""
+    try:
+        logger.info(f"Попытка сохранить анкету пользователя {user_id} в Google Sheets")
         
-        # Подготавливаем данные для записи
-        row_data = format_form_data_to_row(form_data, user_id)
+        if not spreadsheet_id:
+            error_msg = "Ошибка: GOOGLE_SHEETS_ID не указан в .env файле"
+            logger.error(error_msg)
+            print(error_msg)
+            return False
         
-        # Проверяем количество колонок (14 полей согласно ТЗ)
-        if len(row_data) < 14:
-            # Дополняем пустыми значениями до нужного количества
-            row_data.extend([""] * (14 - len(row_data)))
-        elif len(row_data) > 14:
-            # Обрезаем до нужного количества
-            row_data = row_data[:14]
+        # Подготавливаем данные для записи
+        row_data = format_sheet_row(form_data, user_id)
         
-        # Добавляем строку в таблицу
-        logger.info(f"Добавление строки в таблицу. Данные: {len(row_data)} колонок")
-        worksheet.append_row(row_data)
+        # Добавляем строку в таблицу (или обновляем строку этого пользователя)
+        logger.info(f"Запись строки в таблицу. Данные: {len(row_data)} колонок")
+        get_sheets_session(spreadsheet_id).upsert_rows([row_data])
         
         success_msg = f"Данные успешно записаны в Google Sheets для пользователя {user_id}"
         logger.info(success_msg)
         print(success_msg)
         return True
+    except gspread.exceptions.SpreadsheetNotFound:
+        service_email = get_service_account_email()
+        error_msg = f"Ошибка: Таблица с ID '{spreadsheet_id}' не найдена."
+        logger.error(error_msg)
+        print(error_msg)
+        print("\nПроверьте:")
+        print("1. Правильность ID таблицы в .env файле (GOOGLE_SHEETS_ID)")
+        print("   ID можно взять из URL таблицы: https://docs.google.com/spreadsheets/d/ID_ТАБЛИЦЫ/edit")
+        if service_email:
+            print(f"2. Поделитесь таблицей с сервисным аккаунтом: {service_email}")
+            print("   (Права: Редактор или Редактор с комментариями)")
+        else:
+            print("2. Поделитесь таблицей с email сервисного аккаунта из credentials.json")
+        return False
     except gspread.exceptions.APIError as e:
         error_msg = f"Ошибка API Google Sheets: {e}"
         logger.error(error_msg, exc_info=True)
@@ -173,6 +417,31 @@ def get_headers():
     ]
 
 
+def format_sheet_row(form_data: dict, user_id: int) -> list:
+    """Строка для таблицы ровно из COLUMNS_COUNT колонок"""
+    row_data = format_form_data_to_row(form_data, user_id)
+    
+    # Проверяем количество колонок
+    if len(row_data) < COLUMNS_COUNT:
+        # Дополняем пустыми значениями до нужного количества
+        row_data.extend([""] * (COLUMNS_COUNT - len(row_data)))
+    elif len(row_data) > COLUMNS_COUNT:
+        # Обрезаем до нужного количества
+        row_data = row_data[:COLUMNS_COUNT]
+    return row_data
+
+
+def row_hash(row: list) -> str:
+    """Хэш содержимого строки таблицы (для сверки листа с БД).
+
+    Строка приводится к виду, в котором ее возвращает API: COLUMNS_COUNT
+    строковых значений, пустые ячейки в конце не отличаются от отсутствующих.
+    """
+    cells = ["" if value is None else str(value) for value in row[:COLUMNS_COUNT]]
+    cells.extend([""] * (COLUMNS_COUNT - len(cells)))
+    return hashlib.blake2b("\x1f".join(cells).encode(), digest_size=16).hexdigest()
+
+
 def format_form_data_to_row(form_data: dict, user_id: int) -> list:
     """Форматирует данные анкеты в строку для таблицы (минимальные поля согласно ТЗ)"""
     row = []
@@ -181,7 +450,9 @@ def format_form_data_to_row(form_data: dict, user_id: int) -> list:
     row.append(str(user_id))
     
     # Дата заполнения
-    filled_at = form_data.get("filled_at", datetime.now().strftime("%d.%m.%Y"))
+    filled_at = form_data.get("filled_at")
+    if filled_at is None:
+        filled_at = datetime.now().strftime("%d.%m.%Y")
     if isinstance(filled_at, str) and "T" in filled_at:
         # Если ISO формат, конвертируем
         try:
@@ -0,0 +1,234 @@
+import asyncio
+import html
+import logging
+import os
+from datetime import datetime
+from aiogram import Dispatcher, F
+from aiogram.filters import Command, CommandObject, Filter
+from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardButton, TelegramObject
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from config import ADMIN_ID, DATA_DIR
+from admin_notify import format_candidate
+from broadcast import broadcaster, describe_filters, format_progress, parse_filters
+from database import (
+    SEARCH_RANK_LIMIT, cancel_broadcast, count_forms, create_broadcast, get_broadcasts, search_forms, start_broadcast
+)
+from form_buffer import form_buffer
+from form_fields import search_query
+from forms_export import available_formats, export_forms_to_file
+from keyboards import get_broadcast_keyboard
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_DIR = os.path.join(DATA_DIR, "exports")
+
+# Результатов поиска на странице
+FIND_PAGE_SIZE = 10
+
+# Последний запрос /find каждого администратора — для кнопок перелистывания
+_find_queries: dict = {}
+
+
+def is_admin(user_id: int) -> bool:
+    """Является ли пользователь администратором бота (ADMIN_ID в .env)"""
+    return bool(ADMIN_ID) and str(user_id) == ADMIN_ID.strip()
+
+
+class IsAdmin(Filter):
+    """Фильтр команд администратора: обновления остальных пользователей проходят к другим обработчикам"""
+
+    async def __call__(self, event: TelegramObject) -> bool:
+        from_user = getattr(event, "from_user", None)
+        return from_user is not None and is_admin(from_user.id)
+
+
+async def cmd_export(message: Message, command: CommandObject):
+    """Выгрузка всех анкет файлом: /export [csv|xlsx|parquet] [sent]"""
+    args = (command.args or "").lower().split()
+    formats = available_formats()
+    fmt = next((arg for arg in args if arg in ("csv", "xlsx", "parquet")), formats[0])
+    submitted_only = "sent" in args
+    if fmt not in formats:
+        await message.answer(f"❌ Формат {fmt} недоступен на сервере. Доступны: {', '.join(formats)}")
+        return
+
+    await message.answer("⏳ Готовлю выгрузку анкет...")
+    # Черновики из буфера записываем сразу, чтобы они попали в выгрузку
+    if form_buffer.running:
+        await form_buffer.flush()
+
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    filename = f"anketa_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    path = os.path.join(EXPORTS_DIR, filename)
+    try:
+        count = await asyncio.to_thread(export_forms_to_file, path, fmt, submitted_only)
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📊 Анкет: {count}" + (" (только отправленные)" if submitted_only else "")
+        )
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки анкет: {e}", exc_info=True)
+        await message.answer(f"❌ Не удалось выгрузить анкеты: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+FILTERS_HELP = (
+    "Фильтры (все необязательны):\n"
+    "status=submitted|draft — отправили анкету или нет\n"
+    "citizenship=ru|foreign — гражданство\n"
+    "city=Москва — город (пробелы через _, например city=Нижний_Новгород)\n"
+    "ready=2026-11 — месяц начала вахты (или ready_from=2026-11-01 ready_to=2026-11-15)\n"
+    "progress=50 — заполнено не меньше 50% анкеты\n"
+    "phone=89001234567 — телефон\n"
+    "from=2026-10-01 to=2026-10-31 — дата последнего изменения анкеты"
+)
+
+BROADCAST_HELP = (
+    "Рассылка: /broadcast [фильтры], текст сообщения — со следующей строки.\n\n"
+    f"{FILTERS_HELP}\n\n"
+    "Пример:\n/broadcast status=draft citizenship=ru\nПожалуйста, заполните раздел 4 анкеты"
+)
+
+
+async def cmd_count(message: Message, command: CommandObject):
+    """Число анкет по фильтрам: /count citizenship=foreign city=Москва ready=2026-11"""
+    try:
+        filters = parse_filters(command.args or "")
+    except ValueError as e:
+        await message.answer(f"❌ {e}\n\n{FILTERS_HELP}")
+        return
+    count = await count_forms(filters)
+    await message.answer(f"📊 Анкет: {count} ({describe_filters(filters)})")
+
+
+async def cmd_broadcast(message: Message, command: CommandObject):
+    """Создание рассылки: /broadcast [фильтры]\nтекст. Отправка — после подтверждения кнопкой"""
+    args = (command.args or "").partition("\n")[0]
+    # Текст берем с разметкой, чтобы сохранить форматирование сообщения администратора
+    text = message.html_text.partition("\n")[2].strip()
+    if not text:
+        await message.answer(BROADCAST_HELP)
+        return
+    try:
+        filters = parse_filters(args)
+    except ValueError as e:
+        await message.answer(f"❌ {e}\n\n{BROADCAST_HELP}")
+        return
+
+    # Черновики из буфера записываем сразу, чтобы их авторы попали в рассылку
+    if form_buffer.running:
+        await form_buffer.flush()
+    broadcast_id, total = await create_broadcast(text, filters, message.chat.id)
+    await message.answer(
+        f"📨 Рассылка №{broadcast_id}: {html.escape(describe_filters(filters))}\nПолучателей: {total}\n\n{text}",
+        parse_mode="HTML",
+        reply_markup=get_broadcast_keyboard(broadcast_id) if total else None
+    )
+
+
+async def broadcast_start_callback(callback: CallbackQuery):
+    """Подтверждение рассылки"""
+    broadcast_id = int(callback.data.split(":")[1])
+    if await start_broadcast(broadcast_id):
+        broadcaster.wake()
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.message.answer(f"🚀 Рассылка №{broadcast_id} запущена. "
+                                      f"Ход: /broadcasts, остановить: /broadcast_cancel {broadcast_id}")
+    await callback.answer()
+
+
+async def broadcast_cancel_callback(callback: CallbackQuery):
+    """Отказ от рассылки до запуска"""
+    broadcast_id = int(callback.data.split(":")[1])
+    if await cancel_broadcast(broadcast_id):
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.message.answer(f"✖️ Рассылка №{broadcast_id} отменена")
+    await callback.answer()
+
+
+async def cmd_broadcast_cancel(message: Message, command: CommandObject):
+    """Остановка рассылки: /broadcast_cancel <номер>"""
+    if not (command.args or "").strip().isdigit():
+        await message.answer("Укажите номер рассылки: /broadcast_cancel 12")
+        return
+    broadcast_id = int(command.args)
+    if await cancel_broadcast(broadcast_id):
+        await message.answer(f"✖️ Рассылка №{broadcast_id} остановлена")
+    else:
+        await message.answer(f"Рассылка №{broadcast_id} не найдена или уже завершена")
+
+
+async def cmd_broadcasts(message: Message):
+    """Последние рассылки и их ход"""
+    broadcasts = await get_broadcasts()
+    if not broadcasts:
+        await message.answer("Рассылок еще не было")
+        return
+    await message.answer("\n\n".join(f"{format_progress(broadcast)}\n{describe_filters(broadcast['filters'])}"
+                                      for broadcast in broadcasts))
+
+
+async def _send_find_page(message: Message, text: str, page: int, edit: bool = False):
+    """Страница результатов поиска (новым сообщением или вместо предыдущей страницы)"""
+    query = search_query(text)
+    if query is None:
+        await message.answer("Укажите, что искать: /find Иванов Москва")
+        return
+    total, forms = await search_forms(query, FIND_PAGE_SIZE, page * FIND_PAGE_SIZE)
+    if not total:
+        await message.answer(f"🔍 По запросу «{html.escape(text)}» ничего не найдено", parse_mode="HTML")
+        return
+    pages = (total + FIND_PAGE_SIZE - 1) // FIND_PAGE_SIZE
+    if total > SEARCH_RANK_LIMIT:
+        # Совпадений слишком много для сортировки по релевантности — показываем новые анкеты
+        found = f"найдено больше {SEARCH_RANK_LIMIT}, новые первыми (уточните запрос), страница {page + 1}"
+    else:
+        found = f"найдено {total}, страница {page + 1} из {pages}"
+    lines = [f"🔍 «{html.escape(text)}»: {found}", ""]
+    for number, form in enumerate(forms, start=page * FIND_PAGE_SIZE + 1):
+        status = "отправлена" if form["submitted_at"] else f"черновик, {form['completion'] or 0}%"
+        lines.append(f"{number}. {format_candidate(form)} ({status})")
+
+    builder = InlineKeyboardBuilder()
+    if page > 0:
+        builder.add(InlineKeyboardButton(text="◀️ Назад", callback_data=f"find:{page - 1}"))
+    if page + 1 < pages:
+        builder.add(InlineKeyboardButton(text="Вперед ▶️", callback_data=f"find:{page + 1}"))
+    markup = builder.as_markup() if pages > 1 else None
+    if edit:
+        await message.edit_text("\n".join(lines), parse_mode="HTML", reply_markup=markup,
+                                disable_web_page_preview=True)
+    else:
+        await message.answer("\n".join(lines), parse_mode="HTML", reply_markup=markup,
+                             disable_web_page_preview=True)
+
+
+async def cmd_find(message: Message, command: CommandObject):
+    """Поиск кандидатов по ФИО, городу, телефону и комментариям: /find иванов москва"""
+    text = (command.args or "").strip()
+    _find_queries[message.chat.id] = text
+    await _send_find_page(message, text, 0)
+
+
+async def find_page_callback(callback: CallbackQuery):
+    """Перелистывание результатов поиска"""
+    text = _find_queries.get(callback.message.chat.id)
+    if text is None:
+        await callback.answer("Повторите поиск: /find ...", show_alert=True)
+        return
+    await _send_find_page(callback.message, text, int(callback.data.split(":")[1]), edit=True)
+    await callback.answer()
+
+
+def register_admin_handlers(dp: Dispatcher):
+    dp.message.register(cmd_export, Command("export"), IsAdmin())
+    dp.message.register(cmd_count, Command("count"), IsAdmin())
+    dp.message.register(cmd_find, Command("find"), IsAdmin())
+    dp.message.register(cmd_broadcast, Command("broadcast"), IsAdmin())
+    dp.message.register(cmd_broadcast_cancel, Command("broadcast_cancel"), IsAdmin())
+    dp.message.register(cmd_broadcasts, Command("broadcasts"), IsAdmin())
+    dp.callback_query.register(broadcast_start_callback, F.data.startswith("broadcast_start:"), IsAdmin())
+    dp.callback_query.register(broadcast_cancel_callback, F.data.startswith("broadcast_cancel:"), IsAdmin())
+    dp.callback_query.register(find_page_callback, F.data.startswith("find:"), IsAdmin())
@@ -0,0 +1,313 @@
+"""Описание шагов анкеты
+
+Каждый шаг — это состояние FSM, поле анкеты, вопрос, клавиатура, способ
+разбора ответа и следующий шаг. Обработчик в handlers/form.py находит
+текущий шаг по состоянию и применяет его, поэтому новое поле добавляется
+одной записью в STEPS без отдельного обработчика.
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional, Union, Dict, Tuple, Any
+
+from aiogram.fsm.state import State
+
+from states import FormStates as S
+from keyboards import (
+    get_skip_keyboard, get_yes_no_keyboard, get_gender_keyboard, get_citizenship_keyboard
+)
+from config import PHOTOS_DIR, DOCUMENTS_DIR
+
+SKIP = "⏭️ Пропустить"
+BACK = "⏪ Назад"
+FOREIGNER = "Иностранец"
+
+# Виды шагов
+TEXT = "text"
+YES_NO = "yes_no"
+CHOICE = "choice"
+PHOTO = "photo"
+FILE = "file"
+
+# Следующий шаг: состояние, функция от анкеты или None (раздел завершен)
+NextStep = Union[State, Callable[[dict], Optional[State]], None]
+
+
+class InvalidAnswer(ValueError):
+    """Ответ не подходит для шага; текст ошибки отправляется пользователю"""
+
+
+@dataclass(frozen=True)
+class Step:
+    field: Tuple[str, ...]
+    prompt: str
+    section: str
+    kind: str = TEXT
+    next: NextStep = None
+    # None — возврат к выбору раздела
+    back: Optional[State] = None
+    keyboard: Callable = get_skip_keyboard
+    # Разбор ответа: получает текст, возвращает значение или бросает InvalidAnswer
+    parse: Optional[Callable[[str], Any]] = None
+    skippable: bool = False
+    # Значение, которое записывается при пропуске (None — поле не трогаем)
+    skip_value: Any = None
+    # Куда сохранять файл для PHOTO/FILE шагов
+    directory: str = ""
+    file_name: str = ""
+    # Префикс сообщения о завершении раздела, {value} — сохраненное значение
+    done: str = ""
+    # Сохранять анкету в БД сразу после шага (в конце раздела — всегда)
+    save: bool = False
+
+
+@dataclass(frozen=True)
+class Section:
+    number: int
+    title: str
+    intro: str
+    first: State
+    # Другая ветка раздела для иностранных граждан
+    foreigner: Optional["Section"] = None
+
+
+def text_step(field, prompt, section, next=None, back=None, **kwargs) -> Step:
+    return Step(field=field, prompt=prompt, section=section, next=next, back=back,
+                skippable=True, **kwargs)
+
+
+def yes_no_step(field, prompt, section, next=None, back=None, **kwargs) -> Step:
+    return Step(field=field, prompt=prompt, section=section, kind=YES_NO, next=next, back=back,
+                keyboard=get_yes_no_keyboard, **kwargs)
+
+
+def is_yes(text: str) -> bool:
+    return "Да" in text
+
+
+def require_yes(error: str, value: Any = True) -> Callable[[str], Any]:
+    """Ответ «Да» обязателен; сохраняется value"""
+    def parse(text: str):
+        if not is_yes(text):
+            raise InvalidAnswer(error)
+        return value
+    return parse
+
+
+def parse_gender(text: str) -> str:
+    return "Мужской" if "Мужской" in text else "Женский" if "Женский" in text else text
+
+
+def parse_citizenship_type(text: str) -> str:
+    if "России" in text or "Россия" in text:
+        return "Россия"
+    if "Иностранный" in text:
+        return FOREIGNER
+    raise InvalidAnswer("Пожалуйста, выберите один из предложенных вариантов.")
+
+
+def for_foreigner(foreigner_step: Optional[State], other_step: Optional[State]) -> Callable[[dict], Optional[State]]:
+    """Ветвление по citizenship_type"""
+    def choose(form_data: dict) -> Optional[State]:
+        return foreigner_step if form_data.get("citizenship_type") == FOREIGNER else other_step
+    return choose
+
+
+_PERSONAL = "Личные данные"
+_PASSPORT = "Паспортные данные"
+_CONTACTS = "Контактная информация"
+_DOCUMENTS = "Документы"
+_READINESS = "Готовность к работе"
+_CONSENTS = "Согласия"
+_COMMENTS = "Комментарии"
+_CONFIRMATIONS = "Подтверждения"
+
+
+_STEPS: Dict[State, Step] = {
+    # 1. Личные данные
+    S.waiting_for_surname: text_step(
+        ("personal_data", "surname"), "Пожалуйста, введите вашу фамилию:", _PERSONAL,
+        next=S.waiting_for_name),
+    S.waiting_for_name: text_step(
+        ("personal_data", "name"), "Введите имя:", _PERSONAL,
+        next=S.waiting_for_patronymic, back=S.waiting_for_surname),
+    S.waiting_for_patronymic: text_step(
+        ("personal_data", "patronymic"), "Введите отчество:", _PERSONAL,
+        next=S.waiting_for_birth_date, back=S.waiting_for_name),
+    S.waiting_for_birth_date: text_step(
+        ("personal_data", "birth_date"), "Введите дату рождения (ДД.ММ.ГГГГ):", _PERSONAL,
+        next=S.waiting_for_birth_place, back=S.waiting_for_patronymic),
+    S.waiting_for_birth_place: text_step(
+        ("personal_data", "birth_place"), "Введите место рождения:", _PERSONAL,
+        next=S.waiting_for_citizenship, back=S.waiting_for_birth_date),
+    S.waiting_for_citizenship: text_step(
+        ("personal_data", "citizenship"), "Введите гражданство:", _PERSONAL,
+        next=S.waiting_for_gender, back=S.waiting_for_birth_place),
+    S.waiting_for_gender: Step(
+        ("personal_data", "gender"), "Выберите пол:", _PERSONAL, kind=CHOICE,
+        back=S.waiting_for_citizenship, keyboard=get_gender_keyboard, parse=parse_gender),
+
+    # 2. Паспортные данные
+    S.waiting_for_passport_series_number: text_step(
+        ("passport_data", "series_number"), "Введите серию и номер паспорта (например: 1234 567890):", _PASSPORT,
+        next=S.waiting_for_passport_issued_by),
+    S.waiting_for_passport_issued_by: text_step(
+        ("passport_data", "issued_by"), "Введите кем выдан паспорт:", _PASSPORT,
+        next=S.waiting_for_passport_issue_date, back=S.waiting_for_passport_series_number),
+    S.waiting_for_passport_issue_date: text_step(
+        ("passport_data", "issue_date"), "Введите дату выдачи (ДД.ММ.ГГГГ):", _PASSPORT,
+        next=S.waiting_for_passport_division_code, back=S.waiting_for_passport_issued_by),
+    S.waiting_for_passport_division_code: text_step(
+        ("passport_data", "division_code"), "Введите код подразделения:", _PASSPORT,
+        next=S.waiting_for_registration_address, back=S.waiting_for_passport_issue_date),
+    S.waiting_for_registration_address: text_step(
+        ("passport_data", "registration_address"), "Введите адрес регистрации:", _PASSPORT,
+        next=S.waiting_for_actual_address, back=S.waiting_for_passport_division_code),
+    S.waiting_for_actual_address: text_step(
+        ("passport_data", "actual_address"), "Введите фактический адрес проживания:", _PASSPORT,
+        next=S.waiting_for_additional_docs, back=S.waiting_for_registration_address),
+    S.waiting_for_additional_docs: text_step(
+        ("passport_data", "additional"), "Введите дополнительно (СНИЛС, ИНН, Грин-карта):", _PASSPORT,
+        next=S.waiting_for_passport_photo, back=S.waiting_for_actual_address),
+    S.waiting_for_passport_photo: Step(
+        ("passport_data", "photo"), "Загрузите фото паспорта (отправьте фото):", _PASSPORT, kind=PHOTO,
+        back=S.waiting_for_additional_docs, skippable=True,
+        directory=PHOTOS_DIR, file_name="passport_photo.jpg", done="✅ Фото сохранено!\n"),
+
+    # 3. Контактная информация
+    S.waiting_for_phone: text_step(
+        ("contacts", "phone"), "Введите мобильный телефон (например: +7 900 123 45 67):", _CONTACTS,
+        next=S.waiting_for_citizenship_choice),
+    S.waiting_for_citizenship_choice: Step(
+        ("citizenship_type",), "Выберите ваше гражданство:", _CONTACTS, kind=CHOICE,
+        back=S.waiting_for_phone, keyboard=get_citizenship_keyboard, parse=parse_citizenship_type,
+        done="✅ Гражданство выбрано: {value}\n\n"),
+
+    # 4. Документы и разрешения
+    S.waiting_for_medical_book: yes_no_step(
+        ("documents", "medical_book"), "Есть ли у вас медицинская книжка?", _DOCUMENTS,
+        next=S.waiting_for_registration, parse=is_yes),
+    S.waiting_for_registration: yes_no_step(
+        ("documents", "registration"), "Есть ли у вас регистрация по месту пребывания?", _DOCUMENTS,
+        next=S.waiting_for_snils, back=S.waiting_for_medical_book, parse=is_yes),
+    S.waiting_for_snils: text_step(
+        ("documents", "snils"), "Введите СНИЛС:", _DOCUMENTS,
+        next=S.waiting_for_inn, back=S.waiting_for_registration),
+    S.waiting_for_inn: text_step(
+        ("documents", "inn"), "Введите ИНН:", _DOCUMENTS,
+        next=for_foreigner(S.waiting_for_foreigner_id, S.waiting_for_medical_book_file),
+        back=S.waiting_for_snils),
+    S.waiting_for_foreigner_id: text_step(
+        ("documents", "foreigner_id"), "Введите ID (для иностранных граждан):", _DOCUMENTS,
+        next=S.waiting_for_fingerprinting, back=S.waiting_for_inn),
+    S.waiting_for_fingerprinting: yes_no_step(
+        ("documents", "fingerprinting"), "Прошли ли вы дактилоскопию?", _DOCUMENTS,
+        next=S.waiting_for_medical_exam_dactyloscopy, back=S.waiting_for_foreigner_id, parse=is_yes),
+    S.waiting_for_medical_exam_dactyloscopy: yes_no_step(
+        ("documents", "medical_exam_dactyloscopy"), "Проходили ли вы медосмотр по дактилоскопии?", _DOCUMENTS,
+        next=S.waiting_for_mvd_registry_check, back=S.waiting_for_fingerprinting, parse=is_yes),
+    S.waiting_for_mvd_registry_check: yes_no_step(
+        ("documents", "mvd_registry_check"),
+        "Проверили ли вы себя в Реестре контролируемых лиц МВД? (https://мвд.рф/rkl)", _DOCUMENTS,
+        next=S.waiting_for_medical_book_file, back=S.waiting_for_medical_exam_dactyloscopy, parse=is_yes),
+    S.waiting_for_medical_book_file: Step(
+        ("documents", "files", "medical_book"), "Загрузите медицинскую книжку (отправьте файл или фото):",
+        _DOCUMENTS, kind=FILE, back=for_foreigner(S.waiting_for_mvd_registry_check, S.waiting_for_inn),
+        skippable=True, directory=DOCUMENTS_DIR, file_name="medical_book", done="✅ Файл сохранен!\n"),
+
+    # 5. Готовность к работе
+    S.waiting_for_vakhta_start_date: text_step(
+        ("readiness", "vakhta_start_date"), "Когда вы готовы начать вахту? (укажите дату или примерный период):",
+        _READINESS, next=S.waiting_for_business_trips),
+    S.waiting_for_business_trips: yes_no_step(
+        ("readiness", "business_trips"), "Готовы ли вы к командировкам / вахте?", _READINESS,
+        next=S.waiting_for_city, back=S.waiting_for_vakhta_start_date, parse=is_yes),
+    S.waiting_for_city: text_step(
+        ("readiness", "city"), "Введите город проживания:", _READINESS,
+        back=S.waiting_for_business_trips),
+
+    # 6. Согласия
+    S.waiting_for_personal_data_consent: yes_no_step(
+        ("consents", "personal_data"), "Согласны ли вы на обработку персональных данных?", _CONSENTS,
+        next=S.waiting_for_rotation_consent,
+        parse=require_yes("❌ Для продолжения необходимо дать согласие на обработку персональных данных.")),
+    S.waiting_for_rotation_consent: yes_no_step(
+        ("consents", "rotation"), "Готовы ли вы к выезду и проживанию на вахте?", _CONSENTS,
+        back=S.waiting_for_personal_data_consent, parse=is_yes),
+
+    # 7. Комментарии
+    S.waiting_for_comments: text_step(
+        ("comments",), "Если у вас есть дополнительные комментарии или вопросы, укажите их здесь (необязательно):",
+        _COMMENTS, next=for_foreigner(S.waiting_for_tuberculosis_confirmation, None),
+        skip_value="", save=True),
+
+    # 8. Подтверждения (только для иностранцев)
+    S.waiting_for_tuberculosis_confirmation: yes_no_step(
+        ("confirmations", "tuberculosis"),
+        "Подтверждаете ли вы, что у вас нет таких заболеваний как туберкулез, сифилис, ВИЧ?", _CONFIRMATIONS,
+        next=S.waiting_for_chronic_diseases_confirmation,
+        parse=require_yes("❌ Для продолжения необходимо подтвердить отсутствие заболеваний.")),
+    S.waiting_for_chronic_diseases_confirmation: yes_no_step(
+        ("confirmations", "chronic_diseases"),
+        "Подтверждаете ли вы, что у вас нет хронических заболеваний, мешающих работать на производстве?",
+        _CONFIRMATIONS, next=S.waiting_for_russia_stay_confirmation,
+        back=S.waiting_for_tuberculosis_confirmation,
+        parse=require_yes("❌ Для продолжения необходимо подтвердить отсутствие хронических заболеваний.")),
+    S.waiting_for_russia_stay_confirmation: yes_no_step(
+        ("confirmations", "russia_stay"),
+        "Подтверждаете ли вы, что в этом году находились в России менее 2 месяцев без оформления разрешающих документов?",
+        _CONFIRMATIONS, next=S.waiting_for_90_days_warning_confirmation,
+        back=S.waiting_for_chronic_diseases_confirmation,
+        # НЕТ - не находились более 2 месяцев
+        parse=require_yes("❌ Для продолжения необходимо подтвердить, что вы не находились в России "
+                          "более 2 месяцев без оформления документов.", value=False)),
+    S.waiting_for_90_days_warning_confirmation: yes_no_step(
+        ("confirmations", "90_days_warning"),
+        "Подтверждаете ли вы, что вас предупредили, что в России можно находиться без разрешающих документов "
+        "в течение года только 90 дней?",
+        _CONFIRMATIONS, next=S.waiting_for_documents_readiness,
+        back=S.waiting_for_russia_stay_confirmation, parse=is_yes),
+    S.waiting_for_documents_readiness: yes_no_step(
+        ("confirmations", "documents_readiness"),
+        "Готовы ли вы оформить разрешительные документы для работы в РФ (ИНН, СНИЛС, дактилоскопия, медицина, "
+        "российский номер)?",
+        _CONFIRMATIONS, next=S.waiting_for_self_employment_consent,
+        back=S.waiting_for_90_days_warning_confirmation, parse=is_yes),
+    S.waiting_for_self_employment_consent: yes_no_step(
+        ("confirmations", "self_employment"), "Согласны ли вы получать выплаты по системе самозанятости?",
+        _CONFIRMATIONS, next=S.waiting_for_compensation_consent,
+        back=S.waiting_for_documents_readiness, parse=is_yes),
+    S.waiting_for_compensation_consent: yes_no_step(
+        ("confirmations", "compensation"),
+        "Согласны ли вы компенсировать все затраты, связанные с вашей доставкой и оформлением в России "
+        "при досрочном расторжении договора?",
+        _CONFIRMATIONS, back=S.waiting_for_self_employment_consent, parse=is_yes),
+}
+
+# Поиск шага по строковому состоянию из FSM
+STEPS: Dict[str, Step] = {state.state: step for state, step in _STEPS.items()}
+
+
+SECTIONS: Dict[str, Section] = {
+    "section_1": Section(1, "Личные данные", "Начнем с основных данных. ", S.waiting_for_surname),
+    "section_2": Section(2, "Паспортные данные", "Переходим к паспортным данным. ",
+                         S.waiting_for_passport_series_number),
+    "section_3": Section(3, "Контактная информация", "Укажите контактные данные для связи. ", S.waiting_for_phone),
+    "section_4": Section(4, "Документы", "Проверим наличие необходимых документов. ", S.waiting_for_medical_book),
+    "section_5": Section(5, "Готовность к работе", "", S.waiting_for_vakhta_start_date),
+    "section_6": Section(6, "Согласия", "Необходимо ваше согласие на обработку данных. ",
+                         S.waiting_for_personal_data_consent),
+    "section_7": Section(7, "Комментарии / вопросы", "", S.waiting_for_comments,
+                         foreigner=Section(7, "Подтверждения (для иностранных граждан)",
+                                           "Требуется подтверждение важных сведений. ",
+                                           S.waiting_for_tuberculosis_confirmation)),
+}
+
+
+def get_step(state: Optional[State]) -> Step:
+    return STEPS[state.state]
+
+
+def resolve(target: NextStep, form_data: dict) -> Optional[State]:
+    """Возвращает состояние следующего/предыдущего шага с учетом ветвления"""
+    if callable(target) and not isinstance(target, State):
+        return target(form_data)
+    return target
@@ -77,3 +77,11 @@ def get_final_confirmation_keyboard():
     builder.add(KeyboardButton(text="❌ Отменить"))
     return builder.as_markup(resize_keyboard=True)
 
+
+def get_broadcast_keyboard(broadcast_id: int):
+    """Подтверждение рассылки администратором"""
+    builder = InlineKeyboardBuilder()
+    builder.add(InlineKeyboardButton(text="🚀 Отправить", callback_data=f"broadcast_start:{broadcast_id}"))
+    builder.add(InlineKeyboardButton(text="✖️ Отмена", callback_data=f"broadcast_cancel:{broadcast_id}"))
+    return builder.as_markup()
+
@@ -0,0 +1,209 @@
+"""Доставка заданий из outbox
+
+Задания (выгрузка анкеты в Google Sheets и т.п.) записываются в таблицу
+outbox в той же транзакции, что и сама анкета, поэтому не теряются при
+падении или перезапуске бота. Диспетчер пачками забирает подошедшие по
+времени задания каждого получателя (sink), передает их обработчику и
+удаляет выполненные; неудавшиеся откладываются с растущей паузой.
+
+Задание, которое после max_attempts попыток падает с постоянной ошибкой
+(любое исключение, кроме RetryLater), больше не повторяется: оно остается в
+outbox с отметкой failed_at и последней ошибкой. Пачка, в которой есть такие
+задания, перед этим доставляется по одному заданию, чтобы из-за одного
+испорченного задания не остановились остальные. RetryLater (квота,
+недоступность получателя) попытки не исчерпывает.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from config import (
+    OUTBOX_LEASE, OUTBOX_POLL_INTERVAL, OUTBOX_RETRY_MIN_DELAY, OUTBOX_RETRY_MAX_DELAY, OUTBOX_MAX_ATTEMPTS
+)
+from database import abandon_outbox, claim_outbox, complete_outbox, fail_outbox, next_outbox_attempts
+from rate_limit import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxEntry(NamedTuple):
+    id: int
+    ref: int
+    payload: Optional[str]
+    attempts: int
+
+
+class RetryLater(Exception):
+    """Временная ошибка получателя (квота, недоступность); delay — сколько он просит подождать"""
+
+    def __init__(self, message: str, delay: Optional[float] = None):
+        super().__init__(message)
+        self.delay = delay
+
+
+Handler = Callable[[List[OutboxEntry]], Awaitable[None]]
+
+
+class _Sink:
+    __slots__ = ("handler", "batch_size")
+
+    def __init__(self, handler: Handler, batch_size: int):
+        self.handler = handler
+        self.batch_size = batch_size
+
+
+class OutboxDispatcher:
+    """Фоновая задача, доставляющая задания outbox зарегистрированным получателям"""
+
+    def __init__(self, lease: float, poll_interval: float, retry_min_delay: float, retry_max_delay: float,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_min_delay = retry_min_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_attempts = max_attempts
+        self._sinks: Dict[str, _Sink] = {}
+        # После ошибки получатель не опрашивается до этого времени (unix),
+        # чтобы остальные его задания не упирались в ту же ошибку
+        self._paused: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.batches = 0
+        self.failed = 0
+        self.abandoned = 0
+
+    def register(self, sink: str, handler: Handler, batch_size: int):
+        """Регистрирует обработчик пачки заданий получателя sink"""
+        self._sinks[sink] = _Sink(handler, batch_size)
+
+    def wake(self):
+        """Сообщает о новых заданиях (они уже записаны в outbox)"""
+        self._wakeup.set()
+
+    def start(self):
+        """Запускает доставку (сразу забирает накопившиеся задания)"""
+        if self._task is None and self._sinks:
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._run(), name="outbox")
+
+    async def stop(self):
+        """Останавливает доставку, дождавшись текущей пачки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._current is not None:
+            await asyncio.wait([self._current])
+            self._current = None
+
+    async def dispatch(self) -> int:
+        """Доставляет все подошедшие задания. Возвращает число доставленных"""
+        delivered = 0
+        for sink, target in self._sinks.items():
+            if self._paused.get(sink, 0) > time.time():
+                continue
+            while True:
+                entries = [OutboxEntry(*row) for row in await claim_outbox(sink, target.batch_size, self.lease)]
+                if not entries:
+                    break
+                try:
+                    await target.handler(entries)
+                except Exception as e:
+                    if len(entries) > 1 and self._exhausted(entries, e):
+                        delivered += await self._deliver_one_by_one(sink, target, entries)
+                    else:
+                        await self._fail(sink, entries, e)
+                    break
+                await complete_outbox([entry.id for entry in entries])
+                delivered += len(entries)
+                self.delivered += len(entries)
+                self.batches += 1
+                if len(entries) < target.batch_size:
+                    break
+        return delivered
+
+    def _exhausted(self, entries: List[OutboxEntry], error: Exception) -> bool:
+        """Исчерпали ли попытки задания пачки, упавшей с ошибкой error"""
+        return not isinstance(error, RetryLater) and any(entry.attempts >= self.max_attempts for entry in entries)
+
+    async def _deliver_one_by_one(self, sink: str, target: _Sink, entries: List[OutboxEntry]) -> int:
+        """Доставляет пачку по одному заданию: попытки исчерпывают только задания, которые падают сами"""
+        delivered = 0
+        for index, entry in enumerate(entries):
+            try:
+                await target.handler([entry])
+            except RetryLater as e:
+                await self._fail(sink, entries[index:], e)
+                break
+            except Exception as e:
+                await self._fail(sink, [entry], e)
+                continue
+            await complete_outbox([entry.id])
+            delivered += 1
+            self.delivered += 1
+        return delivered
+
+    async def _fail(self, sink: str, entries: List[OutboxEntry], error: Exception):
+        """Откладывает пачку заданий после ошибки"""
+        self.failed += 1
+        attempts = max(entry.attempts for entry in entries)
+        if isinstance(error, RetryLater):
+            logger.warning(f"Outbox [{sink}]: {error}, попытка {attempts}")
+        else:
+            logger.error(f"Outbox [{sink}]: ошибка доставки {len(entries)} задани(й), попытка {attempts}: {error}",
+                         exc_info=True)
+        if self._exhausted(entries, error):
+            abandoned = [entry for entry in entries if entry.attempts >= self.max_attempts]
+            entries = [entry for entry in entries if entry.attempts < self.max_attempts]
+            self.abandoned += len(abandoned)
+            logger.error(f"Outbox [{sink}]: задания {[entry.ref for entry in abandoned]} не доставлены "
+                         f"за {self.max_attempts} попыток и больше не повторяются: {error}")
+            await abandon_outbox([(str(error)[:1000], entry.id) for entry in abandoned])
+            if not entries:
+                return
+        now = time.time()
+        failures = []
+        for entry in entries:
+            delay = backoff_delay(entry.attempts, self.retry_min_delay, self.retry_max_delay)
+            if isinstance(error, RetryLater) and error.delay:
+                delay = max(delay, error.delay)
+            failures.append((now + delay, str(error)[:1000], entry.id))
+        self._paused[sink] = min(retry_at for retry_at, _, _ in failures)
+        await fail_outbox(failures)
+
+    async def _wait(self):
+        """Ждет новых заданий или времени ближайшего повтора"""
+        timeout = self.poll_interval
+        next_attempts = await next_outbox_attempts()
+        for sink in self._sinks:
+            if sink in next_attempts:
+                due = max(next_attempts[sink], self._paused.get(sink, 0))
+                timeout = min(timeout, max(0.0, due - time.time()))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            # Отмена задачи не должна прерывать уже начатую доставку
+            self._current = asyncio.create_task(self.dispatch())
+            try:
+                await asyncio.shield(self._current)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox: ошибка диспетчера: {e}", exc_info=True)
+                await asyncio.sleep(self.retry_min_delay)
+            self._current = None
+            await self._wait()
+
+
+outbox = OutboxDispatcher(OUTBOX_LEASE, OUTBOX_POLL_INTERVAL, OUTBOX_RETRY_MIN_DELAY, OUTBOX_RETRY_MAX_DELAY)
@@ -0,0 +1,48 @@
+"""Ограничение частоты запросов к внешним API и задержки повторов"""
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Корзина токенов: в среднем не больше rate запросов в секунду, подряд — не больше capacity.
+
+    Потокобезопасна: запросы к Google Sheets выполняются в отдельных потоках.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Забирает токены, если они есть. Возвращает 0 или сколько секунд подождать"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """Ждет (блокируя поток), пока не появятся токены, и забирает их"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            self.waited += wait
+            time.sleep(wait)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка перед повтором номер attempt (с 1) со случайным разбросом.
+
+    Разброс не дает нескольким клиентам повторять запросы одновременно.
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
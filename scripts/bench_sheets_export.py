@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Замер скорости выгрузки анкет в Google Sheets без настоящего API
+
+Создает временную БД, отправляет в ней --forms анкет (часть из них затем
+отправляется повторно) и выгружает их в имитацию Google Sheets
+(scripts/fake_sheets.py) тем же путем, что и бот: outbox -> sheets_export
+-> SheetsSession. Печатает анкет в секунду и число запросов к API на анкету.
+
+Режим --mode per-form выгружает каждую анкету отдельным вызовом
+save_form_to_sheets — для сравнения с пакетной выгрузкой.
+
+Примеры:
+    python scripts/bench_sheets_export.py --forms 1000 --latency 0.2
+    python scripts/bench_sheets_export.py --forms 300 --quota 60 --quota-window 5 --limiter
+    python scripts/bench_sheets_export.py --forms 200 --mode per-form
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_DIR)
+
+SPREADSHEET_ID = "bench"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замер выгрузки анкет в имитацию Google Sheets")
+    parser.add_argument("--forms", type=int, default=1000, help="число анкет")
+    parser.add_argument("--resubmit", type=float, default=0.2, help="доля анкет, отправляемых повторно")
+    parser.add_argument("--mode", choices=("batch", "per-form"), default="batch")
+    parser.add_argument("--page-size", type=int, default=500, help="анкет в одном запросе (SHEETS_EXPORT_PAGE_SIZE)")
+    parser.add_argument("--latency", type=float, default=0.1, help="задержка ответа API, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--quota", type=int, default=None, help="квота имитации: запросов за окно (отдельно чтение/запись)")
+    parser.add_argument("--quota-window", type=float, default=60.0, help="окно квоты имитации, сек")
+    parser.add_argument("--limiter", action="store_true",
+                        help="ограничивать частоту запросов квотами бота (SHEETS_QUOTA_PER_*)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="максимальное время выгрузки, сек")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def make_form(user_id: int, revision: int = 0) -> dict:
+    """Анкета с полями, которые попадают в таблицу"""
+    return {
+        "filled_at": "2024-05-01T12:00:00",
+        "personal_data": {"surname": f"Иванов{user_id}", "name": "Иван", "patronymic": "Иванович",
+                          "citizenship": "РФ"},
+        "contacts": {"phone": f"+7900{user_id:07d}"},
+        "citizenship_type": "Россия",
+        "readiness": {"city": "Москва", "vakhta_start_date": "01.06.2024"},
+        "passport_data": {"series_number": f"4500 {user_id:06d}"},
+        "consents": {"personal_data": True, "rotation": True},
+        "comments": f"редакция {revision}",
+    }
+
+
+async def submit(database, users: list, revision: int):
+    """Отправляет анкеты пользователей (как при подтверждении в боте)"""
+    for start in range(0, len(users), 500):
+        forms = {}
+        for user_id in users[start:start + 500]:
+            form_data = make_form(user_id, revision)
+            form_data[database.VERSION_KEY] = revision + 1
+            forms[user_id] = (form_data, revision, True)
+        await database.save_forms_batch(forms)
+
+
+async def outbox_size(database) -> int:
+    return await database.run_read(lambda conn: conn.execute(
+        "SELECT COUNT(*) FROM outbox WHERE failed_at IS NULL").fetchone()[0])
+
+
+async def export_batch(database, args):
+    from outbox import OutboxDispatcher
+    from sheets_export import register_sheets_export
+
+    dispatcher = OutboxDispatcher(lease=300, poll_interval=1, retry_min_delay=0.2, retry_max_delay=10)
+    register_sheets_export(dispatcher)
+    dispatcher.start()
+    deadline = time.monotonic() + args.timeout
+    while await outbox_size(database) and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+    await dispatcher.stop()
+    return dispatcher.failed
+
+
+async def export_per_form(database, args):
+    from google_sheets import save_form_to_sheets
+
+    failed = 0
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        entries = await database.claim_outbox(database.OUTBOX_SHEETS, 1000, 300)
+        if not entries:
+            break
+        forms = await database.get_submitted_forms(sorted({ref for _, ref, _, _ in entries}))
+        for form in forms:
+            if await asyncio.to_thread(save_form_to_sheets, SPREADSHEET_ID, form["form_data"], form["user_id"]):
+                continue
+            failed += 1
+        await database.complete_outbox([outbox_id for outbox_id, _, _, _ in entries])
+    return failed
+
+
+async def run(args):
+    import database
+    import google_sheets
+    from fake_sheets import FakeSheets
+
+    fake = FakeSheets(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      quota_per_minute=args.quota, quota_window=args.quota_window, seed=args.seed)
+    google_sheets.set_client_factory(fake.client)
+    if not args.limiter:
+        google_sheets.sheets_quota = google_sheets.SheetsQuota(10 ** 9, 10 ** 9)
+
+    database.init_database()
+    users = list(range(1, args.forms + 1))
+    resubmitted = users[:int(len(users) * args.resubmit)]
+    export = export_batch if args.mode == "batch" else export_per_form
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await submit(database, users, revision=0)
+        failed = await export(database, args)
+        await submit(database, resubmitted, revision=1)
+        failed += await export(database, args)
+    elapsed = time.perf_counter() - started
+    left = await outbox_size(database)
+    database.close_database()
+
+    exported = len(users) + len(resubmitted)
+    rows = fake.spreadsheet(SPREADSHEET_ID).sheet1.rows[1:]
+    duplicates = sum(count - 1 for count in Counter(row[0] for row in rows).values())
+    waited = google_sheets.sheets_quota.waited()
+
+    print("=" * 60)
+    print(f"Режим: {args.mode}, анкет: {len(users)} (+{len(resubmitted)} повторных), "
+          f"задержка API: {args.latency} с")
+    print(f"Время: {elapsed:.2f} с, {exported / elapsed:.1f} анкет/с")
+    print(f"Запросов к API: {fake.total_calls} ({fake.total_calls / exported:.3f} на анкету)")
+    for method, count in fake.calls.most_common():
+        print(f"  {method}: {count}")
+    print(f"Ошибок API: 429 — {fake.errors[429]}, 503 — {fake.errors[503]}; "
+          f"неудачных пачек/анкет: {failed}; ожидание квот бота: {waited:.1f} с")
+    print(f"Строк в листе: {len(rows)}, дубликатов: {duplicates}, осталось в очереди: {left}")
+    print("=" * 60)
+
+
+def main():
+    args = parse_args()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_sheets_")
+    # Настройки читаются при импорте config — задаем их до импорта модулей бота
+    os.environ["DB_PATH"] = os.path.join(tmp_dir, "bench.db")
+    os.environ["GOOGLE_SHEETS_ID"] = SPREADSHEET_ID
+    os.environ["SHEETS_EXPORT_PAGE_SIZE"] = str(args.page_size)
+    logging.basicConfig(level=logging.ERROR)
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
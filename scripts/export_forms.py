@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Выгрузка всех анкет из SQLite в CSV, XLSX или Parquet
+
+Примеры:
+    python scripts/export_forms.py anketa.csv
+    python scripts/export_forms.py anketa.xlsx --submitted-only
+    python scripts/export_forms.py /tmp/forms.parquet
+    python scripts/export_forms.py --requeue-drafts --before 2026-10-01
+
+Бота останавливать не нужно: выгрузка читает согласованный снимок базы
+и не мешает записи. XLSX требует openpyxl, Parquet — pyarrow.
+
+--requeue-drafts ставит в очередь выгрузки в Google Sheets полностью
+заполненные черновики. До появления отметки об отправке (forms.submitted_at)
+анкета, выгрузка которой не удалась, ничем не отличалась от черновика, и
+после обновления бота такие анкеты не выгружаются. Сколько их, можно
+проверить в боте: /count status=draft progress=100 to=2026-09-30.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка анкет в файл")
+    parser.add_argument("path", nargs="?", help="файл выгрузки (.csv, .xlsx или .parquet)")
+    parser.add_argument("--format", choices=("csv", "xlsx", "parquet"),
+                        help="формат (по умолчанию — по расширению файла)")
+    parser.add_argument("--submitted-only", action="store_true", help="только отправленные анкеты")
+    parser.add_argument("--requeue-drafts", action="store_true",
+                        help="отметить отправленными и поставить в очередь выгрузки в Google Sheets "
+                             "заполненные черновики (вместо выгрузки в файл)")
+    parser.add_argument("--min-progress", type=int, default=100,
+                        help="для --requeue-drafts: заполнено не меньше, %% (по умолчанию 100)")
+    parser.add_argument("--before", help="для --requeue-drafts: только анкеты, измененные до даты ГГГГ-ММ-ДД")
+    args = parser.parse_args()
+    if not args.requeue_drafts and not args.path:
+        parser.error("укажите файл выгрузки или --requeue-drafts")
+    path = os.path.abspath(args.path) if args.path else None
+
+    # config создает папки data/ относительно текущей директории
+    os.chdir(REPO_DIR)
+    if args.requeue_drafts:
+        return requeue_drafts(args.min_progress, args.before)
+    from forms_export import export_forms_to_file
+
+    started = time.perf_counter()
+    try:
+        count = export_forms_to_file(path, args.format, args.submitted_only)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+    print(f"✅ Выгружено анкет: {count} в {path} за {elapsed:.1f} с")
+    return 0
+
+
+def requeue_drafts(min_progress: int, before: str) -> int:
+    from database import close_database, init_database, requeue_drafts as requeue
+
+    init_database()
+    try:
+        count = asyncio.run(requeue(min_progress, before))
+    finally:
+        close_database()
+    print(f"✅ Поставлено в очередь выгрузки анкет: {count}. Бот выгрузит их в фоне")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
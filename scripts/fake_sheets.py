@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Имитация Google Sheets для проверок без настоящего API
+
+Повторяет ту часть gspread, которой пользуется google_sheets.py:
+open_by_key, worksheet/sheet1/add_worksheet, update_title, row_values,
+col_values, batch_get, insert_row, append_row(s) и batch_update. Данные хранятся в
+памяти. Можно задать задержку ответа, долю ошибок 5xx и квоты запросов
+(ответ 429 при превышении), а также посмотреть счетчики вызовов.
+
+Подключение:
+
+    from google_sheets import set_client_factory
+    from fake_sheets import FakeSheets
+
+    fake = FakeSheets(latency=0.2, error_rate=0.01, quota_per_minute=60)
+    set_client_factory(fake.client)
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import gspread
+import gspread.exceptions
+from gspread.utils import a1_to_rowcol
+
+
+class FakeResponse:
+    """Ответ API с ошибкой (то, что gspread кладет в APIError.response)"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        self.status_code = status_code
+        self.text = message
+        self.headers = {"Retry-After": str(retry_after)} if retry_after else {}
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text}}
+
+
+class FakeSheets:
+    """Хранилище таблиц, задержки, ошибки, квоты и счетчики вызовов"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 quota_per_minute: Optional[int] = None, quota_window: float = 60.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.quota_window = quota_window
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._spreadsheets: Dict[str, "FakeSpreadsheet"] = {}
+        # Время запросов в текущем окне квоты — отдельно чтение и запись, как в Sheets API
+        self._requests = {"read": deque(), "write": deque()}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def client(self) -> "FakeClient":
+        """Фабрика клиента для google_sheets.set_client_factory"""
+        return FakeClient(self)
+
+    def spreadsheet(self, key: str) -> "FakeSpreadsheet":
+        """Таблица с ID key (создается при первом обращении)"""
+        with self._lock:
+            if key not in self._spreadsheets:
+                self._spreadsheets[key] = FakeSpreadsheet(self, key)
+            return self._spreadsheets[key]
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def request(self, method: str, kind: str):
+        """Учитывает запрос: задержка, квота, случайная ошибка"""
+        with self._lock:
+            self.calls[method] += 1
+            if self.quota_per_minute is not None:
+                now = time.monotonic()
+                window = self._requests[kind]
+                while window and window[0] <= now - self.quota_window:
+                    window.popleft()
+                if len(window) >= self.quota_per_minute:
+                    self.errors[429] += 1
+                    retry_after = round(window[0] + self.quota_window - now, 3)
+                    raise gspread.exceptions.APIError(FakeResponse(429, "Quota exceeded", retry_after))
+                window.append(now)
+            failed = self.error_rate and self._random.random() < self.error_rate
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if failed:
+            with self._lock:
+                self.errors[503] += 1
+            raise gspread.exceptions.APIError(FakeResponse(503, "The service is currently unavailable"))
+
+
+class FakeClient:
+    def __init__(self, backend: FakeSheets):
+        self._backend = backend
+
+    def open_by_key(self, key: str) -> "FakeSpreadsheet":
+        self._backend.request("open_by_key", "read")
+        return self._backend.spreadsheet(key)
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend: FakeSheets, key: str):
+        self._backend = backend
+        self.id = key
+        self.title = f"Fake {key}"
+        self._worksheets: List[FakeWorksheet] = [FakeWorksheet(backend, "Лист1")]
+
+    @property
+    def sheet1(self) -> "FakeWorksheet":
+        return self._worksheets[0]
+
+    def worksheet(self, title: str) -> "FakeWorksheet":
+        self._backend.request("worksheet", "read")
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    def add_worksheet(self, title: str, rows: int, cols: int) -> "FakeWorksheet":
+        self._backend.request("add_worksheet", "write")
+        worksheet = FakeWorksheet(self._backend, title)
+        self._worksheets.append(worksheet)
+        return worksheet
+
+
+class FakeWorksheet:
+    def __init__(self, backend: FakeSheets, title: str):
+        self._backend = backend
+        self.title = title
+        self.rows: List[list] = []
+
+    def update_title(self, title: str):
+        self._backend.request("update_title", "write")
+        self.title = title
+
+    def row_values(self, row: int) -> list:
+        self._backend.request("row_values", "read")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col: int) -> list:
+        self._backend.request("col_values", "read")
+        values = [row[col - 1] if col <= len(row) else None for row in self.rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def batch_get(self, ranges: list, **kwargs) -> list:
+        self._backend.request("batch_get", "read")
+        result = []
+        for cell_range in ranges:
+            start, end = cell_range.split("!")[-1].split(":")
+            (first_row, first_col), (last_row, last_col) = a1_to_rowcol(start), a1_to_rowcol(end)
+            values = []
+            for row in self.rows[first_row - 1:last_row]:
+                cells = list(row[first_col - 1:last_col])
+                # Как и API, не возвращаем пустые ячейки и строки в конце диапазона
+                while cells and cells[-1] in ("", None):
+                    cells.pop()
+                values.append(cells)
+            while values and not values[-1]:
+                values.pop()
+            result.append(values)
+        return result
+
+    def insert_row(self, values: list, index: int = 1):
+        self._backend.request("insert_row", "write")
+        self.rows.insert(index - 1, list(values))
+
+    def _append(self, rows: list) -> dict:
+        start = len(self.rows) + 1
+        self.rows.extend(list(row) for row in rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:Z{len(self.rows)}",
+                            "updatedRows": len(rows)}}
+
+    def append_row(self, values: list, **kwargs) -> dict:
+        self._backend.request("append_row", "write")
+        return self._append([values])
+
+    def append_rows(self, values: list, **kwargs) -> dict:
+        self._backend.request("append_rows", "write")
+        return self._append(values)
+
+    def batch_update(self, data: list, **kwargs) -> dict:
+        self._backend.request("batch_update", "write")
+        for item in data:
+            start = item["range"].split(":")[0].split("!")[-1]
+            row, col = a1_to_rowcol(start)
+            for offset, values in enumerate(item["values"]):
+                while len(self.rows) < row + offset:
+                    self.rows.append([])
+                target = self.rows[row + offset - 1]
+                target.extend([""] * (col - 1 + len(values) - len(target)))
+                target[col - 1:col - 1 + len(values)] = values
+        return {"totalUpdatedRows": len(data)}
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Сверка листа "Анкеты" в Google Sheets с базой данных
+
+Читает лист несколькими запросами, сравнивает строки с хэшами выгруженных
+анкет и дописывает только расхождения. Подходит для ночного запуска из cron:
+если все совпадает, сверка стоит несколько запросов к API.
+
+Примеры:
+    python scripts/reconcile_sheets.py            # сверить и исправить
+    python scripts/reconcile_sheets.py --dry-run  # только отчет
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
+
+from config import GOOGLE_SHEETS_ID
+from database import init_database, close_database
+from sheets_reconcile import reconcile_sheets
+
+
+async def run(dry_run: bool) -> int:
+    init_database()
+    try:
+        report = await reconcile_sheets(dry_run)
+    except Exception as e:
+        print(f"❌ Ошибка сверки: {e}")
+        return 1
+    finally:
+        close_database()
+    print("=" * 60)
+    print("Сверка Google Sheets с БД" + (" (без исправлений)" if dry_run else ""))
+    print("=" * 60)
+    print(report.summary())
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сверка листа анкет с БД")
+    parser.add_argument("--dry-run", action="store_true", help="только отчет, без записи в таблицу и БД")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if not GOOGLE_SHEETS_ID:
+        print("❌ GOOGLE_SHEETS_ID не установлен в .env")
+        return 1
+    return asyncio.run(run(args.dry_run))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Планировщик исходящих сообщений Bot API
+
+Подключается к сессии бота как middleware запросов (bot.session.middleware),
+поэтому обработчики по-прежнему просто вызывают message.answer() и т. п.
+Через планировщик проходят методы, отправляющие или изменяющие сообщения
+в чате (send*, copy*, forward*, edit*); остальные запросы, в том числе
+sendChatAction («печатает...»), идут без очереди и не расходуют лимит.
+
+- В один чат сообщения уходят по порядку (FIFO), в среднем не чаще
+  SEND_CHAT_RATE в секунду, подряд — до SEND_CHAT_BURST.
+- Всего бот отправляет не больше SEND_GLOBAL_RATE сообщений в секунду
+  (Telegram допускает около 30). Когда лимит исчерпан, первыми уходят ответы
+  пользователям, затем массовые рассылки (см. bulk_sending).
+- На TelegramRetryAfter планировщик ждет retry_after секунд и повторяет
+  запрос (до SEND_MAX_RETRIES раз); на это время приостанавливаются
+  сообщения этого чата и все массовые рассылки.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES, BOT_WORKERS, WORKER_ID
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+INTERACTIVE = 0
+BULK = 1
+
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+# Методы, на которые действуют лимиты Telegram на сообщения
+LIMITED_PREFIXES = ("Send", "Copy", "Forward", "Edit")
+# Методы с такими префиксами, которые не отправляют сообщений
+UNLIMITED_METHODS = ("SendChatAction",)
+
+# Состояния чатов хранятся, пока их не станет больше (потом простаивающие удаляются)
+CHATS_PRUNE_THRESHOLD = 10000
+
+
+@contextmanager
+def bulk_sending() -> Iterator[None]:
+    """Сообщения, отправленные внутри блока, считаются массовой рассылкой"""
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class _ChatState:
+    """Очередь одного чата: блокировка (FIFO), лимит и пауза после flood wait"""
+
+    __slots__ = ("lock", "bucket", "paused_until", "users")
+
+    def __init__(self, rate: float, burst: int):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(rate, burst)
+        self.paused_until = 0.0
+        self.users = 0
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Очередь исходящих сообщений: FIFO на чат, общий лимит, приоритеты, повтор после flood wait"""
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: int = SEND_CHAT_BURST, max_retries: int = SEND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._bulk_paused_until = 0.0
+        self._chats: Dict[Any, _ChatState] = {}
+        self.sent = 0
+        self.delayed = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        name = type(method).__name__
+        if chat_id is None or not name.startswith(LIMITED_PREFIXES) or name in UNLIMITED_METHODS:
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        loop = asyncio.get_running_loop()
+        state = self._chat(chat_id)
+        state.users += 1
+        try:
+            async with state.lock:
+                for attempt in itertools.count(1):
+                    await self._wait_chat(state, loop)
+                    await self._acquire(priority, loop)
+                    try:
+                        response = await make_request(bot, method)
+                        self.sent += 1
+                        return response
+                    except TelegramRetryAfter as e:
+                        self.flood_waits += 1
+                        if attempt > self.max_retries:
+                            self.failed += 1
+                            raise
+                        logger.warning(f"Flood wait {e.retry_after} с: {type(method).__name__} в чат {chat_id}, "
+                                       f"повтор {attempt}/{self.max_retries}")
+                        resume = loop.time() + e.retry_after
+                        state.paused_until = max(state.paused_until, resume)
+                        self._bulk_paused_until = max(self._bulk_paused_until, resume)
+        finally:
+            state.users -= 1
+
+    def _chat(self, chat_id: Any) -> _ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            if len(self._chats) >= CHATS_PRUNE_THRESHOLD:
+                self._prune()
+            state = self._chats[chat_id] = _ChatState(self.chat_rate, self.chat_burst)
+        return state
+
+    def _prune(self):
+        """Удаляет состояния чатов без ожидающих сообщений"""
+        loop = asyncio.get_running_loop()
+        idle = [chat_id for chat_id, state in self._chats.items()
+                if not state.users and state.paused_until <= loop.time()]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def _wait_chat(self, state: _ChatState, loop: asyncio.AbstractEventLoop):
+        delay = state.paused_until - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        while True:
+            wait = state.bucket.try_acquire()
+            if not wait:
+                return
+            self.delayed += 1
+            await asyncio.sleep(wait)
+
+    async def _acquire(self, priority: int, loop: asyncio.AbstractEventLoop):
+        """Ждет токен общего лимита; ожидающие получают токены по приоритету"""
+        if priority != INTERACTIVE:
+            while (delay := self._bulk_paused_until - loop.time()) > 0:
+                await asyncio.sleep(delay)
+        if not self._waiters and not self._global.try_acquire():
+            return
+        self.delayed += 1
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump(), name="send-scheduler")
+        await future
+
+    async def _pump(self):
+        """Раздает токены ожидающим по мере их появления"""
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._global.try_acquire()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики для подбора лимитов"""
+        return {
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+            "chats": len(self._chats),
+        }
+
+
+# Процессы-обработчики делят общий лимит поровну (чаты за ними закреплены, см. workers.py)
+send_scheduler = SendScheduler(global_rate=SEND_GLOBAL_RATE / BOT_WORKERS if WORKER_ID is not None else SEND_GLOBAL_RATE)
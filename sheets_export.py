@@ -0,0 +1,52 @@
+"""Выгрузка отправленных анкет в Google Sheets
+
+Отправка анкеты в одной транзакции с ее сохранением добавляет задание в
+outbox (получатель OUTBOX_SHEETS, ref — ID анкеты), поэтому ответ
+пользователю не ждет Google, а задание не теряется при перезапуске.
+Диспетчер outbox передает задания сюда пачками: каждая пачка записывается
+в таблицу (строки уже выгруженных пользователей перезаписываются на месте,
+новые добавляются в конец) и отмечается выгруженной одной транзакцией.
+Выгружается анкета в том виде, в котором ее отправили (forms.submitted_form):
+правки черновика после отправки в таблицу не попадают.
+
+Запросы ограничены квотами Sheets API (google_sheets.sheets_quota); при
+превышении квоты или сбое у Google задания откладываются и уходят позже.
+"""
+import asyncio
+import logging
+from typing import List
+
+from config import GOOGLE_SHEETS_ID, SHEETS_EXPORT_PAGE_SIZE
+from database import OUTBOX_SHEETS, get_submitted_forms, mark_many_as_sent
+from google_sheets import format_sheet_row, get_sheets_session, is_transient_error, retry_after, row_hash
+from outbox import OutboxDispatcher, OutboxEntry, RetryLater
+
+logger = logging.getLogger(__name__)
+
+
+async def export_forms(entries: List[OutboxEntry]):
+    """Выгружает анкеты пачки заданий outbox одним-двумя запросами к API"""
+    # Несколько отправок одной анкеты выгружаются один раз — последняя отправленная версия
+    forms = await get_submitted_forms(sorted({entry.ref for entry in entries}))
+    if not forms:
+        return
+    rows = [format_sheet_row(form["form_data"], form["user_id"]) for form in forms]
+    session = get_sheets_session(GOOGLE_SHEETS_ID)
+    try:
+        # gspread синхронный — выполняем в потоке, чтобы не блокировать event loop
+        await asyncio.to_thread(session.upsert_rows, rows)
+    except Exception as e:
+        if is_transient_error(e):
+            raise RetryLater(f"Google Sheets временно недоступен ({e})", retry_after(e)) from e
+        raise
+    await mark_many_as_sent([(form["id"], form["submitted_at"], row_hash(row)) for form, row in zip(forms, rows)])
+    logger.info(f"Выгружено в Google Sheets: {len(forms)} анкет(ы)")
+
+
+def register_sheets_export(dispatcher: OutboxDispatcher):
+    """Подключает выгрузку в Google Sheets к диспетчеру outbox"""
+    if not GOOGLE_SHEETS_ID:
+        logger.warning("GOOGLE_SHEETS_ID не установлен, выгрузка анкет в Google Sheets отключена "
+                       "(отправленные анкеты останутся в очереди)")
+        return
+    dispatcher.register(OUTBOX_SHEETS, export_forms, SHEETS_EXPORT_PAGE_SIZE)
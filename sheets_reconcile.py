@@ -0,0 +1,139 @@
+"""Сверка листа "Анкеты" с базой данных
+
+При выгрузке у анкеты запоминается хэш записанной строки (forms.sheet_hash).
+Сверка читает лист несколькими большими запросами batch_get, сравнивает хэш
+каждой строки с хэшем из БД и дописывает только расхождения: измененные
+строки перезаписываются одним batch_update, недостающие добавляются одним
+append_rows. Содержимое анкет из БД читается только для расходящихся строк;
+строки строятся из отправленной версии анкеты (forms.submitted_form), как и
+при выгрузке, а не из черновика, измененного после отправки.
+
+Анкеты, которые еще ждут выгрузки в outbox, не трогаются — их запишет
+диспетчер. Лишние строки (пользователей нет среди отправленных анкет) и
+дубли только попадают в отчет: их могли добавить в таблицу вручную.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+from config import GOOGLE_SHEETS_ID
+from database import get_sheet_states, get_submitted_forms, set_sheet_hashes
+from google_sheets import format_sheet_row, get_sheets_session, row_hash
+
+logger = logging.getLogger(__name__)
+
+# Сколько анкет читается из БД одним запросом
+FORMS_CHUNK = 500
+
+# Сколько ID лишних строк и дублей показывать в отчете
+REPORT_SAMPLE = 20
+
+
+class ReconcileReport:
+    """Результат сверки листа с БД"""
+
+    def __init__(self):
+        self.forms = 0
+        self.sheet_rows = 0
+        self.matched = 0
+        self.pending = 0
+        self.changed: List[int] = []
+        self.missing: List[int] = []
+        self.extra: List[str] = []
+        self.duplicates: Dict[str, List[int]] = {}
+        self.fixed = 0
+
+    @property
+    def drift(self) -> int:
+        """Число строк, расходящихся с БД (измененные и недостающие)"""
+        return len(self.changed) + len(self.missing)
+
+    def summary(self) -> str:
+        lines = [
+            f"Отправленных анкет в БД: {self.forms} (ждут выгрузки: {self.pending})",
+            f"Строк в листе: {self.sheet_rows}",
+            f"Совпадают: {self.matched}",
+            f"Отличаются: {len(self.changed)}",
+            f"Отсутствуют в листе: {len(self.missing)}",
+            f"Лишние строки: {len(self.extra)}" + _sample(self.extra),
+            f"Пользователи с несколькими строками: {len(self.duplicates)}" + _sample(self.duplicates),
+            f"Исправлено строк: {self.fixed}",
+        ]
+        return "\n".join(lines)
+
+
+def _sample(values) -> str:
+    values = list(values)
+    if not values:
+        return ""
+    more = f" и еще {len(values) - REPORT_SAMPLE}" if len(values) > REPORT_SAMPLE else ""
+    return f" (ID: {', '.join(map(str, values[:REPORT_SAMPLE]))}{more})"
+
+
+async def _load_rows(form_ids: List[int]) -> Dict[int, list]:
+    """Строки таблицы для отправленных версий анкет по их ID"""
+    rows = {}
+    for start in range(0, len(form_ids), FORMS_CHUNK):
+        for form in await get_submitted_forms(form_ids[start:start + FORMS_CHUNK]):
+            rows[form["id"]] = format_sheet_row(form["form_data"], form["user_id"])
+    return rows
+
+
+async def reconcile_sheets(dry_run: bool = False) -> ReconcileReport:
+    """Сверяет лист с БД и дописывает расхождения (с dry_run — только отчет)"""
+    report = ReconcileReport()
+    # Сначала БД, потом лист: анкета, отмеченная выгруженной, к моменту
+    # чтения листа в нем уже есть, и сверка не добавит ее второй раз
+    states = await get_sheet_states()
+    session = get_sheets_session(GOOGLE_SHEETS_ID)
+    sheet = await asyncio.to_thread(session.read_rows)
+
+    report.forms = len(states)
+    report.sheet_rows = len(sheet)
+    user_rows = defaultdict(list)
+    for number, row in sorted(sheet.items()):
+        user_rows[row[0]].append(number)
+
+    # Анкетам, выгруженным до появления хэшей, считаем хэш по отправленной версии
+    unhashed = [form_id for form_id, _, sent, sheet_hash in states if sent and not sheet_hash]
+    hashes = {form_id: row_hash(row) for form_id, row in (await _load_rows(unhashed)).items()}
+    if hashes and not dry_run:
+        await set_sheet_hashes([(value, form_id) for form_id, value in hashes.items()])
+
+    submitted_users = set()
+    updates: Dict[int, int] = {}
+    for form_id, user_id, sent, sheet_hash in states:
+        user_key = str(user_id)
+        submitted_users.add(user_key)
+        numbers = user_rows.get(user_key)
+        if numbers and len(numbers) > 1:
+            report.duplicates[user_key] = numbers
+        if not sent:
+            report.pending += 1
+            continue
+        if not numbers:
+            report.missing.append(form_id)
+            continue
+        # Как и при выгрузке, актуальной считается последняя строка пользователя
+        number = numbers[-1]
+        if row_hash(sheet[number]) == (sheet_hash or hashes.get(form_id)):
+            report.matched += 1
+        else:
+            report.changed.append(form_id)
+            updates[form_id] = number
+    report.extra = [user_key for user_key in user_rows if user_key not in submitted_users]
+
+    if report.drift and not dry_run:
+        rows = await _load_rows(report.changed + report.missing)
+        await asyncio.to_thread(
+            session.write_rows,
+            {updates[form_id]: rows[form_id] for form_id in report.changed if form_id in rows},
+            [rows[form_id] for form_id in report.missing if form_id in rows],
+        )
+        await set_sheet_hashes([(row_hash(row), form_id) for form_id, row in rows.items()])
+        report.fixed = len(rows)
+
+    logger.info(f"Сверка Google Sheets: строк {report.sheet_rows}, расхождений {report.drift}, "
+                f"исправлено {report.fixed}, лишних {len(report.extra)}, дублей {len(report.duplicates)}")
+    return report
@@ -0,0 +1,23 @@
+"""Общие фикстуры тестов: модули бота импортируются из корня репозитория"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from form_cache import form_cache  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Пустая БД во временной папке (со всеми миграциями)"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "anketa.db"))
+    # Сводки администратору не нужны: в outbox остаются только задания теста
+    monkeypatch.setattr(database, "ADMIN_CHAT_ID", "")
+    form_cache.clear()
+    database.init_database()
+    yield database
+    database.close_database()
+    form_cache.clear()
@@ -0,0 +1,72 @@
+"""Версии анкет: устаревшая запись отклоняется (StaleFormError)"""
+import asyncio
+
+import pytest
+
+from database import VERSION_KEY, StaleFormError, load_form_from_db, save_form_to_db
+from form_cache import form_cache
+from utils import save_form_data
+
+
+def test_save_sets_version(db):
+    async def scenario():
+        await save_form_to_db(1, {"comments": "первая"})
+        await save_form_to_db(1, await load_form_from_db(1))
+        form_cache.clear()
+        return await load_form_from_db(1)
+
+    form_data = asyncio.run(scenario())
+    assert form_data["comments"] == "первая"
+    assert form_data[VERSION_KEY] == 2
+
+
+def test_stale_write_raises(db):
+    async def scenario():
+        await save_form_to_db(1, {"comments": "исходная"})
+        first = await load_form_from_db(1)
+        second = await load_form_from_db(1)
+        first["comments"] = "из первого окна"
+        await save_form_to_db(1, first)
+        second["comments"] = "из второго окна"
+        with pytest.raises(StaleFormError):
+            await save_form_to_db(1, second)
+        form_cache.clear()
+        return await load_form_from_db(1)
+
+    assert asyncio.run(scenario())["comments"] == "из первого окна"
+
+
+def test_rejected_form_stays_stale(db):
+    """Повторная запись отклоненной анкеты тоже отклоняется"""
+    async def scenario():
+        await save_form_to_db(1, {"comments": "исходная"})
+        stale = await load_form_from_db(1)
+        await save_form_to_db(1, await load_form_from_db(1))
+        for _ in range(2):
+            with pytest.raises(StaleFormError):
+                await save_form_to_db(1, stale)
+        form_cache.clear()
+        return await load_form_from_db(1)
+
+    assert asyncio.run(scenario())["comments"] == "исходная"
+
+
+def test_new_form_from_two_windows(db):
+    async def scenario():
+        await save_form_to_db(1, {"comments": "первое окно"})
+        with pytest.raises(StaleFormError):
+            await save_form_to_db(1, {"comments": "второе окно"})
+
+    asyncio.run(scenario())
+
+
+def test_save_form_data_submit_is_stale_checked(db):
+    """Отправка анкеты без буфера (save_form_data) тоже проверяет версию"""
+    async def scenario():
+        await save_form_data(1, {"comments": "черновик"})
+        stale = await load_form_from_db(1)
+        await save_form_data(1, await load_form_from_db(1))
+        with pytest.raises(StaleFormError):
+            await save_form_data(1, stale, save_to_sheets=True)
+
+    asyncio.run(scenario())
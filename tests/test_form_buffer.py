@@ -0,0 +1,120 @@
+"""Буфер отложенной записи анкет: объединение изменений и возврат в буфер при ошибке записи"""
+import asyncio
+
+import pytest
+
+import form_buffer as form_buffer_module
+from database import StaleFormError, load_form_from_db, save_form_to_db
+from form_buffer import FormWriteBuffer
+from form_cache import form_cache
+
+
+def _stored(user_id: int) -> dict:
+    form_cache.invalidate(user_id)
+    return asyncio.run(load_form_from_db(user_id))
+
+
+def test_changes_are_coalesced_into_one_write(db):
+    buffer = FormWriteBuffer(flush_interval_ms=1000, max_users=100)
+    form_data = {}
+
+    async def scenario():
+        for answer in ("Иванов", "Иван", "Иванович"):
+            form_data.setdefault("answers", []).append(answer)
+            buffer.put(1, form_data)
+        buffer.put(2, {"comments": "другой пользователь"})
+        assert buffer.get(1)["answers"] == ["Иванов", "Иван", "Иванович"]
+        return await buffer.flush()
+
+    saved = asyncio.run(scenario())
+    assert set(saved) == {1, 2}
+    assert buffer.flushes == 1
+    assert buffer.flushed_forms == 2
+    assert buffer.get(1) is None
+    assert _stored(1)["answers"] == ["Иванов", "Иван", "Иванович"]
+
+
+def test_put_over_limit_wakes_flush(db):
+    buffer = FormWriteBuffer(flush_interval_ms=1000, max_users=2)
+    buffer.put(1, {})
+    assert not buffer._wakeup.is_set()
+    buffer.put(2, {})
+    assert buffer._wakeup.is_set()
+
+
+def test_failed_write_is_requeued(db, monkeypatch):
+    buffer = FormWriteBuffer(flush_interval_ms=1000, max_users=100)
+    save_forms_batch = form_buffer_module.save_forms_batch
+
+    async def failing(forms):
+        raise RuntimeError("диск переполнен")
+
+    async def scenario():
+        buffer.put(1, {"comments": "черновик"})
+        monkeypatch.setattr(form_buffer_module, "save_forms_batch", failing)
+        assert await buffer.flush() == {}
+        # Анкета не потерялась и доступна обработчикам
+        assert buffer.get(1) == {"comments": "черновик", "_version": 1}
+        monkeypatch.setattr(form_buffer_module, "save_forms_batch", save_forms_batch)
+        return await buffer.flush()
+
+    assert set(asyncio.run(scenario())) == {1}
+    assert _stored(1)["comments"] == "черновик"
+
+
+def test_newer_change_during_failed_write_keeps_stored_version(db, monkeypatch):
+    """Изменение, сделанное во время неудачной записи, записывается от версии, которая в БД"""
+    buffer = FormWriteBuffer(flush_interval_ms=1000, max_users=100)
+    save_forms_batch = form_buffer_module.save_forms_batch
+    asyncio.run(save_form_to_db(1, {"comments": "в БД"}))
+    form_data = _stored(1)
+
+    async def failing(forms):
+        form_data["comments"] = "новее"
+        buffer.put(1, form_data)
+        raise RuntimeError("база заблокирована")
+
+    async def scenario():
+        form_data["comments"] = "изменено"
+        buffer.put(1, form_data)
+        monkeypatch.setattr(form_buffer_module, "save_forms_batch", failing)
+        await buffer.flush()
+        monkeypatch.setattr(form_buffer_module, "save_forms_batch", save_forms_batch)
+        return await buffer.flush()
+
+    assert set(asyncio.run(scenario())) == {1}
+    assert _stored(1)["comments"] == "новее"
+
+
+def test_write_now_reports_failure_and_keeps_form(db, monkeypatch):
+    buffer = FormWriteBuffer(flush_interval_ms=1000, max_users=100)
+
+    async def failing(forms):
+        raise RuntimeError("диск переполнен")
+
+    async def scenario():
+        monkeypatch.setattr(form_buffer_module, "save_forms_batch", failing)
+        with pytest.raises(RuntimeError):
+            await buffer.write_now(1, {"comments": "отправка"}, submit=True)
+        return buffer.get(1)
+
+    assert asyncio.run(scenario())["comments"] == "отправка"
+
+
+def test_stale_write_is_reported_as_conflict(db):
+    buffer = FormWriteBuffer(flush_interval_ms=1000, max_users=100)
+    asyncio.run(save_form_to_db(1, {"comments": "исходная"}))
+    stale = _stored(1)
+    asyncio.run(save_form_to_db(1, _stored(1)))
+
+    async def scenario():
+        stale["comments"] = "из старого окна"
+        buffer.put(1, stale)
+        assert await buffer.flush() == {}
+        assert buffer.pop_conflict(1)
+        assert not buffer.pop_conflict(1)
+        with pytest.raises(StaleFormError):
+            await buffer.write_now(1, stale)
+
+    asyncio.run(scenario())
+    assert _stored(1)["comments"] == "исходная"
@@ -0,0 +1,151 @@
+"""Разбор полей анкеты для запросов (form_fields)"""
+from datetime import date
+
+import pytest
+
+from form_fields import (FORM_COLUMNS, form_columns, normalize_city, normalize_phone, normalize_text, parse_start_date,
+                         search_document, search_query, transliterate)
+
+# Дата заполнения анкеты: месяцы без года отсчитываются от нее
+REFERENCE = date(2026, 10, 17)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("  Иван   Петрович ", "иван петрович"),
+    ("ЁЛКИНО", "елкино"),
+    (123, "123"),
+    ("", ""),
+])
+def test_normalize_text(value, expected):
+    assert normalize_text(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Москва", "москва"),
+    ("г. Москва", "москва"),
+    ("Г.Москва", "москва"),
+    ("г Москва", "москва"),
+    ("город Москва", "москва"),
+    (" Нижний  Новгород ", "нижний новгород"),
+    ("Гагарин", "гагарин"),
+    ("Городец", "городец"),
+])
+def test_normalize_city(value, expected):
+    assert normalize_city(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("8 (900) 123-45-67", "79001234567"),
+    ("+7 900 123 45 67", "79001234567"),
+    ("9001234567", "79001234567"),
+    ("79001234567", "79001234567"),
+    ("+998 90 123 45 67", "998901234567"),
+    ("123", "123"),
+    ("", ""),
+])
+def test_normalize_phone(value, expected):
+    assert normalize_phone(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    # Полные даты
+    ("15.11.2026", date(2026, 11, 15)),
+    ("с 15.11.26", date(2026, 11, 15)),
+    ("1.2.2027", date(2027, 2, 1)),
+    ("2026-11-15", date(2026, 11, 15)),
+    ("2026-11-5", date(2026, 11, 5)),
+    # Месяц словами: без года — ближайший такой месяц, начиная с месяца заполнения
+    ("с 15 ноября", date(2026, 11, 15)),
+    ("в ноябре", date(2026, 11, 1)),
+    ("в октябре", date(2026, 10, 1)),
+    ("сентябрь", date(2027, 9, 1)),
+    ("Январь", date(2027, 1, 1)),
+    ("с начала декабря", date(2026, 12, 1)),
+    ("май", date(2027, 5, 1)),
+    ("1 мая", date(2027, 5, 1)),
+    ("в мае", date(2027, 5, 1)),
+    ("ноябрь 2027", date(2027, 11, 1)),
+    ("марта 2027 года", date(2027, 3, 1)),
+    # Несуществующие даты и ответы без даты
+    ("31.02.2026", None),
+    ("13.13.2026", None),
+    ("готов хоть завтра", None),
+    ("через 2 недели", None),
+    ("Майкоп", None),
+    ("", None),
+])
+def test_parse_start_date(value, expected):
+    assert parse_start_date(value, REFERENCE) == expected
+
+
+def test_form_columns():
+    form_data = {
+        "filled_at": "2026-10-17T12:00:00",
+        "citizenship_type": "Иностранец",
+        "personal_data": {"surname": "Иванов", "name": "Иван"},
+        "contacts": {"phone": "8 900 123-45-67"},
+        "readiness": {"city": "г. Казань", "vakhta_start_date": "в мае"},
+    }
+    columns = dict(zip(FORM_COLUMNS, form_columns(form_data)))
+    assert columns == {
+        "full_name": "Иванов Иван",
+        "phone": "79001234567",
+        "citizenship_type": "Иностранец",
+        "city": "казань",
+        "vakhta_start_date": "2027-05-01",
+        "completion": columns["completion"],
+    }
+    assert 0 < columns["completion"] < 100
+
+
+def test_form_columns_of_empty_form():
+    full_name, phone, citizenship_type, city, start, completion = form_columns({})
+    assert (full_name, phone, citizenship_type, city, start) == (None, None, None, None, None)
+    assert completion == 0
+
+
+@pytest.mark.parametrize("cyrillic, latin", [
+    ("юлия", "yulia"),
+    ("сергей", "sergey"),
+    ("хабибуллин", "khabibullin"),
+    ("абдуллаев", "abdulaev"),
+    ("цой", "tsoi"),
+    ("щукин", "shchukin"),
+    ("яковлев", "jakovlev"),
+    ("алексей", "aleksey"),
+    ("максим", "maxim"),
+    ("ёлкин", "elkin"),
+])
+def test_transliterate_matches_latin_spelling(cyrillic, latin):
+    assert transliterate(normalize_text(cyrillic)) == transliterate(latin)
+
+
+def test_search_document():
+    document = search_document({
+        "personal_data": {"surname": "Хабибуллин", "name": "Юлия"},
+        "contacts": {"phone": "8 (900) 123-45-67"},
+        "readiness": {"city": "Казань"},
+        "citizenship_type": "Россия",
+    })
+    assert document.split() == ["habibulin", "iulia", "rosia", "kazan", "79001234567", "9001234567"]
+
+
+def test_search_document_of_empty_form():
+    assert search_document({}) == ""
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Иванов", '"ivanov"*'),
+    ("ivanov ivan", '"ivanov"* "ivan"*'),
+    ("Юлия Хабибуллина", '"iulia"* "habibulina"*'),
+    ("8 900 123 45 67", '"79001234567"*'),
+    ("Иванов +7 (900) 123-45-67", '"ivanov"* "79001234567"*'),
+    ("2024 2025", '"2024"* "2025"*'),
+    ("89001234567", '"79001234567"*'),
+    ("89011234567", '"79011234567"*'),
+    ("+7 (900)", '"7"* "900"*'),
+    ("", None),
+    ("  ?! ", None),
+])
+def test_search_query(text, expected):
+    assert search_query(text) == expected
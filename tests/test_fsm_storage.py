@@ -0,0 +1,127 @@
+"""Хранилище FSM: выгрузка сессий и запись несохраненных ответов анкеты"""
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from database import VERSION_KEY, run_read, save_form_to_db
+from form_buffer import form_buffer
+from form_cache import form_cache
+import fsm_storage
+from fsm_storage import SQLiteStorage
+from utils import load_form_data
+
+KEY = StorageKey(bot_id=1, chat_id=1, user_id=1)
+
+
+def _form_row(user_id: int):
+    return asyncio.run(run_read(lambda conn: conn.execute(
+        "SELECT form_data, version, updated_at FROM forms WHERE user_id = ?", (user_id,)).fetchone()))
+
+
+async def _evict_session(form_data: dict) -> SQLiteStorage:
+    """Сессия с анкетой записывается и выгружается после истечения кэша анкет"""
+    storage = SQLiteStorage(max_sessions=0)
+    await storage.set_data(KEY, {"form_data": form_data})
+    await storage.flush()
+    # FORM_CACHE_TTL меньше FSM_IDLE_TTL: к выгрузке анкеты в кэше уже нет
+    form_cache.clear()
+    assert await storage.evict() == 1
+    await form_buffer.flush()
+    return storage
+
+
+def test_evict_does_not_rewrite_unchanged_form(db):
+    asyncio.run(save_form_to_db(1, {"comments": "сохранена"}))
+    before = _form_row(1)
+
+    async def scenario():
+        await _evict_session(await load_form_data(1))
+
+    asyncio.run(scenario())
+    assert _form_row(1) == before
+
+
+def test_evict_spills_unsaved_answers(db):
+    asyncio.run(save_form_to_db(1, {"comments": "сохранена"}))
+    _, version, _ = _form_row(1)
+
+    async def scenario():
+        form_data = await load_form_data(1)
+        form_data["comments"] = "ответ без сохранения"
+        storage = await _evict_session(form_data)
+        return await storage.get_data(KEY)
+
+    data = asyncio.run(scenario())
+    assert data["form_data"]["comments"] == "ответ без сохранения"
+    form_data, new_version, _ = _form_row(1)
+    assert "ответ без сохранения" in form_data
+    assert new_version == version + 1
+
+
+def _stored_session(key: StorageKey):
+    return asyncio.run(run_read(lambda conn: conn.execute(
+        "SELECT data, spilled_form FROM fsm_states WHERE key = ?", (fsm_storage._dump_key(key),)).fetchone()))
+
+
+def test_saved_form_is_not_stored_in_session(db):
+    asyncio.run(save_form_to_db(1, {"comments": "сохранена"}))
+
+    async def scenario():
+        storage = SQLiteStorage()
+        await storage.set_data(KEY, {"form_data": await load_form_data(1), "step": 3})
+        await storage.flush()
+
+    asyncio.run(scenario())
+    data, spilled_form = _stored_session(KEY)
+    assert "form_data" not in data
+    assert spilled_form == 1
+
+
+def test_unsaved_answers_survive_restart(db):
+    """Перезапуск без close(): ответы из середины раздела восстанавливаются из fsm_states"""
+    asyncio.run(save_form_to_db(1, {"comments": "сохранена"}))
+
+    async def scenario():
+        storage = SQLiteStorage()
+        form_data = await load_form_data(1)
+        form_data["personal_data"] = {"surname": "Иванов"}
+        await storage.set_data(KEY, {"form_data": form_data})
+        await storage.flush()
+
+        form_cache.clear()
+        restarted = SQLiteStorage()
+        form_data = (await restarted.get_data(KEY))["form_data"]
+        form_data["personal_data"]["name"] = "Иван"
+        await save_form_to_db(1, form_data)
+
+    asyncio.run(scenario())
+    form_data, version, _ = _form_row(1)
+    assert "Иванов" in form_data and "Иван" in form_data
+    assert version == 2
+
+
+def test_restart_after_lost_buffer_write(db):
+    """Запись из буфера не дошла до forms: версия восстановленной анкеты — версия в forms"""
+    asyncio.run(save_form_to_db(1, {"comments": "сохранена"}))
+
+    async def scenario():
+        storage = SQLiteStorage()
+        form_data = await load_form_data(1)
+        form_data["comments"] = "конец раздела"
+        form_buffer.put(1, form_data)
+        await storage.set_data(KEY, {"form_data": form_data})
+        await storage.flush()
+        # Падение: буфер записи потерян
+        form_buffer._pending.clear()
+
+        form_cache.clear()
+        restarted = SQLiteStorage()
+        form_data = (await restarted.get_data(KEY))["form_data"]
+        assert form_data["comments"] == "конец раздела"
+        assert form_data[VERSION_KEY] == 1
+        await save_form_to_db(1, form_data)
+
+    asyncio.run(scenario())
+    form_data, version, _ = _form_row(1)
+    assert "конец раздела" in form_data
+    assert version == 2
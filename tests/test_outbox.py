@@ -0,0 +1,160 @@
+"""Outbox: аренда заданий, повторы с паузой, RetryLater и исчерпание попыток"""
+import asyncio
+import time
+
+from database import add_to_outbox, claim_outbox, complete_outbox, next_outbox_attempts, run_read, run_write
+from outbox import OutboxDispatcher, OutboxEntry, RetryLater
+
+
+def _jobs() -> list:
+    return asyncio.run(run_read(lambda conn: conn.execute(
+        "SELECT ref, attempts, next_attempt_at, last_error, failed_at FROM outbox ORDER BY ref").fetchall()))
+
+
+def _dispatcher(**kwargs) -> OutboxDispatcher:
+    options = {"lease": 60, "poll_interval": 1, "retry_min_delay": 10, "retry_max_delay": 100, "max_attempts": 3}
+    options.update(kwargs)
+    return OutboxDispatcher(**options)
+
+
+def _reset_due():
+    """Делает отложенные задания доступными сразу (вместо ожидания паузы)"""
+    asyncio.run(run_write(lambda conn: conn.execute(
+        "UPDATE outbox SET next_attempt_at = 0 WHERE failed_at IS NULL")))
+
+
+def _add(sink: str, *refs: int):
+    async def scenario():
+        for ref in refs:
+            await add_to_outbox(sink, ref)
+
+    asyncio.run(scenario())
+
+
+def test_claim_leases_jobs(db):
+    _add("sheets", 1, 2, 3)
+    _add("admin", 4)
+
+    async def scenario():
+        first = await claim_outbox("sheets", 2, 60)
+        second = await claim_outbox("sheets", 2, 60)
+        # Взятые задания до конца аренды не выдаются повторно
+        third = await claim_outbox("sheets", 2, 60)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert [(ref, attempts) for _, ref, _, attempts in first] == [(1, 1), (2, 1)]
+    assert [ref for _, ref, _, _ in second] == [3]
+    assert third == []
+
+
+def test_expired_lease_makes_job_available_again(db):
+    _add("sheets", 1)
+
+    async def scenario():
+        await claim_outbox("sheets", 10, 0.05)
+        await asyncio.sleep(0.1)
+        return await claim_outbox("sheets", 10, 60)
+
+    (_, ref, _, attempts), = asyncio.run(scenario())
+    assert (ref, attempts) == (1, 2)
+
+
+def test_completed_jobs_are_deleted(db):
+    _add("sheets", 1, 2)
+
+    async def scenario():
+        entries = await claim_outbox("sheets", 10, 60)
+        await complete_outbox([entries[0][0]])
+
+    asyncio.run(scenario())
+    assert [job[0] for job in _jobs()] == [2]
+
+
+def test_dispatch_delivers_batches(db):
+    _add("sheets", 1, 2, 3)
+    dispatcher = _dispatcher()
+    batches = []
+
+    async def handler(entries):
+        batches.append([entry.ref for entry in entries])
+
+    dispatcher.register("sheets", handler, 2)
+    assert asyncio.run(dispatcher.dispatch()) == 3
+    assert batches == [[1, 2], [3]]
+    assert _jobs() == []
+
+
+def test_failed_batch_is_retried_with_backoff(db):
+    _add("sheets", 1)
+    dispatcher = _dispatcher()
+    calls = []
+
+    async def handler(entries: list):
+        calls.append(entries)
+        raise ValueError("строка не принята")
+
+    dispatcher.register("sheets", handler, 10)
+    started = time.time()
+    assert asyncio.run(dispatcher.dispatch()) == 0
+    (ref, attempts, next_attempt_at, last_error, failed_at), = _jobs()
+    assert (ref, attempts, last_error, failed_at) == (1, 1, "строка не принята", None)
+    # Пауза растет от retry_min_delay, со случайным разбросом до половины
+    assert next_attempt_at >= started + 5
+    # До времени повтора получатель не опрашивается
+    asyncio.run(dispatcher.dispatch())
+    assert len(calls) == 1
+    assert asyncio.run(next_outbox_attempts()) == {"sheets": next_attempt_at}
+
+
+def test_retry_later_waits_requested_delay_without_attempt_limit(db):
+    _add("sheets", 1)
+    dispatcher = _dispatcher(max_attempts=1)
+
+    async def handler(entries):
+        raise RetryLater("квота", 300)
+
+    dispatcher.register("sheets", handler, 10)
+    for _ in range(3):
+        _reset_due()
+        dispatcher._paused.clear()
+        started = time.time()
+        asyncio.run(dispatcher.dispatch())
+    (_, attempts, next_attempt_at, last_error, failed_at), = _jobs()
+    assert next_attempt_at >= started + 300
+    assert (attempts, last_error, failed_at) == (3, "квота", None)
+    assert dispatcher.abandoned == 0
+
+
+def test_job_is_abandoned_after_max_attempts(db):
+    _add("sheets", 1, 2, 3)
+    dispatcher = _dispatcher(max_attempts=2)
+    batches = []
+
+    async def handler(entries):
+        batches.append([entry.ref for entry in entries])
+        if any(entry.ref == 2 for entry in entries):
+            raise ValueError("строка 2 не принята")
+
+    dispatcher.register("sheets", handler, 10)
+    for _ in range(3):
+        _reset_due()
+        dispatcher._paused.clear()
+        asyncio.run(dispatcher.dispatch())
+    # Исчерпавшая попытки пачка доставляется по одному заданию: остальные не страдают
+    assert batches == [[1, 2, 3], [1, 2, 3], [1], [2], [3]]
+    (ref, attempts, _, last_error, failed_at), = _jobs()
+    assert (ref, attempts, last_error) == (2, 2, "строка 2 не принята")
+    assert failed_at is not None
+    assert dispatcher.abandoned == 1
+    assert dispatcher.delivered == 2
+    # Отмеченные задания больше не берутся в работу
+    assert asyncio.run(claim_outbox("sheets", 10, 60)) == []
+    assert asyncio.run(next_outbox_attempts()) == {}
+
+
+def test_outbox_entry_fields(db):
+    _add("sheets", 7)
+    row, = asyncio.run(claim_outbox("sheets", 1, 60))
+    entry = OutboxEntry(*row)
+    assert (entry.ref, entry.payload, entry.attempts) == (7, None, 1)
@@ -0,0 +1,38 @@
+"""Полнотекстовый поиск анкет (search_forms): кириллица и латиница, телефон"""
+import asyncio
+
+import pytest
+
+from database import save_form_to_db, search_forms
+from form_fields import search_query
+
+FORMS = {
+    1: {"personal_data": {"surname": "Иванов", "name": "Иван"}, "contacts": {"phone": "+7 900 123-45-67"},
+        "readiness": {"city": "Москва"}},
+    2: {"personal_data": {"surname": "Хабибуллин", "name": "Юлия"}, "contacts": {"phone": "8 901 123-45-67"},
+        "readiness": {"city": "Казань"}},
+    3: {"personal_data": {"surname": "Ivanova", "name": "Maria"}, "readiness": {"city": "Moskva"}},
+}
+
+
+@pytest.mark.parametrize("text, users", [
+    ("Иванов", [1, 3]),
+    ("ivanov ivan", [1, 3]),
+    ("ivanov maria", [3]),
+    ("иванова", [3]),
+    ("Khabibulin Yulia", [2]),
+    ("москва", [1, 3]),
+    ("89001234567", [1]),
+    ("9011234567", [2]),
+    ("+7 901 123 45 67", [2]),
+    ("петров", []),
+])
+def test_search_forms(db, text, users):
+    async def scenario():
+        for user_id, form_data in FORMS.items():
+            await save_form_to_db(user_id, dict(form_data))
+        return await search_forms(search_query(text), limit=10)
+
+    total, forms = asyncio.run(scenario())
+    assert total == len(users)
+    assert sorted(form["user_id"] for form in forms) == users
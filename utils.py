@@ -1,54 +1,54 @@
 import json
 import os
 from datetime import datetime
-from config import DATA_DIR, GOOGLE_SHEETS_ID
-from google_sheets import save_form_to_sheets
-from database import save_form_to_db, load_form_from_db, init_database
+from config import DATA_DIR
+from database import save_form_to_db, load_form_from_db, StaleFormError
+from form_buffer import form_buffer
+from outbox import outbox
 
 
-def save_form_data(user_id: int, data: dict, save_to_sheets: bool = False):
-    """Сохраняет данные анкеты в базу данных и опционально в Google Sheets"""
-    # Инициализируем БД если нужно
-    init_database()
-    
+async def save_form_data(user_id: int, data: dict, save_to_sheets: bool = False):
+    """Сохраняет данные анкеты в базу данных и опционально ставит в очередь на выгрузку в Google Sheets.
+
+    Промежуточные сохранения попадают в буфер отложенной записи и возвращают None;
+    при отправке анкеты запись выполняется сразу и возвращается ID записи.
+    Если анкету изменили в другом месте (предыдущая запись отклонена как
+    устаревшая), выбрасывает StaleFormError — анкету нужно перечитать.
+    """
+    if form_buffer.pop_conflict(user_id):
+        raise StaleFormError(user_id)
+
     # Добавляем дату заполнения
     if "filled_at" not in data:
         data["filled_at"] = datetime.now().isoformat()
     
-    # Сохраняем в базу данных
-    form_id = save_form_to_db(user_id, data)
+    if not save_to_sheets and form_buffer.running:
+        form_buffer.put(user_id, data)
+        return None
     
-    # Если нужно отправить в Google Sheets
-    if save_to_sheets and GOOGLE_SHEETS_ID:
+    # Сохраняем в базу данных немедленно (после уже накопленных изменений).
+    # Отправленная анкета в той же транзакции ставится в очередь на выгрузку
+    # в Google Sheets, которая выполняется в фоне — пользователь ее не ждет
+    if form_buffer.running:
         try:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f"Попытка сохранить анкету {form_id} пользователя {user_id} в Google Sheets")
-            success = save_form_to_sheets(GOOGLE_SHEETS_ID, data, user_id)
-            if success:
-                from database import mark_as_sent
-                mark_as_sent(form_id)
-                logger.info(f"Анкета {form_id} успешно отправлена в Google Sheets и отмечена как отправленная")
-            else:
-                logger.warning(f"Не удалось сохранить анкету {form_id} в Google Sheets")
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            error_msg = f"Ошибка при сохранении в Google Sheets: {e}"
-            logger.error(error_msg, exc_info=True)
-            print(error_msg)
-    elif save_to_sheets and not GOOGLE_SHEETS_ID:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.warning(f"GOOGLE_SHEETS_ID не установлен, пропуск сохранения в Google Sheets для анкеты {form_id}")
+            form_id = await form_buffer.write_now(user_id, data, submit=save_to_sheets)
+        except StaleFormError:
+            form_buffer.pop_conflict(user_id)
+            raise
+    else:
+        form_id = await save_form_to_db(user_id, data, submit=save_to_sheets)
+    
+    if save_to_sheets:
+        outbox.wake()
     
     return form_id
 
 
-def load_form_data(user_id: int) -> dict:
-    """Загружает данные анкеты пользователя из базы данных"""
-    init_database()
-    data = load_form_from_db(user_id)
+async def load_form_data(user_id: int) -> dict:
+    """Загружает данные анкеты пользователя (с учетом еще не записанных изменений)"""
+    data = form_buffer.get(user_id)
+    if data is None:
+        data = await load_form_from_db(user_id)
     return data if data else {}
 
 
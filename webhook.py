@@ -0,0 +1,112 @@
+"""Прием обновлений через вебхук (BOT_MODE=webhook)
+
+Telegram сам присылает обновления POST-запросами на WEBHOOK_URL + WEBHOOK_PATH,
+поэтому задержка не зависит от long polling. Сервер aiohttp слушает
+WEBHOOK_HOST:WEBHOOK_PORT (обычно 127.0.0.1 за nginx), проверяет секрет из
+заголовка X-Telegram-Bot-Api-Secret-Token, сразу отвечает 200 и обрабатывает
+обновление в фоне. Одновременно обрабатывается не больше WEBHOOK_CONCURRENCY
+обновлений, остальные ждут своей очереди.
+"""
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука: ответ Telegram сразу, обработка в фоне с ограничением параллельности"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str, max_concurrency: int, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.handled = 0
+        self.failed = 0
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]):
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+                self.handled += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}", exc_info=True)
+
+    async def close(self):
+        """Дожидается обработки принятых обновлений.
+
+        Сессию бота не закрывает: рассылки и outbox еще отправляют сообщения,
+        сессию закрывает bot.py после их остановки.
+        """
+        pending = list(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"Ожидание обработки обновлений: {len(pending)}")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def wait_for_stop_signal():
+    """Ждет SIGINT или SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                      register: bool = True):
+    """Обрабатывает обновления, приходящие на host:port, до SIGINT/SIGTERM.
+
+    С register=False вебхук в Telegram не регистрируется — так работают
+    процессы-обработчики, получающие обновления от главного процесса (workers.py).
+    """
+    if register and not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL не установлен (нужен для BOT_MODE=webhook)")
+    # Без WEBHOOK_SECRET секрет новый при каждом запуске — вебхук все равно регистрируется заново
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    app = web.Application()
+    handler = BackgroundRequestHandler(dispatcher, bot, secret, WEBHOOK_CONCURRENCY)
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    try:
+        if register:
+            await set_webhook(bot, secret, dispatcher.resolve_used_update_types())
+        logger.info(f"Прием обновлений: {host}:{port}, одновременно обновлений: {WEBHOOK_CONCURRENCY}")
+        await wait_for_stop_signal()
+    finally:
+        # Вебхук не удаляем: пока бот остановлен, Telegram копит обновления и пришлет их после запуска
+        await runner.cleanup()
+        logger.info(f"Прием обновлений остановлен (обработано: {handler.handled}, ошибок: {handler.failed})")
+
+
+async def set_webhook(bot: Bot, secret: str, allowed_updates: list):
+    """Регистрирует WEBHOOK_URL + WEBHOOK_PATH в Telegram"""
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        allowed_updates=allowed_updates,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info(f"Вебхук: {url}")
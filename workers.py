@@ -0,0 +1,210 @@
+"""Несколько процессов-обработчиков обновлений (BOT_WORKERS > 1)
+
+Главный процесс принимает вебхук от Telegram и пересылает каждое обновление
+процессу-обработчику номер chat_id % BOT_WORKERS (на 127.0.0.1:WORKER_BASE_PORT + номер).
+Все обновления одного пользователя попадают в один и тот же процесс, поэтому
+его состояние FSM, кэш анкеты и очередь обработки (UserEventIsolation) живут
+в памяти этого процесса, как и при одном процессе.
+
+Общие данные процессы делят через SQLite в режиме WAL: записи всех процессов
+сериализуются блокировкой БД (BEGIN IMMEDIATE), анкеты защищены номером
+версии, задания outbox забираются атомарным UPDATE ... RETURNING. Выгрузку в
+Google Sheets выполняет только обработчик 0 — индекс строк листа хранится
+в памяти, и два выгружающих процесса могли бы добавить строку дважды.
+
+Главный процесс запускает обработчиков сам и перезапускает упавших; при
+остановке (SIGINT/SIGTERM) останавливает их, дождавшись обработки принятых
+обновлений.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiogram import Dispatcher
+from aiohttp import web
+
+from config import (
+    BOT_MODE, BOT_WORKERS, WORKER_BASE_PORT, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST,
+    WEBHOOK_PORT, WEBHOOK_SECRET
+)
+from bot_session import create_bot
+from database import init_database, close_database
+from handlers import register_handlers
+from webhook import set_webhook, wait_for_stop_signal
+
+logger = logging.getLogger(__name__)
+
+WORKER_HOST = "127.0.0.1"
+
+# Пауза перед перезапуском упавшего обработчика, сек
+RESTART_DELAY = 1
+# Сколько ждать остановки обработчика перед SIGKILL, сек
+STOP_TIMEOUT = 20
+# Таймаут пересылки обновления обработчику, сек
+FORWARD_TIMEOUT = 10
+# Сколько ждать запуска обработчиков перед регистрацией вебхука, сек
+START_TIMEOUT = 60
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """ID чата обновления (или пользователя, если чата нет)"""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+def worker_index(update: Dict[str, Any], workers: int) -> int:
+    """Номер процесса-обработчика для обновления"""
+    return update_chat_id(update) % workers
+
+
+class WorkerPool:
+    """Процессы-обработчики: запуск, перезапуск после падения, пересылка обновлений"""
+
+    def __init__(self, count: int, base_port: int, secret: str):
+        self.count = count
+        self.base_port = base_port
+        self.secret = secret
+        self._processes: List[Optional[asyncio.subprocess.Process]] = [None] * count
+        self._supervisors: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stopping = False
+        self.forwarded = 0
+        self.failed = 0
+        self.restarts = 0
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT))
+        self._supervisors = [asyncio.create_task(self._supervise(index), name=f"worker-{index}")
+                             for index in range(self.count)]
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Ждет, пока все обработчики начнут принимать соединения"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for index in range(self.count):
+            while True:
+                try:
+                    _, writer = await asyncio.open_connection(WORKER_HOST, self.base_port + index)
+                    writer.close()
+                    await writer.wait_closed()
+                    break
+                except OSError:
+                    if loop.time() > deadline:
+                        return False
+                    await asyncio.sleep(0.2)
+        return True
+
+    async def _spawn(self, index: int) -> asyncio.subprocess.Process:
+        env = dict(os.environ, BOT_WORKER_ID=str(index), WEBHOOK_SECRET=self.secret)
+        process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env)
+        logger.info(f"Обработчик {index} запущен (pid {process.pid}, порт {self.base_port + index})")
+        return process
+
+    async def _supervise(self, index: int):
+        while not self._stopping:
+            process = self._processes[index] = await self._spawn(index)
+            code = await process.wait()
+            if self._stopping:
+                break
+            self.restarts += 1
+            logger.error(f"Обработчик {index} завершился с кодом {code}, перезапуск через {RESTART_DELAY} с")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def forward(self, update: Dict[str, Any]) -> bool:
+        """Передает обновление обработчику. False — обработчик недоступен"""
+        index = worker_index(update, self.count)
+        url = f"http://{WORKER_HOST}:{self.base_port + index}{WEBHOOK_PATH}"
+        try:
+            async with self._session.post(url, json=update,
+                                          headers={"X-Telegram-Bot-Api-Secret-Token": self.secret}) as response:
+                if response.status == 200:
+                    self.forwarded += 1
+                    return True
+                logger.error(f"Обработчик {index} ответил {response.status} на обновление {update.get('update_id')}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Обработчик {index} недоступен: {e!r}")
+        self.failed += 1
+        return False
+
+    async def stop(self):
+        """Останавливает обработчиков (SIGINT — они дообрабатывают принятые обновления)"""
+        self._stopping = True
+        processes = [process for process in self._processes if process and process.returncode is None]
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for index, process in enumerate(processes):
+            try:
+                await asyncio.wait_for(process.wait(), timeout=STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"Обработчик (pid {process.pid}) не остановился за {STOP_TIMEOUT} с, SIGKILL")
+                process.kill()
+                await process.wait()
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+
+async def run_router():
+    """Главный процесс: принимает вебхук и распределяет обновления по обработчикам"""
+    if BOT_MODE != "webhook":
+        raise RuntimeError("BOT_WORKERS > 1 работает только с BOT_MODE=webhook")
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL не установлен (нужен для BOT_MODE=webhook)")
+    # Миграции применяем до запуска обработчиков
+    init_database()
+    close_database()
+
+    # Секрет общий для Telegram и обработчиков
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    pool = WorkerPool(BOT_WORKERS, WORKER_BASE_PORT, secret)
+    await pool.start()
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, secret):
+            return web.Response(body="Unauthorized", status=401)
+        # Если обработчик недоступен (например, перезапускается), Telegram повторит доставку позже
+        if await pool.forward(await request.json()):
+            return web.json_response({})
+        return web.Response(status=503)
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+    bot = create_bot()
+    try:
+        # Набор типов обновлений определяется зарегистрированными обработчиками
+        dp = Dispatcher()
+        register_handlers(dp)
+        if not await pool.wait_ready(START_TIMEOUT):
+            logger.warning(f"Не все обработчики запустились за {START_TIMEOUT} с")
+        await set_webhook(bot, secret, dp.resolve_used_update_types())
+        logger.info(f"Распределение обновлений: {WEBHOOK_HOST}:{WEBHOOK_PORT} -> "
+                    f"{BOT_WORKERS} обработчик(ов), порты {WORKER_BASE_PORT}-{WORKER_BASE_PORT + BOT_WORKERS - 1}")
+        await wait_for_stop_signal()
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+        await pool.stop()
+        logger.info(f"Обработчики остановлены (передано обновлений: {pool.forwarded}, "
+                    f"ошибок: {pool.failed}, перезапусков: {pool.restarts})")